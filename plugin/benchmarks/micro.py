@@ -0,0 +1,183 @@
+# Copyright 2021 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# Microbenchmarks of the encoding, decoding and partitioning code. They use
+# private hooks in pbt_C, an InMemoryTable and synthetic inputs, so no
+# Bigtable instance or emulator is needed.
+#
+# Every benchmark is run `--repeats` times and the fastest run is compared
+# with the baseline in `micro_baseline.json`. A benchmark is a regression if
+# it's slower than the baseline times its threshold. Benchmarks without a
+# baseline are reported and skipped. Run with `--update_baseline` on the
+# reference machine, with a built pbt_C, to record new baselines.
+
+import argparse
+import json
+import os
+import sys
+import time
+
+import torch
+import pytorch_bigtable as pbt
+from pytorch_bigtable import pbt_C
+
+BASELINE_PATH = os.path.join(os.path.dirname(__file__), "micro_baseline.json")
+
+DEFAULT_THRESHOLD = 1.5
+
+
+def compute_row_set_for_worker_inputs(num_keys, num_tablets):
+  row_set = pbt.row_set.from_rows_or_ranges(
+    *["row" + str(i).rjust(8, "0") for i in range(num_keys)])
+  samples = [("row" + str(i).rjust(8, "0"), i) for i in
+             range(0, num_keys, max(1, num_keys // num_tablets))]
+  return row_set, samples
+
+
+def read_in_memory_inputs(num_rows, num_columns):
+  table = pbt.InMemoryTable()
+  columns = ["cf1:c" + str(i) for i in range(num_columns)]
+  table.write_tensor(torch.rand(num_rows, num_columns), columns,
+                     ["row" + str(i).rjust(8, "0") for i in range(num_rows)])
+  return table.read_rows(torch.float32, columns,
+                         pbt.row_set.from_rows_or_ranges(
+                           pbt.row_range.infinite()))
+
+
+def time_iteration(dataset):
+  start = time.perf_counter_ns()
+  for _ in dataset:
+    pass
+  return time.perf_counter_ns() - start
+
+
+def benchmarks(scale):
+  """Returns a dict of benchmark name to a pair of a function returning
+  nanoseconds taken and the number of operations it performs."""
+  num_values = 100000 * scale
+  tensor_f32 = torch.rand(1000 * scale, 100)
+  tensor_i64 = torch.randint(0, 1 << 40, (1000 * scale, 100))
+  row_set, samples = compute_row_set_for_worker_inputs(1000 * scale, 100)
+  in_memory_dataset = read_in_memory_inputs(1000 * scale, 100)
+  return {
+    "bytes_to_float": (
+      lambda: pbt_C._benchmark_bytes_to_float(num_values), num_values),
+    "double_to_bytes": (
+      lambda: pbt_C._benchmark_double_to_bytes(num_values), num_values),
+    "get_tensor_value_as_bytes_float32": (
+      lambda: pbt_C._benchmark_get_tensor_value_as_bytes(tensor_f32),
+      tensor_f32.numel()),
+    "get_tensor_value_as_bytes_int64": (
+      lambda: pbt_C._benchmark_get_tensor_value_as_bytes(tensor_i64),
+      tensor_i64.numel()),
+    "put_cell_value_in_tensor_float32": (
+      lambda: pbt_C._benchmark_put_cell_value_in_tensor(tensor_f32),
+      tensor_f32.numel()),
+    "put_cell_value_in_tensor_int64": (
+      lambda: pbt_C._benchmark_put_cell_value_in_tensor(tensor_i64),
+      tensor_i64.numel()),
+    "get_filled_tensor": (
+      lambda: pbt_C._benchmark_get_filled_tensor(10000 * scale, 100,
+                                                 torch.float32, 0.),
+      10000 * scale),
+    "compute_row_set_for_worker": (
+      lambda: pbt_C._benchmark_compute_row_set_for_worker(row_set, samples,
+                                                          8), 8),
+    "read_in_memory": (
+      lambda: time_iteration(in_memory_dataset), 1000 * scale),
+  }
+
+
+def run(scale, repeats, selected=None):
+  """Returns a dict of benchmark name to the fastest time per operation in
+  nanoseconds."""
+  results = {}
+  for name, (benchmark, num_ops) in benchmarks(scale).items():
+    if selected and name not in selected:
+      continue
+    results[name] = min(benchmark() for _ in range(repeats)) / num_ops
+  return results
+
+
+def find_missing_baselines(results, baseline):
+  """Returns the names of the benchmarks which have no baseline."""
+  return [name for name in results
+          if "ns_per_op" not in baseline.get(name, {})]
+
+
+def find_regressions(results, baseline):
+  """Returns descriptions of the benchmarks slower than their baselines allow.
+  Benchmarks without a baseline are skipped."""
+  missing = set(find_missing_baselines(results, baseline))
+  regressions = []
+  for name, ns_per_op in results.items():
+    if name in missing:
+      continue
+    entry = baseline[name]
+    limit = entry["ns_per_op"] * entry.get("threshold", DEFAULT_THRESHOLD)
+    if ns_per_op > limit:
+      regressions.append(f"{name}: {ns_per_op:.1f} ns/op, baseline "
+                         f"{entry['ns_per_op']:.1f} ns/op, limit "
+                         f"{limit:.1f} ns/op")
+  return regressions
+
+
+def parse_arguments():
+  parser = argparse.ArgumentParser(
+    "micro.py", description="Microbenchmarks of pytorch_bigtable hot loops.")
+  parser.add_argument("--scale", type=int, default=1,
+                      help="multiplier of the size of the inputs")
+  parser.add_argument("--repeats", type=int, default=5,
+                      help="number of runs of every benchmark")
+  parser.add_argument("--benchmarks", nargs="+",
+                      help="names of benchmarks to run; all by default")
+  parser.add_argument("--baseline", default=BASELINE_PATH,
+                      help="JSON file with the baselines")
+  parser.add_argument("--update_baseline", "--record", action="store_true",
+                      help="store the results as the new baselines instead "
+                           "of comparing against them")
+  return parser.parse_args()
+
+
+def main():
+  args = parse_arguments()
+  results = run(args.scale, args.repeats, args.benchmarks)
+  for name, ns_per_op in results.items():
+    print(f"{name}: {ns_per_op:.1f} ns/op")
+
+  baseline = {}
+  if os.path.exists(args.baseline):
+    with open(args.baseline, "r", encoding="UTF-8") as f:
+      baseline = json.load(f)
+
+  if args.update_baseline:
+    for name, ns_per_op in results.items():
+      baseline.setdefault(name, {"threshold": DEFAULT_THRESHOLD})
+      baseline[name]["ns_per_op"] = ns_per_op
+    with open(args.baseline, "w", encoding="UTF-8") as f:
+      json.dump(baseline, f, indent=2, sort_keys=True)
+      f.write("\n")
+    return
+
+  for name in find_missing_baselines(results, baseline):
+    print(f"SKIPPED {name}: no baseline, record it with --update_baseline")
+  regressions = find_regressions(results, baseline)
+  for regression in regressions:
+    print("REGRESSION " + regression)
+  if regressions:
+    sys.exit(1)
+
+
+if __name__ == "__main__":
+  main()
@@ -0,0 +1,192 @@
+# Copyright 2021 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# End-to-end throughput benchmark of pytorch_bigtable against the local
+# Bigtable emulator.
+#
+# For every combination of column count and dtype, a table is seeded with
+# `write_tensor` (measuring write throughput) and then read through a
+# DataLoader with every combination of num_workers and batch_size (measuring
+# read throughput). The results are written as JSON, so that they can be
+# compared between releases with `--baseline`.
+
+import argparse
+import itertools
+import json
+import os
+import platform
+import sys
+import time
+
+import torch
+from torch.utils.data import DataLoader
+import pytorch_bigtable as pbt
+from pytorch_bigtable.tests.bigtable_emulator import BigtableEmulator
+
+PROJECT_ID = "benchmark-project"
+INSTANCE_ID = "benchmark-instance"
+FAMILY = "cf1"
+
+DTYPES = {"float32": torch.float32, "float64": torch.float64,
+          "int32": torch.int32, "int64": torch.int64, "bool": torch.bool}
+
+
+def row_key(i, num_rows):
+  return "row" + str(i).rjust(len(str(num_rows)), "0")
+
+
+def seed_table(emulator, client, table_id, num_rows, num_columns, dtype,
+               num_tablets):
+  splits = [row_key(i, num_rows) for i in
+            range(0, num_rows, max(1, num_rows // num_tablets))][1:]
+  emulator.create_table(PROJECT_ID, INSTANCE_ID, table_id, [FAMILY], splits)
+  table = client.get_table(table_id)
+
+  tensor = torch.arange(num_rows * num_columns).reshape(num_rows,
+                                                        num_columns).to(dtype)
+  columns = [f"{FAMILY}:col{j}" for j in range(num_columns)]
+  start = time.perf_counter()
+  table.write_tensor(tensor, columns,
+                     [row_key(i, num_rows) for i in range(num_rows)])
+  seconds = time.perf_counter() - start
+  return table, columns, {"benchmark": "write_tensor", "rows": num_rows,
+                          "columns": num_columns,
+                          "dtype": str(dtype).replace("torch.", ""),
+                          "seconds": seconds,
+                          "rows_per_second": num_rows / seconds}
+
+
+def read_table(table, columns, dtype, num_workers, batch_size):
+  ds = table.read_rows(dtype, columns, pbt.row_set.from_rows_or_ranges(
+    pbt.row_range.infinite()))
+  loader = DataLoader(ds, num_workers=num_workers, batch_size=batch_size)
+  rows = 0
+  start = time.perf_counter()
+  for batch in loader:
+    rows += batch.shape[0]
+  seconds = time.perf_counter() - start
+  metrics = ds.metrics()
+  return {"benchmark": "read_rows", "rows": rows, "columns": len(columns),
+          "dtype": str(dtype).replace("torch.", ""),
+          "num_workers": num_workers, "batch_size": batch_size,
+          "seconds": seconds, "rows_per_second": rows / seconds,
+          "mb_per_second": metrics["bytes"] / seconds / 1e6,
+          "stream_wait_seconds": metrics["stream_wait_ns"] / 1e9,
+          "decode_seconds": metrics["decode_ns"] / 1e9}
+
+
+def run(args):
+  emulator = BigtableEmulator()
+  os.environ["BIGTABLE_EMULATOR_HOST"] = emulator.get_addr()
+  client = pbt.BigtableClient(PROJECT_ID, INSTANCE_ID,
+                              endpoint=emulator.get_addr())
+  results = []
+  try:
+    for num_columns, dtype_name in itertools.product(args.columns,
+                                                     args.dtypes):
+      dtype = DTYPES[dtype_name]
+      table_id = f"bench-{num_columns}-{dtype_name}"
+      table, columns, write_result = seed_table(emulator, client, table_id,
+                                                args.rows, num_columns, dtype,
+                                                args.tablets)
+      print(json.dumps(write_result))
+      results.append(write_result)
+      for num_workers, batch_size in itertools.product(args.num_workers,
+                                                       args.batch_sizes):
+        for _ in range(args.repeats):
+          read_result = read_table(table, columns, dtype, num_workers,
+                                   batch_size)
+          print(json.dumps(read_result))
+          results.append(read_result)
+  finally:
+    emulator.stop()
+  return results
+
+
+def result_key(result):
+  return tuple(
+    (k, result.get(k)) for k in
+    ["benchmark", "rows", "columns", "dtype", "num_workers", "batch_size"])
+
+
+def compare(results, baseline_results, tolerance):
+  """Returns descriptions of results more than `tolerance` slower than the
+  best matching baseline result."""
+  baseline = {}
+  for result in baseline_results:
+    key = result_key(result)
+    baseline[key] = max(baseline.get(key, 0), result["rows_per_second"])
+  best = {}
+  for result in results:
+    key = result_key(result)
+    best[key] = max(best.get(key, 0), result["rows_per_second"])
+  regressions = []
+  for key, rows_per_second in best.items():
+    if key in baseline and rows_per_second < baseline[key] * (1 - tolerance):
+      regressions.append(f"{dict(key)}: {rows_per_second:.0f} rows/s vs "
+                         f"{baseline[key]:.0f} rows/s in the baseline")
+  return regressions
+
+
+def parse_arguments():
+  parser = argparse.ArgumentParser(
+    "throughput.py",
+    description="Benchmark of reading and writing tensors with the local "
+                "Bigtable emulator.")
+  parser.add_argument("--rows", type=int, default=10000,
+                      help="number of rows in every table")
+  parser.add_argument("--columns", type=int, nargs="+", default=[1, 10, 100],
+                      help="numbers of columns to benchmark")
+  parser.add_argument("--dtypes", nargs="+", default=["float32"],
+                      choices=sorted(DTYPES), help="dtypes to benchmark")
+  parser.add_argument("--num_workers", type=int, nargs="+",
+                      default=[0, 2, 4], help="DataLoader num_workers")
+  parser.add_argument("--batch_sizes", type=int, nargs="+",
+                      default=[1, 100, 1000], help="DataLoader batch sizes")
+  parser.add_argument("--tablets", type=int, default=8,
+                      help="number of tablets every table is split into")
+  parser.add_argument("--repeats", type=int, default=1,
+                      help="number of times every read is repeated")
+  parser.add_argument("-o", "--output", required=True,
+                      help="JSON file to write the results to")
+  parser.add_argument("--baseline",
+                      help="JSON file with results of a previous run to "
+                           "compare against")
+  parser.add_argument("--tolerance", type=float, default=0.2,
+                      help="relative slowdown against the baseline reported "
+                           "as a regression")
+  return parser.parse_args()
+
+
+def main():
+  args = parse_arguments()
+  results = run(args)
+  with open(args.output, "w", encoding="UTF-8") as f:
+    json.dump({"environment": {"python": platform.python_version(),
+                               "torch": torch.__version__,
+                               "platform": platform.platform(),
+                               "cpus": os.cpu_count()},
+               "arguments": vars(args), "results": results}, f, indent=2)
+
+  if args.baseline:
+    with open(args.baseline, "r", encoding="UTF-8") as f:
+      regressions = compare(results, json.load(f)["results"], args.tolerance)
+    for regression in regressions:
+      print("REGRESSION " + regression)
+    if regressions:
+      sys.exit(1)
+
+
+if __name__ == "__main__":
+  main()
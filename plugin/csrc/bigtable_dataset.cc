@@ -20,9 +20,31 @@ limitations under the License. */
 #include <pybind11/numpy.h>
 #include <pybind11/pybind11.h>
 #include <rpc/rpc.h> /* xdr is a sub-library of rpc */
+#include <sys/mman.h>
+#include <sys/stat.h>
+#include <sys/syscall.h>
 #include <torch/extension.h>
 #include <torch/torch.h>
+#include <array>
+#include <atomic>
+#include <cctype>
+#include <chrono>
+#include <condition_variable>
+#include <cstring>
+#include <deque>
+#include <exception>
+#include <fcntl.h>
+#include <fstream>
+#include <map>
+#include <mutex>
+#include <numeric>
 #include <optional>
+#include <set>
+#include <sstream>
+#include <string_view>
+#include <thread>
+#include <unistd.h>
+#include <unordered_map>
 
 namespace py = pybind11;
 namespace cbt = ::google::cloud::bigtable;
@@ -122,23 +144,25 @@ int64_t BytesToInt64(std::string const& s) {
   return v;
 }
 
-void PutCellValueInTensor(torch::Tensor* tensor, int index,
+void PutCellValueInTensor(torch::Tensor* tensor, int64_t index,
                           torch::Dtype cell_type, cbt::Cell const& cell) {
+  // `tensor` is always a freshly created contiguous tensor, so we write
+  // through its data pointer instead of paying for `index_put_` dispatch.
   switch (cell_type) {
     case torch::kFloat32:
-      tensor->index_put_({index}, BytesToFloat(cell.value()));
+      tensor->data_ptr<float>()[index] = BytesToFloat(cell.value());
       break;
     case torch::kFloat64:
-      tensor->index_put_({index}, BytesToDouble(cell.value()));
+      tensor->data_ptr<double>()[index] = BytesToDouble(cell.value());
       break;
     case torch::kI64:
-      tensor->index_put_({index}, BytesToInt64(cell.value()));
+      tensor->data_ptr<int64_t>()[index] = BytesToInt64(cell.value());
       break;
     case torch::kI32:
-      tensor->index_put_({index}, BytesToInt32(cell.value()));
+      tensor->data_ptr<int32_t>()[index] = BytesToInt32(cell.value());
       break;
     case torch::kBool:
-      tensor->index_put_({index}, BytesToBool(cell.value()));
+      tensor->data_ptr<bool>()[index] = BytesToBool(cell.value());
       break;
     default:
       throw std::runtime_error(
@@ -146,44 +170,203 @@ void PutCellValueInTensor(torch::Tensor* tensor, int index,
   }
 }
 
-std::string GetTensorValueAsBytes(torch::Tensor const& tensor, size_t i,
-                                  size_t j) {
-  switch (tensor.scalar_type()) {
-    case torch::kFloat32: {
-      auto tensor_ptr = tensor.accessor<float, 2>();
-      return FloatToBytes(tensor_ptr[i][j]);
+uint32_t ToBigEndian(uint32_t v) {
+#if __BYTE_ORDER__ == __ORDER_LITTLE_ENDIAN__
+  return __builtin_bswap32(v);
+#else
+  return v;
+#endif
+}
+
+uint64_t ToBigEndian(uint64_t v) {
+#if __BYTE_ORDER__ == __ORDER_LITTLE_ENDIAN__
+  return __builtin_bswap64(v);
+#else
+  return v;
+#endif
+}
+
+// Encodes all the values of a 2D tensor in one pass into a single buffer, the
+// same way as the `*ToBytes` functions: numbers are big-endian like in XDR
+// and booleans take a single byte. Values are read through the strides of the
+// tensor, so non-contiguous tensors are encoded without copying them first.
+class EncodedTensor {
+ public:
+  explicit EncodedTensor(torch::Tensor const& tensor) {
+    if (tensor.dim() != 2) {
+      throw std::invalid_argument("`tensor` must have exactly two dimensions");
     }
-    case torch::kFloat64: {
-      auto tensor_ptr = tensor.accessor<double, 2>();
-      return DoubleToBytes(tensor_ptr[i][j]);
+    auto const cpu_tensor = tensor.device().is_cpu() ? tensor : tensor.cpu();
+    num_columns_ = cpu_tensor.size(1);
+    switch (cpu_tensor.scalar_type()) {
+      case torch::kFloat32:
+        Encode<float, uint32_t>(cpu_tensor);
+        break;
+      case torch::kFloat64:
+        Encode<double, uint64_t>(cpu_tensor);
+        break;
+      case torch::kInt64:
+        Encode<int64_t, uint64_t>(cpu_tensor);
+        break;
+      case torch::kInt32:
+        Encode<int32_t, uint32_t>(cpu_tensor);
+        break;
+      case torch::kBool:
+        EncodeBool(cpu_tensor);
+        break;
+      default:
+        throw std::runtime_error(
+            "Cannot get tensor value. Type not implemented");
     }
-    case torch::kInt64: {
-      auto tensor_ptr = tensor.accessor<int64_t, 2>();
-      return Int64ToBytes(tensor_ptr[i][j]);
+  }
+
+  // The encoded value of `tensor[i][j]`, valid as long as this object.
+  std::string_view Value(int64_t i, int64_t j) const {
+    return std::string_view(buffer_).substr((i * num_columns_ + j) * width_,
+                                            width_);
+  }
+
+ private:
+  template <typename T, typename Bits>
+  void Encode(torch::Tensor const& tensor) {
+    static_assert(sizeof(T) == sizeof(Bits));
+    width_ = sizeof(T);
+    buffer_.resize(tensor.numel() * width_);
+    T const* data = tensor.data_ptr<T>();
+    auto const row_stride = tensor.stride(0);
+    auto const column_stride = tensor.stride(1);
+    char* out = buffer_.data();
+    for (int64_t i = 0; i < tensor.size(0); i++) {
+      T const* row = data + i * row_stride;
+      for (int64_t j = 0; j < num_columns_; j++) {
+        Bits bits;
+        std::memcpy(&bits, row + j * column_stride, sizeof(bits));
+        bits = ToBigEndian(bits);
+        std::memcpy(out, &bits, sizeof(bits));
+        out += sizeof(bits);
+      }
     }
-    case torch::kInt32: {
-      auto tensor_ptr = tensor.accessor<int32_t, 2>();
-      return Int32ToBytes(tensor_ptr[i][j]);
+  }
+
+  void EncodeBool(torch::Tensor const& tensor) {
+    width_ = 1;
+    buffer_.resize(tensor.numel());
+    bool const* data = tensor.data_ptr<bool>();
+    auto const row_stride = tensor.stride(0);
+    auto const column_stride = tensor.stride(1);
+    char* out = buffer_.data();
+    for (int64_t i = 0; i < tensor.size(0); i++) {
+      for (int64_t j = 0; j < num_columns_; j++) {
+        *out++ = data[i * row_stride + j * column_stride] ? '\xff' : '\x00';
+      }
     }
-    case torch::kBool: {
-      auto tensor_ptr = tensor.accessor<bool, 2>();
-      return BoolToBytes(tensor_ptr[i][j]);
+  }
+
+  std::string buffer_;
+  int64_t num_columns_ = 0;
+  size_t width_ = 0;
+};
+
+// Largest size of a single qualifier regex of a columns filter. The
+// qualifiers of a family whose regex would be bigger are split among several
+// regexes, so that each stays cheap for the server to compile.
+constexpr size_t kMaxColumnRegexBytes = 4 * 1024;
+// Largest total size of the qualifier regexes of a columns filter. Bigtable
+// rejects filters bigger than 20 KiB, so the qualifiers of the families which
+// don't fit are selected with a column range covering all of them instead,
+// which may pass other columns too.
+constexpr size_t kMaxColumnsFilterRegexBytes = 16 * 1024;
+
+// Escapes all the RE2 metacharacters in `s`, like `RE2::QuoteMeta`.
+std::string QuoteRegex(std::string const& s) {
+  std::string res;
+  res.reserve(s.size() * 2);
+  for (char c : s) {
+    if (c == '\0') {
+      res += "\\x00";
+      continue;
     }
-    default:
-      throw std::runtime_error("Cannot get tensor value. Type not implemented");
+    auto const byte = static_cast<unsigned char>(c);
+    if (!std::isalnum(byte) && c != '_' && byte < 0x80) res += '\\';
+    res += c;
   }
+  return res;
 }
 
+// Creates a filter passing exactly the given columns, unless matching them
+// exactly would make the filter too big for Bigtable. A filter with a
+// separate condition for every column grows big and slow for the server to
+// evaluate, so the qualifiers of every family are matched with as few regexes
+// as possible. If `exact` is not null, it's set to whether the filter passes
+// only the given columns; otherwise the readers must drop the other cells, see
+// HasRequestedCell.
 cbt::Filter CreateColumnsFilter(
-    std::map<std::pair<std::string, std::string>, size_t> const& columns) {
-  std::vector<cbt::Filter> filters;
+    std::map<std::pair<std::string, std::string>, size_t> const& columns,
+    bool* exact = nullptr) {
+  // The map is sorted, so families and their qualifiers come in order.
+  std::vector<std::pair<std::string, std::vector<std::string>>> families;
+  for (auto const& column : columns) {
+    auto const& [family, qualifier] = column.first;
+    if (families.empty() || families.back().first != family) {
+      families.emplace_back(family, std::vector<std::string>());
+    }
+    families.back().second.push_back(qualifier);
+  }
 
-  for (const auto& key : columns) {
-    std::pair<std::string, std::string> pair = key.first;
-    cbt::Filter f = cbt::Filter::ColumnName(pair.first, pair.second);
-    filters.push_back(std::move(f));
+  // The qualifier regexes of every family, and their total size.
+  std::vector<std::vector<std::string>> regexes(families.size());
+  std::vector<size_t> family_bytes(families.size(), 0);
+  size_t regex_bytes = 0;
+  for (size_t i = 0; i < families.size(); i++) {
+    auto const& qualifiers = families[i].second;
+    if (qualifiers.size() < 2) continue;
+    std::string regex;
+    for (auto const& qualifier : qualifiers) {
+      auto quoted = QuoteRegex(qualifier);
+      if (!regex.empty() &&
+          regex.size() + quoted.size() + 3 > kMaxColumnRegexBytes) {
+        regexes[i].push_back(regex + ")$");
+        regex.clear();
+      }
+      regex += regex.empty() ? "^(?:" : "|";
+      regex += quoted;
+    }
+    regexes[i].push_back(regex + ")$");
+    for (auto const& r : regexes[i]) family_bytes[i] += r.size();
+    regex_bytes += family_bytes[i];
+  }
+  // Replace the largest families with column ranges until the rest fit.
+  std::vector<size_t> by_size(families.size());
+  std::iota(by_size.begin(), by_size.end(), 0);
+  std::sort(by_size.begin(), by_size.end(),
+            [&family_bytes](size_t a, size_t b) {
+              return family_bytes[a] > family_bytes[b];
+            });
+  if (exact) *exact = true;
+  for (size_t i : by_size) {
+    if (regex_bytes <= kMaxColumnsFilterRegexBytes) break;
+    regex_bytes -= family_bytes[i];
+    regexes[i].clear();
+    if (exact) *exact = false;
   }
 
+  std::vector<cbt::Filter> filters;
+  for (size_t i = 0; i < families.size(); i++) {
+    auto const& [family, qualifiers] = families[i];
+    if (qualifiers.size() == 1) {
+      filters.push_back(cbt::Filter::ColumnName(family, qualifiers.front()));
+    } else if (!regexes[i].empty()) {
+      for (auto& regex : regexes[i]) {
+        filters.push_back(cbt::Filter::Chain(
+            cbt::Filter::FamilyRegex("^" + QuoteRegex(family) + "$"),
+            cbt::Filter::ColumnRegex(std::move(regex))));
+      }
+    } else {
+      filters.push_back(cbt::Filter::ColumnRangeClosed(
+          family, qualifiers.front(), qualifiers.back()));
+    }
+  }
+  if (filters.size() == 1) return std::move(filters.front());
   return cbt::Filter::InterleaveFromRange(filters.begin(), filters.end());
 }
 
@@ -201,6 +384,66 @@ std::pair<std::string, std::string> ColumnNameToPair(
   return pair;
 }
 
+// Mapping between column names and their indices in tensors.  We're using a
+// regular map because unordered_map cannot hash a pair by default.
+using ColumnMap = std::map<std::pair<std::string, std::string>, size_t>;
+
+ColumnMap CreateColumnMap(py::list const& columns) {
+  ColumnMap column_map;
+  size_t index = 0;
+  for (const auto& column_name : columns) {
+    std::pair<std::string, std::string> pair =
+        ColumnNameToPair(column_name.cast<std::string>());
+    column_map[pair] = index++;
+  }
+  return column_map;
+}
+
+// Returns whether the row has any of the requested columns. Filters which are
+// not exact, see CreateColumnsFilter, may pass rows with only other columns,
+// which must be skipped as if Bigtable didn't return them. Without any
+// columns, every row counts.
+bool HasRequestedCell(cbt::Row const& row, ColumnMap const& column_map) {
+  if (column_map.empty()) return true;
+  for (auto const& cell : row.cells()) {
+    if (column_map.count(
+            std::make_pair(cell.family_name(), cell.column_qualifier())) > 0) {
+      return true;
+    }
+  }
+  return false;
+}
+
+// Filter passing the latest of the `versions` of the requested columns.
+cbt::Filter CreateReadFilter(ColumnMap const& column_map,
+                             cbt::Filter const& versions) {
+  return cbt::Filter::Chain(CreateColumnsFilter(column_map), versions,
+                            cbt::Filter::Latest(1));
+}
+
+// Creates a filter passing a single cell of every row read with
+// CreateReadFilter, without its value, so that only the keys of the rows are
+// sent. Without any columns, every row of the table passes. If the columns
+// can't be matched exactly, all the cells are passed, so that the rows can be
+// checked with HasRequestedCell.
+cbt::Filter CreateKeysOnlyFilter(ColumnMap const& column_map,
+                                 cbt::Filter const& versions) {
+  if (column_map.empty()) {
+    return cbt::Filter::Chain(cbt::Filter::CellsRowLimit(1),
+                              cbt::Filter::StripValueTransformer());
+  }
+  bool exact;
+  auto columns_filter = CreateColumnsFilter(column_map, &exact);
+  if (!exact) {
+    return cbt::Filter::Chain(std::move(columns_filter), versions,
+                              cbt::Filter::Latest(1),
+                              cbt::Filter::StripValueTransformer());
+  }
+  return cbt::Filter::Chain(
+      std::move(columns_filter), versions, cbt::Filter::Latest(1),
+      cbt::Filter::CellsRowLimit(1), cbt::Filter::StripValueTransformer());
+}
+
 std::shared_ptr<cbt::DataClient> CreateDataClient(py::object const& client) {
   auto project_id = client.attr("_project_id").cast<std::string>();
   auto instance_id = client.attr("_instance_id").cast<std::string>();
@@ -210,6 +453,16 @@ std::shared_ptr<cbt::DataClient> CreateDataClient(py::object const& client) {
                                       cbt::ClientOptions(std::move(options)));
 }
 
+// Returns the smallest key greater than all the keys starting with `prefix`,
+// or an empty string if there's none.
+std::string PrefixEnd(std::string prefix) {
+  while (!prefix.empty() && static_cast<unsigned char>(prefix.back()) == 0xFF) {
+    prefix.pop_back();
+  }
+  if (!prefix.empty()) prefix.back() = static_cast<char>(prefix.back() + 1);
+  return prefix;
+}
+
 std::unique_ptr<cbt::Table> CreateTable(
     std::shared_ptr<cbt::DataClient> const& data_client,
     std::string const& table_id,
@@ -237,39 +490,993 @@ py::list SampleRowKeys(py::object const& client, std::string const& table_id,
   return res;
 }
 
-std::string rowKeyForTensor(
-    torch::Tensor const& tensor, int i,
-    std::optional<py::list> const& row_key_list,
-    std::optional<std::function<std::string(torch::Tensor const&, int)>> const&
-        row_key_generator) {
-  if (row_key_list) return (*row_key_list)[i].cast<std::string>();
-  return (*row_key_generator)(tensor.slice(0, i, i + 1), i);
+// Opt-in recorder of spans, exported in the Chrome trace event format. There
+// is one per process; every DataLoader worker writes its own file, which are
+// later merged by the main process.
+class Tracer {
+ public:
+  static Tracer& Instance() {
+    static Tracer* const kInstance = new Tracer;
+    return *kInstance;
+  }
+
+  bool enabled() const { return enabled_.load(std::memory_order_relaxed); }
+
+  // Spans are exported to "pytorch_bigtable-<run_id>-<pid>.json" files in
+  // `trace_dir`, so that the files of different runs can be told apart.
+  void Enable(std::optional<std::string> trace_dir, int worker_id,
+              std::string run_id) {
+    std::lock_guard<std::mutex> lock(mu_);
+    // A forked worker inherits the spans of its parent, which are not its
+    // own to export.
+    if (pid_ != getpid()) {
+      pid_ = getpid();
+      events_.clear();
+      dropped_ = 0;
+    }
+    trace_dir_ = std::move(trace_dir);
+    worker_id_ = worker_id;
+    run_id_ = std::move(run_id);
+    enabled_.store(true, std::memory_order_relaxed);
+  }
+
+  void Disable() { enabled_.store(false, std::memory_order_relaxed); }
+
+  void Record(char const* name, std::chrono::steady_clock::time_point start,
+              std::chrono::steady_clock::time_point end,
+              std::vector<std::pair<char const*, int64_t>> args = {}) {
+    if (!enabled()) return;
+    auto const tid = static_cast<int64_t>(syscall(SYS_gettid));
+    std::lock_guard<std::mutex> lock(mu_);
+    if (events_.size() >= kMaxEvents) {
+      dropped_++;
+      return;
+    }
+    events_.push_back(TraceEvent{name, ToMicros(start),
+                                 ToMicros(end) - ToMicros(start), tid,
+                                 std::move(args)});
+  }
+
+  // Writes all the spans recorded so far in this process to `path`.
+  void Export(std::string const& path) {
+    std::ostringstream out;
+    {
+      std::lock_guard<std::mutex> lock(mu_);
+      auto const pid = static_cast<int64_t>(getpid());
+      out << R"({"traceEvents":[{"name":"process_name","ph":"M","pid":)" << pid
+          << R"(,"tid":0,"args":{"name":")"
+          << (worker_id_ < 0 ? std::string("main")
+                             : "worker " + std::to_string(worker_id_))
+          << R"("}})";
+      for (auto const& event : events_) {
+        out << R"(,{"name":")" << event.name
+            << R"(","cat":"pytorch_bigtable","ph":"X","ts":)" << event.start_us
+            << R"(,"dur":)" << event.duration_us << R"(,"pid":)" << pid
+            << R"(,"tid":)" << event.tid << R"(,"args":{"worker_id":)"
+            << worker_id_;
+        for (auto const& [key, value] : event.args) {
+          out << R"(,")" << key << R"(":)" << value;
+        }
+        out << "}}";
+      }
+      out << R"(],"otherData":{"dropped_events":)" << dropped_ << "}}";
+    }
+    std::ofstream file(path, std::ios::trunc);
+    file << out.str();
+    if (!file) throw std::runtime_error("Error writing trace to " + path);
+  }
+
+  // Exports the spans to this worker's file in the trace directory, if any.
+  void ExportToTraceDir() {
+    std::optional<std::string> trace_dir;
+    std::string run_id;
+    {
+      std::lock_guard<std::mutex> lock(mu_);
+      trace_dir = trace_dir_;
+      run_id = run_id_;
+    }
+    if (!enabled() || !trace_dir) return;
+    Export(*trace_dir + "/pytorch_bigtable-" + run_id + "-" +
+           std::to_string(getpid()) + ".json");
+  }
+
+  void Clear() {
+    std::lock_guard<std::mutex> lock(mu_);
+    events_.clear();
+    dropped_ = 0;
+  }
+
+ private:
+  struct TraceEvent {
+    char const* name;
+    int64_t start_us;
+    int64_t duration_us;
+    int64_t tid;
+    std::vector<std::pair<char const*, int64_t>> args;
+  };
+
+  // Bounds the memory used by a forgotten tracer to a few hundred MB.
+  static constexpr size_t kMaxEvents = 1 << 22;
+
+  // Spans are measured with the steady clock, but exported as time since
+  // epoch to line up with traces of other processes and of the PyTorch
+  // profiler.
+  int64_t ToMicros(std::chrono::steady_clock::time_point t) const {
+    return std::chrono::duration_cast<std::chrono::microseconds>(
+               t.time_since_epoch() + epoch_offset_)
+        .count();
+  }
+
+  Tracer()
+      : epoch_offset_(std::chrono::duration_cast<std::chrono::nanoseconds>(
+            std::chrono::system_clock::now().time_since_epoch() -
+            std::chrono::steady_clock::now().time_since_epoch())) {}
+
+  std::chrono::nanoseconds const epoch_offset_;
+  std::atomic<bool> enabled_{false};
+  std::mutex mu_;
+  std::optional<std::string> trace_dir_;
+  std::string run_id_;
+  pid_t pid_ = -1;
+  int worker_id_ = -1;
+  std::vector<TraceEvent> events_;
+  int64_t dropped_ = 0;
+};
+
+// Records a span from its construction to its destruction.
+class TraceSpan {
+ public:
+  explicit TraceSpan(char const* name)
+      : name_(name),
+        active_(Tracer::Instance().enabled()),
+        start_(active_ ? std::chrono::steady_clock::now()
+                       : std::chrono::steady_clock::time_point()) {}
+
+  TraceSpan(TraceSpan const&) = delete;
+  TraceSpan& operator=(TraceSpan const&) = delete;
+
+  ~TraceSpan() {
+    if (active_) {
+      Tracer::Instance().Record(name_, start_,
+                                std::chrono::steady_clock::now());
+    }
+  }
+
+ private:
+  char const* name_;
+  bool active_;
+  std::chrono::steady_clock::time_point start_;
+};
+
+// Token buckets limiting the rate of requests, rows and bytes of a client.
+// Every bucket holds at most one second worth of tokens and starts full.
+// Acquire() waits until all the buckets have enough tokens. A cost larger
+// than a bucket only waits for the bucket to be full and leaves it in debt,
+// so that the average rate never exceeds the limit.
+class RateLimiter {
+ public:
+  RateLimiter(std::optional<double> requests_per_second,
+              std::optional<double> rows_per_second,
+              std::optional<double> bytes_per_second)
+      : buckets_{Bucket(requests_per_second), Bucket(rows_per_second),
+                 Bucket(bytes_per_second)},
+        last_refill_(std::chrono::steady_clock::now()) {}
+
+  RateLimiter(RateLimiter const&) = delete;
+  RateLimiter& operator=(RateLimiter const&) = delete;
+
+  void Acquire(int64_t requests, int64_t rows, int64_t bytes) {
+    std::array<double, 3> const costs = {static_cast<double>(requests),
+                                         static_cast<double>(rows),
+                                         static_cast<double>(bytes)};
+    auto const start = std::chrono::steady_clock::now();
+    std::unique_lock<std::mutex> lock(mu_);
+    while (true) {
+      auto const now = std::chrono::steady_clock::now();
+      double const elapsed =
+          std::chrono::duration<double>(now - last_refill_).count();
+      last_refill_ = now;
+      double wait = 0;
+      for (size_t i = 0; i < buckets_.size(); i++) {
+        auto& bucket = buckets_[i];
+        if (!bucket.rate) continue;
+        bucket.tokens =
+            std::min(*bucket.rate, bucket.tokens + elapsed * *bucket.rate);
+        double const needed = std::min(costs[i], *bucket.rate);
+        if (bucket.tokens < needed) {
+          wait = std::max(wait, (needed - bucket.tokens) / *bucket.rate);
+        }
+      }
+      if (wait == 0) break;
+      cv_.wait_for(lock, std::chrono::duration<double>(wait));
+    }
+    for (size_t i = 0; i < buckets_.size(); i++) {
+      if (buckets_[i].rate) buckets_[i].tokens -= costs[i];
+    }
+    if (std::chrono::steady_clock::now() > start + kMinRecordedWait) {
+      Tracer::Instance().Record("rate_limit_wait", start,
+                                std::chrono::steady_clock::now());
+    }
+  }
+
+ private:
+  static constexpr std::chrono::microseconds kMinRecordedWait{100};
+
+  struct Bucket {
+    explicit Bucket(std::optional<double> rate)
+        : rate(rate), tokens(rate.value_or(0)) {}
+    std::optional<double> rate;
+    double tokens;
+  };
+
+  std::mutex mu_;
+  // Only used for sleeping with `mu_` released.
+  std::condition_variable cv_;
+  std::array<Bucket, 3> buckets_;
+  std::chrono::steady_clock::time_point last_refill_;
+};
+
+// Returns the rate limiter of a BigtableClient, or nullptr if the client has
+// no limits. The limits are divided by `num_workers`, and all the readers and
+// writers of the client in this process with the same `num_workers` share a
+// limiter, so that the DataLoader workers together stay within the limits.
+std::shared_ptr<RateLimiter> GetRateLimiter(py::object const& client,
+                                            int num_workers = 1) {
+  auto const limit = [&](char const* name) -> std::optional<double> {
+    auto value = py::getattr(client, name, py::none());
+    if (value.is_none()) return std::nullopt;
+    return value.cast<double>() / std::max(num_workers, 1);
+  };
+  auto const requests_per_second = limit("_max_requests_per_second");
+  auto const rows_per_second = limit("_max_rows_per_second");
+  auto const bytes_per_second = limit("_max_bytes_per_second");
+  if (!requests_per_second && !rows_per_second && !bytes_per_second) {
+    return nullptr;
+  }
+
+  static std::mutex mu;
+  static std::map<std::pair<std::string, int>, std::shared_ptr<RateLimiter>>
+      limiters;
+  auto const key = std::make_pair(
+      client.attr("_rate_limiter_id").cast<std::string>(), num_workers);
+  std::lock_guard<std::mutex> lock(mu);
+  auto& limiter = limiters[key];
+  if (!limiter) {
+    limiter = std::make_shared<RateLimiter>(requests_per_second,
+                                            rows_per_second, bytes_per_second);
+  }
+  return limiter;
+}
+
+// Wildcard columns, as (family, qualifier prefix) pairs.
+using Wildcards = std::vector<std::pair<std::string, std::string>>;
+
+// Returns a filter for every wildcard, passing the columns of its family whose
+// qualifiers start with its prefix, or a few more if the prefix has no end.
+std::vector<cbt::Filter> CreateWildcardFilters(Wildcards const& wildcards) {
+  std::vector<cbt::Filter> filters;
+  for (auto const& [family, prefix] : wildcards) {
+    auto prefix_end = PrefixEnd(prefix);
+    if (prefix_end.empty()) {
+      filters.push_back(
+          cbt::Filter::FamilyRegex("^" + QuoteRegex(family) + "$"));
+    } else {
+      filters.push_back(cbt::Filter::ColumnRange(family, prefix, prefix_end));
+    }
+  }
+  return filters;
+}
+
+// Returns whether the column matches any of the wildcards.
+bool MatchesWildcard(std::string const& family, std::string const& qualifier,
+                     Wildcards const& wildcards) {
+  return std::any_of(wildcards.begin(), wildcards.end(),
+                     [&family, &qualifier](auto const& wildcard) {
+                       return wildcard.first == family &&
+                              qualifier.compare(0, wildcard.second.size(),
+                                                wildcard.second) == 0;
+                     });
 }
 
-void WriteTensor(
+// Returns the columns present in the first `rows_limit` rows of the row set
+// whose family is equal to and qualifier starts with one of the `patterns`,
+// given as (family, qualifier prefix) pairs. Values are not transferred.
+std::vector<std::pair<std::string, std::string>> DiscoverColumns(
     py::object const& client, std::string const& table_id,
     std::optional<std::string> const& app_profile_id,
-    torch::Tensor const& tensor, py::list const& columns,
-    std::optional<py::list> const& row_key_list,
-    std::optional<std::function<std::string(torch::Tensor const&, int)>> const&
-        row_key_generator) {
+    cbt::RowSet const& row_set, Wildcards const& patterns, int64_t rows_limit) {
+  auto filters = CreateWildcardFilters(patterns);
+  auto filter = cbt::Filter::Chain(
+      cbt::Filter::InterleaveFromRange(filters.begin(), filters.end()),
+      cbt::Filter::Latest(1), cbt::Filter::StripValueTransformer());
+
+  // Reading the client's attributes needs the GIL, so the table is created
+  // before releasing it for the scan.
+  auto table = CreateTable(CreateDataClient(client), table_id, app_profile_id);
+  std::set<std::pair<std::string, std::string>> columns;
+  {
+    py::gil_scoped_release release;
+    TraceSpan span("discover_columns");
+    for (auto& row : table->ReadRows(row_set, rows_limit, std::move(filter))) {
+      if (!row.ok()) throw std::runtime_error(row.status().message());
+      for (auto const& cell : row->cells()) {
+        columns.emplace(cell.family_name(), cell.column_qualifier());
+      }
+    }
+  }
+  return {columns.begin(), columns.end()};
+}
+
+// Appends `code_point` to `out` encoded as UTF-8.
+void AppendUtf8(char32_t code_point, std::string& out) {
+  if (code_point < 0x80) {
+    out.push_back(static_cast<char>(code_point));
+  } else if (code_point < 0x800) {
+    out.push_back(static_cast<char>(0xC0 | (code_point >> 6)));
+    out.push_back(static_cast<char>(0x80 | (code_point & 0x3F)));
+  } else if (code_point < 0x10000) {
+    out.push_back(static_cast<char>(0xE0 | (code_point >> 12)));
+    out.push_back(static_cast<char>(0x80 | ((code_point >> 6) & 0x3F)));
+    out.push_back(static_cast<char>(0x80 | (code_point & 0x3F)));
+  } else {
+    out.push_back(static_cast<char>(0xF0 | (code_point >> 18)));
+    out.push_back(static_cast<char>(0x80 | ((code_point >> 12) & 0x3F)));
+    out.push_back(static_cast<char>(0x80 | ((code_point >> 6) & 0x3F)));
+    out.push_back(static_cast<char>(0x80 | (code_point & 0x3F)));
+  }
+}
+
+// Reads row keys from a list of str or bytes, or from a buffer of fixed size
+// strings, like a numpy array of dtype "S" or "U". Trailing NUL characters of
+// the fixed size strings are padding and are not a part of the key. Unicode
+// keys are encoded as UTF-8, like str keys.
+std::vector<std::string> KeysFromPython(py::object const& keys) {
+  std::vector<std::string> res;
+  if (py::isinstance<py::buffer>(keys) && !py::isinstance<py::bytes>(keys)) {
+    py::buffer_info info = keys.cast<py::buffer>().request();
+    char const kind = info.format.empty() ? '\0' : info.format.back();
+    if (info.ndim != 1 || (kind != 's' && kind != 'w')) {
+      throw py::type_error(
+          "a buffer of row keys must be a 1-d array of strings");
+    }
+    res.reserve(info.shape[0]);
+    auto const* data = static_cast<char const*>(info.ptr);
+    for (py::ssize_t i = 0; i < info.shape[0]; i++) {
+      char const* key = data + i * info.strides[0];
+      if (kind == 's') {
+        size_t size = info.itemsize;
+        while (size > 0 && key[size - 1] == '\0') size--;
+        res.emplace_back(key, size);
+        continue;
+      }
+      std::string utf8;
+      for (py::ssize_t j = 0; j < info.itemsize / 4; j++) {
+        char32_t code_point;
+        std::memcpy(&code_point, key + 4 * j, sizeof(code_point));
+        if (code_point == 0) break;
+        AppendUtf8(code_point, utf8);
+      }
+      res.push_back(std::move(utf8));
+    }
+    return res;
+  }
+  auto list = keys.cast<py::sequence>();
+  res.reserve(list.size());
+  for (auto const& key : list) {
+    if (!py::isinstance<py::str>(key) && !py::isinstance<py::bytes>(key)) {
+      throw py::type_error("row keys must be str or bytes");
+    }
+    res.push_back(key.cast<std::string>());
+  }
+  return res;
+}
+
+// Generates row keys in C++, without calling into Python for every row. Keys
+// are made from a format with "{index}" and "{salt}" placeholders. The index
+// is either the position of the row plus `start`, or the value of a column
+// of the tensor. The salt is a hash of the index modulo `salt_buckets`,
+// which spreads consecutive indices over the key space. "{index:0N}" pads
+// the index with zeros to N digits; the salt is always padded to the width
+// of the largest bucket number.
+class RowKeyGenerator {
+ public:
+  RowKeyGenerator(std::string const& format, int64_t start,
+                  std::optional<int64_t> column,
+                  std::optional<int64_t> salt_buckets)
+      : start_(start), column_(column), salt_buckets_(salt_buckets) {
+    if (salt_buckets_ && *salt_buckets_ < 1) {
+      throw std::invalid_argument("`salt_buckets` must be positive");
+    }
+    Parse(format);
+  }
+
+  // Returns the keys of the rows of `tensor`, which are preceded by
+  // `offset` rows generated by this generator before.
+  std::vector<std::string> Generate(torch::Tensor const& tensor,
+                                    int64_t offset) const {
+    auto const num_rows = tensor.size(0);
+    torch::Tensor column_values;
+    if (column_) {
+      if (*column_ < 0 || *column_ >= tensor.size(1)) {
+        throw std::invalid_argument("`column` out of range of the tensor");
+      }
+      column_values = tensor.select(1, *column_).to(torch::kInt64).contiguous();
+    }
+    std::vector<std::string> res;
+    res.reserve(num_rows);
+    std::string key;
+    for (int64_t i = 0; i < num_rows; i++) {
+      int64_t const index =
+          column_ ? column_values.data_ptr<int64_t>()[i] : start_ + offset + i;
+      key.clear();
+      for (auto const& part : parts_) {
+        switch (part.kind) {
+          case Part::kLiteral:
+            key += part.literal;
+            break;
+          case Part::kIndex:
+            AppendPadded(index, part.width, key);
+            break;
+          case Part::kSalt:
+            AppendPadded(
+                static_cast<int64_t>(Mix(static_cast<uint64_t>(index)) %
+                                     *salt_buckets_),
+                part.width, key);
+            break;
+        }
+      }
+      res.push_back(key);
+    }
+    return res;
+  }
+
+ private:
+  struct Part {
+    enum Kind { kLiteral, kIndex, kSalt } kind;
+    std::string literal;
+    int width;
+  };
+
+  void Parse(std::string const& format) {
+    std::string literal;
+    for (size_t i = 0; i < format.size(); i++) {
+      if (format[i] == '}' && i + 1 < format.size() && format[i + 1] == '}') {
+        literal += '}';
+        i++;
+        continue;
+      }
+      if (format[i] != '{') {
+        literal += format[i];
+        continue;
+      }
+      if (i + 1 < format.size() && format[i + 1] == '{') {
+        literal += '{';
+        i++;
+        continue;
+      }
+      auto const end = format.find('}', i);
+      if (end == std::string::npos) {
+        throw std::invalid_argument("Unterminated placeholder in " + format);
+      }
+      auto const placeholder = format.substr(i + 1, end - i - 1);
+      auto const colon = placeholder.find(':');
+      auto const name = placeholder.substr(0, colon);
+      int width = 0;
+      if (colon != std::string::npos) {
+        auto const spec = placeholder.substr(colon + 1);
+        if (spec.size() < 2 || spec[0] != '0' ||
+            spec.find_first_not_of("0123456789") != std::string::npos) {
+          throw std::invalid_argument("Unsupported format spec in " + format);
+        }
+        width = std::stoi(spec);
+      }
+      if (!literal.empty()) {
+        parts_.push_back(Part{Part::kLiteral, std::move(literal), 0});
+        literal.clear();
+      }
+      if (name == "index") {
+        parts_.push_back(Part{Part::kIndex, "", width});
+      } else if (name == "salt" && salt_buckets_) {
+        parts_.push_back(
+            Part{Part::kSalt, "",
+                 static_cast<int>(std::to_string(*salt_buckets_ - 1).size())});
+      } else {
+        throw std::invalid_argument("Unknown placeholder {" + placeholder +
+                                    "} in " + format);
+      }
+      i = end;
+    }
+    if (!literal.empty()) {
+      parts_.push_back(Part{Part::kLiteral, std::move(literal), 0});
+    }
+  }
+
+  static void AppendPadded(int64_t value, int width, std::string& out) {
+    if (value < 0) {
+      out += '-';
+      value = -value;
+    }
+    auto const digits = std::to_string(value);
+    if (static_cast<int>(digits.size()) < width) {
+      out.append(width - digits.size(), '0');
+    }
+    out += digits;
+  }
+
+  // SplitMix64 finalizer. A fixed function, unlike std::hash, so that the
+  // keys are the same on every machine.
+  static uint64_t Mix(uint64_t x) {
+    x += 0x9E3779B97F4A7C15ULL;
+    x = (x ^ (x >> 30U)) * 0xBF58476D1CE4E5B9ULL;
+    x = (x ^ (x >> 27U)) * 0x94D049BB133111EBULL;
+    return x ^ (x >> 31U);
+  }
+
+  int64_t start_;
+  std::optional<int64_t> column_;
+  std::optional<int64_t> salt_buckets_;
+  std::vector<Part> parts_;
+};
+
+// Returns the row keys for the rows of `tensor`. `row_keys` is a
+// RowKeyGenerator, a callable called with every row and its index, or
+// anything `KeysFromPython` accepts. `offset` is the number of rows written
+// with the same `row_keys` before.
+std::vector<std::string> RowKeysForTensor(torch::Tensor const& tensor,
+                                          py::object const& row_keys,
+                                          int64_t offset = 0) {
+  if (py::isinstance<RowKeyGenerator>(row_keys)) {
+    auto const& generator = row_keys.cast<RowKeyGenerator const&>();
+    py::gil_scoped_release release;
+    return generator.Generate(tensor, offset);
+  }
+  std::vector<std::string> res;
+  if (PyCallable_Check(row_keys.ptr())) {
+    res.reserve(tensor.size(0));
+    for (int64_t i = 0; i < tensor.size(0); i++) {
+      res.push_back(row_keys(tensor.slice(0, i, i + 1), i).cast<std::string>());
+    }
+    return res;
+  }
+  res = KeysFromPython(row_keys);
+  if (static_cast<int64_t>(res.size()) != tensor.size(0)) {
+    throw std::invalid_argument(
+        "`row_keys` must have the same length as tensor.shape[0]");
+  }
+  return res;
+}
+
+void WriteTensor(py::object const& client, std::string const& table_id,
+                 std::optional<std::string> const& app_profile_id,
+                 torch::Tensor const& tensor, py::list const& columns,
+                 py::object const& row_keys) {
+  TraceSpan write_span("write_tensor");
   std::shared_ptr<cbt::DataClient> data_client = CreateDataClient(client);
   auto table = CreateTable(data_client, table_id, app_profile_id);
+  auto const limiter = GetRateLimiter(client);
+  auto const keys = RowKeysForTensor(tensor, row_keys);
+  EncodedTensor const values(tensor);
 
   for (int i = 0; i < tensor.size(0); i++) {
-    auto row_key = rowKeyForTensor(tensor, i, row_key_list, row_key_generator);
+    TraceSpan row_span("write_row");
+    auto const& row_key = keys[i];
+    if (limiter) {
+      // Every cell is written with a separate request. Column names include
+      // a colon between the family and the qualifier.
+      auto bytes = static_cast<int64_t>(row_key.size());
+      for (int j = 0; j < tensor.size(1); j++) {
+        bytes += static_cast<int64_t>(columns[j].cast<std::string>().size() -
+                                      1 + values.Value(i, j).size());
+      }
+      py::gil_scoped_release release;
+      limiter->Acquire(tensor.size(1), 1, bytes);
+    }
 
     for (int j = 0; j < tensor.size(1); j++) {
       auto col_name_full = columns[j].cast<std::string>();
       auto [col_family, col_name] = ColumnNameToPair(col_name_full);
       google::cloud::Status status = table->Apply(cbt::SingleRowMutation(
           row_key, cbt::SetCell(std::move(col_family), std::move(col_name),
-                                GetTensorValueAsBytes(tensor, i, j))));
+                                std::string(values.Value(i, j)))));
       if (!status.ok()) throw std::runtime_error(status.message());
     }
   }
 }
 
+// Writes the rows of `tensor` with BulkApply from `concurrency` threads.
+// Instead of following the order of the tensor, the rows are sorted by key
+// and grouped by the tablets of `sample_row_keys`, and at most
+// `max_in_flight_per_tablet` requests are sent to a tablet at once, so the
+// load is spread over the tablet servers. Returns the number of rows written.
+int64_t WriteTensorByTablet(py::object const& client,
+                            std::string const& table_id,
+                            std::optional<std::string> const& app_profile_id,
+                            torch::Tensor const& tensor,
+                            py::list const& columns, py::object const& row_keys,
+                            py::list const& sample_row_keys, size_t concurrency,
+                            size_t rows_per_request,
+                            size_t max_in_flight_per_tablet) {
+  TraceSpan write_span("write_tensor");
+  auto table = CreateTable(CreateDataClient(client), table_id, app_profile_id);
+  auto const limiter = GetRateLimiter(client);
+  auto const keys = RowKeysForTensor(tensor, row_keys);
+  std::vector<std::pair<std::string, std::string>> column_pairs;
+  for (auto const& column : columns) {
+    column_pairs.push_back(ColumnNameToPair(column.cast<std::string>()));
+  }
+  std::vector<std::string> tablet_ends;
+  for (auto const& sample : sample_row_keys) {
+    tablet_ends.push_back(sample.cast<py::tuple>()[0].cast<std::string>());
+  }
+  rows_per_request = std::max<size_t>(rows_per_request, 1);
+  max_in_flight_per_tablet = std::max<size_t>(max_in_flight_per_tablet, 1);
+
+  py::gil_scoped_release release;
+  EncodedTensor const values(tensor);
+  std::sort(tablet_ends.begin(), tablet_ends.end());
+  std::vector<size_t> order(keys.size());
+  std::iota(order.begin(), order.end(), 0);
+  std::stable_sort(order.begin(), order.end(),
+                   [&keys](size_t a, size_t b) { return keys[a] < keys[b]; });
+
+  // Rows [next, end) of `order` belonging to a tablet, which are not sent
+  // yet.
+  struct Tablet {
+    size_t next;
+    size_t end;
+    size_t in_flight;
+  };
+  std::vector<Tablet> tablets;
+  for (size_t begin = 0; begin < order.size();) {
+    // A sample row key is the end of a tablet, excluded from it.
+    auto const bound = std::upper_bound(tablet_ends.begin(), tablet_ends.end(),
+                                        keys[order[begin]]);
+    size_t end = order.size();
+    if (bound != tablet_ends.end()) {
+      end = std::partition_point(
+                order.begin() + begin, order.end(),
+                [&keys, &bound](size_t row) { return keys[row] < *bound; }) -
+            order.begin();
+    }
+    tablets.push_back(Tablet{begin, end, 0});
+    begin = end;
+  }
+
+  // Bigtable timestamps have millisecond granularity. An explicit timestamp
+  // makes the mutations idempotent, so BulkApply can retry them.
+  auto const timestamp = std::chrono::duration_cast<std::chrono::milliseconds>(
+      std::chrono::system_clock::now().time_since_epoch());
+  std::mutex mu;
+  std::condition_variable cv;
+  size_t unsent_rows = order.size();
+  size_t cursor = 0;
+  int64_t rows_written = 0;
+  std::optional<std::string> error;
+
+  // Picks the next tablet with rows to send and a free request slot, going
+  // round the tablets so that they all progress at the same pace.
+  auto const pick_tablet = [&]() -> std::optional<size_t> {
+    for (size_t n = 0; n < tablets.size(); n++) {
+      size_t const t = (cursor + n) % tablets.size();
+      if (tablets[t].next < tablets[t].end &&
+          tablets[t].in_flight < max_in_flight_per_tablet) {
+        cursor = t + 1;
+        return t;
+      }
+    }
+    return std::nullopt;
+  };
+
+  auto const work = [&](cbt::Table& table) {
+    while (true) {
+      std::optional<size_t> tablet;
+      size_t begin;
+      size_t end;
+      {
+        std::unique_lock<std::mutex> lock(mu);
+        cv.wait(lock, [&] {
+          tablet = pick_tablet();
+          return tablet || unsent_rows == 0;
+        });
+        if (!tablet) return;
+        begin = tablets[*tablet].next;
+        end = std::min(tablets[*tablet].end, begin + rows_per_request);
+        tablets[*tablet].next = end;
+        tablets[*tablet].in_flight++;
+        unsent_rows -= end - begin;
+      }
+
+      cbt::BulkMutation mutation;
+      size_t bytes = 0;
+      for (size_t k = begin; k < end; k++) {
+        size_t const row = order[k];
+        cbt::SingleRowMutation row_mutation(keys[row]);
+        bytes += keys[row].size();
+        for (size_t j = 0; j < column_pairs.size(); j++) {
+          std::string value(values.Value(row, j));
+          bytes += column_pairs[j].first.size() +
+                   column_pairs[j].second.size() + value.size();
+          row_mutation.emplace_back(cbt::SetCell(column_pairs[j].first,
+                                                 column_pairs[j].second,
+                                                 timestamp, std::move(value)));
+        }
+        mutation.emplace_back(std::move(row_mutation));
+      }
+      if (limiter) {
+        limiter->Acquire(1, static_cast<int64_t>(end - begin),
+                         static_cast<int64_t>(bytes));
+      }
+      auto const start = std::chrono::steady_clock::now();
+      auto failures = table.BulkApply(std::move(mutation));
+      Tracer::Instance().Record(
+          "bulk_apply", start, std::chrono::steady_clock::now(),
+          {{"rows", static_cast<int64_t>(end - begin)},
+           {"bytes", static_cast<int64_t>(bytes)},
+           {"failed", static_cast<int64_t>(failures.size())},
+           {"tablet", static_cast<int64_t>(*tablet)}});
+
+      {
+        std::lock_guard<std::mutex> lock(mu);
+        tablets[*tablet].in_flight--;
+        rows_written += static_cast<int64_t>(end - begin - failures.size());
+        if (!failures.empty() && !error) {
+          error = std::to_string(failures.size()) +
+                  " rows failed to be written, the first one with: " +
+                  failures.front().status().message();
+        }
+      }
+      cv.notify_all();
+    }
+  };
+
+  std::vector<std::thread> threads;
+  for (size_t i = 0; i < std::max<size_t>(concurrency, 1); i++) {
+    // Copies of a `cbt::Table` share the connection pool, but a single
+    // instance must not be used from many threads at once.
+    threads.emplace_back([&work, table = *table]() mutable { work(table); });
+  }
+  for (auto& thread : threads) thread.join();
+  if (error) throw std::runtime_error(*error);
+  return rows_written;
+}
+
+// Buffers mutations and writes them with BulkApply from background threads.
+// Rows are grouped into batches of at most `max_rows` rows or `max_bytes`
+// bytes. A batch is sealed when it's full, when it's older than
+// `flush_interval` seconds, or on Flush(). Sealed batches are written by
+// `concurrency` threads. Append() blocks while more than `concurrency + 1`
+// batches worth of bytes are waiting, which bounds the memory used. Errors
+// of the background writes are raised by the next Flush() or Close().
+class BigtableWriter {
+ public:
+  BigtableWriter(py::object const& client, std::string const& table_id,
+                 std::optional<std::string> const& app_profile_id,
+                 py::list const& columns, size_t max_rows, size_t max_bytes,
+                 std::optional<double> flush_interval, size_t concurrency)
+      : max_rows_(std::max<size_t>(max_rows, 1)),
+        max_bytes_(std::max<size_t>(max_bytes, 1)),
+        max_pending_bytes_(max_bytes_ * (std::max<size_t>(concurrency, 1) + 1)),
+        flush_interval_(flush_interval),
+        limiter_(GetRateLimiter(client)) {
+    for (auto const& column : columns) {
+      columns_.push_back(ColumnNameToPair(column.cast<std::string>()));
+    }
+    auto table =
+        CreateTable(CreateDataClient(client), table_id, app_profile_id);
+    for (size_t i = 0; i < std::max<size_t>(concurrency, 1); i++) {
+      // Copies of a `cbt::Table` share the connection pool, but a single
+      // instance must not be used from many threads at once.
+      threads_.emplace_back([this, table = *table]() mutable { Work(table); });
+    }
+    if (flush_interval_) {
+      threads_.emplace_back([this] { FlushPeriodically(); });
+    }
+  }
+
+  BigtableWriter(BigtableWriter const&) = delete;
+  BigtableWriter& operator=(BigtableWriter const&) = delete;
+
+  ~BigtableWriter() {
+    py::gil_scoped_release release;
+    Stop();
+  }
+
+  void Append(torch::Tensor const& tensor, py::object const& row_keys) {
+    if (tensor.dim() != 2 ||
+        tensor.size(1) != static_cast<int64_t>(columns_.size())) {
+      throw std::invalid_argument(
+          "`tensor` must have a column for every column of the writer");
+    }
+    auto const keys = RowKeysForTensor(tensor, row_keys, rows_appended_);
+    rows_appended_ += tensor.size(0);
+
+    py::gil_scoped_release release;
+    EncodedTensor const values(tensor);
+    // Bigtable timestamps have millisecond granularity. An explicit timestamp
+    // makes the mutations idempotent, so BulkApply can retry them.
+    auto const timestamp =
+        std::chrono::duration_cast<std::chrono::milliseconds>(
+            std::chrono::system_clock::now().time_since_epoch());
+    for (int64_t i = 0; i < tensor.size(0); i++) {
+      cbt::SingleRowMutation mutation(keys[i]);
+      size_t bytes = keys[i].size();
+      for (int64_t j = 0; j < tensor.size(1); j++) {
+        std::string value(values.Value(i, j));
+        bytes +=
+            columns_[j].first.size() + columns_[j].second.size() + value.size();
+        mutation.emplace_back(cbt::SetCell(columns_[j].first,
+                                           columns_[j].second, timestamp,
+                                           std::move(value)));
+      }
+      AddRow(std::move(mutation), bytes);
+    }
+  }
+
+  // Writes all the appended rows and raises the first error of the writes
+  // since the last Flush(), if any.
+  void Flush() {
+    std::optional<std::string> error;
+    {
+      py::gil_scoped_release release;
+      std::unique_lock<std::mutex> lock(mu_);
+      SealCurrentBatch();
+      cv_.wait(lock, [this] { return sealed_.empty() && in_flight_ == 0; });
+      error = std::move(error_);
+      error_.reset();
+    }
+    if (error) throw std::runtime_error(*error);
+  }
+
+  // Flushes and stops the background threads. The writer can't be used
+  // afterwards. The threads are stopped even if the flush fails.
+  void Close() {
+    {
+      std::lock_guard<std::mutex> lock(mu_);
+      if (closed_) return;
+      closed_ = true;
+    }
+    std::exception_ptr error;
+    try {
+      Flush();
+    } catch (...) {
+      error = std::current_exception();
+    }
+    {
+      py::gil_scoped_release release;
+      Stop();
+    }
+    if (error) std::rethrow_exception(error);
+  }
+
+  size_t rows_written() const {
+    std::lock_guard<std::mutex> lock(mu_);
+    return rows_written_;
+  }
+
+ private:
+  struct Batch {
+    cbt::BulkMutation mutation;
+    size_t rows = 0;
+    size_t bytes = 0;
+  };
+
+  void AddRow(cbt::SingleRowMutation mutation, size_t bytes) {
+    std::unique_lock<std::mutex> lock(mu_);
+    if (closed_) throw std::runtime_error("The writer is closed.");
+    // Flow control: wait until the background threads catch up.
+    cv_.wait(lock, [this] { return pending_bytes_ < max_pending_bytes_; });
+    if (!current_) {
+      current_.emplace();
+      current_started_ = std::chrono::steady_clock::now();
+    }
+    current_->mutation.emplace_back(std::move(mutation));
+    current_->rows++;
+    current_->bytes += bytes;
+    pending_bytes_ += bytes;
+    if (current_->rows >= max_rows_ || current_->bytes >= max_bytes_) {
+      SealCurrentBatch();
+    }
+  }
+
+  // Must be called with `mu_` held.
+  void SealCurrentBatch() {
+    if (!current_) return;
+    sealed_.push_back(*std::move(current_));
+    current_.reset();
+    cv_.notify_all();
+  }
+
+  void Work(cbt::Table& table) {
+    while (true) {
+      Batch batch;
+      {
+        std::unique_lock<std::mutex> lock(mu_);
+        cv_.wait(lock, [this] { return stopping_ || !sealed_.empty(); });
+        if (sealed_.empty()) return;
+        batch = std::move(sealed_.front());
+        sealed_.pop_front();
+        in_flight_++;
+      }
+
+      if (limiter_) {
+        limiter_->Acquire(1, static_cast<int64_t>(batch.rows),
+                          static_cast<int64_t>(batch.bytes));
+      }
+      auto const start = std::chrono::steady_clock::now();
+      auto failures = table.BulkApply(std::move(batch.mutation));
+      Tracer::Instance().Record(
+          "bulk_apply", start, std::chrono::steady_clock::now(),
+          {{"rows", static_cast<int64_t>(batch.rows)},
+           {"bytes", static_cast<int64_t>(batch.bytes)},
+           {"failed", static_cast<int64_t>(failures.size())}});
+
+      std::lock_guard<std::mutex> lock(mu_);
+      in_flight_--;
+      pending_bytes_ -= batch.bytes;
+      rows_written_ += batch.rows - failures.size();
+      if (!failures.empty() && !error_) {
+        error_ = std::to_string(failures.size()) +
+                 " rows failed to be written, the first one with: " +
+                 failures.front().status().message();
+      }
+      cv_.notify_all();
+    }
+  }
+
+  void FlushPeriodically() {
+    auto const interval =
+        std::chrono::duration_cast<std::chrono::steady_clock::duration>(
+            std::chrono::duration<double>(*flush_interval_));
+    std::unique_lock<std::mutex> lock(mu_);
+    while (!stopping_) {
+      auto const deadline = current_
+                                ? current_started_ + interval
+                                : std::chrono::steady_clock::now() + interval;
+      cv_.wait_until(lock, deadline);
+      if (current_ &&
+          std::chrono::steady_clock::now() - current_started_ >= interval) {
+        SealCurrentBatch();
+      }
+    }
+  }
+
+  // Writes the remaining batches and joins the threads.
+  void Stop() {
+    {
+      std::lock_guard<std::mutex> lock(mu_);
+      SealCurrentBatch();
+      stopping_ = true;
+    }
+    cv_.notify_all();
+    for (auto& thread : threads_) {
+      if (thread.joinable()) thread.join();
+    }
+  }
+
+  std::vector<std::pair<std::string, std::string>> columns_;
+  // Only accessed with the GIL held.
+  int64_t rows_appended_ = 0;
+  size_t const max_rows_;
+  size_t const max_bytes_;
+  size_t const max_pending_bytes_;
+  std::optional<double> const flush_interval_;
+  std::shared_ptr<RateLimiter> const limiter_;
+
+  mutable std::mutex mu_;
+  std::condition_variable cv_;
+  std::optional<Batch> current_;
+  std::chrono::steady_clock::time_point current_started_;
+  std::deque<Batch> sealed_;
+  size_t in_flight_ = 0;
+  // Bytes of all the rows appended, but not yet written.
+  size_t pending_bytes_ = 0;
+  size_t rows_written_ = 0;
+  std::optional<std::string> error_;
+  bool stopping_ = false;
+  bool closed_ = false;
+  std::vector<std::thread> threads_;
+};
+
 torch::Tensor getFilledTensor(size_t size, torch::Dtype const& cell_type,
                               std::optional<py::object> const& default_value) {
   switch (cell_type) {
@@ -326,11 +1533,100 @@ int GetWorkerStartIndex(size_t num_tablets, size_t num_workers,
          std::min(surplus_tablets, workers_before);
 }
 
-bool RowSetIntersectsRange(cbt::RowSet const& row_set,
-                           std::string const& start_key,
-                           std::string const& end_key) {
-  auto range = cbt::RowRange::Range(start_key, end_key);
-  return !row_set.Intersect(range).IsEmpty();
+// A row range as a pair of keys [start, end). An empty `end` means that the
+// range is unbounded. Bigtable's open and closed bounds are converted using
+// the fact that `key + '\0'` is the smallest key greater than `key`.
+struct KeyInterval {
+  std::string start;
+  std::string end;
+
+  bool IsEmpty() const { return !end.empty() && start >= end; }
+  bool Contains(std::string const& key) const {
+    return start <= key && (end.empty() || key < end);
+  }
+};
+
+KeyInterval ToKeyInterval(google::bigtable::v2::RowRange const& range) {
+  using RangeProto = google::bigtable::v2::RowRange;
+  KeyInterval res;
+  switch (range.start_key_case()) {
+    case RangeProto::kStartKeyClosed:
+      res.start = range.start_key_closed();
+      break;
+    case RangeProto::kStartKeyOpen:
+      res.start = range.start_key_open() + '\0';
+      break;
+    default:
+      break;
+  }
+  switch (range.end_key_case()) {
+    case RangeProto::kEndKeyOpen:
+      res.end = range.end_key_open();
+      break;
+    case RangeProto::kEndKeyClosed:
+      if (!range.end_key_closed().empty()) {
+        res.end = range.end_key_closed() + '\0';
+      }
+      break;
+    default:
+      break;
+  }
+  return res;
+}
+
+// Sorts the intervals and merges the ones which overlap or touch, so that the
+// result is disjoint.
+std::vector<KeyInterval> MergeKeyIntervals(std::vector<KeyInterval> intervals) {
+  std::sort(intervals.begin(), intervals.end(),
+            [](KeyInterval const& a, KeyInterval const& b) {
+              return a.start < b.start;
+            });
+  std::vector<KeyInterval> merged;
+  for (auto& interval : intervals) {
+    if (!merged.empty() &&
+        (merged.back().end.empty() || interval.start <= merged.back().end)) {
+      auto& last = merged.back();
+      if (!last.end.empty() &&
+          (interval.end.empty() || interval.end > last.end)) {
+        last.end = std::move(interval.end);
+      }
+      continue;
+    }
+    merged.push_back(std::move(interval));
+  }
+  return merged;
+}
+
+// Returns the sorted, disjoint intervals of keys in a row set. Like in
+// ReadRows, a row set without any keys or ranges means the whole table.
+std::vector<KeyInterval> RowSetIntervals(cbt::RowSet const& row_set) {
+  auto const& proto = row_set.as_proto();
+  if (proto.row_keys().empty() && proto.row_ranges().empty()) {
+    return {KeyInterval{}};
+  }
+  std::vector<KeyInterval> intervals;
+  intervals.reserve(proto.row_keys().size() + proto.row_ranges().size());
+  for (auto const& row_key : proto.row_keys()) {
+    intervals.push_back(KeyInterval{row_key, row_key + '\0'});
+  }
+  for (auto const& range : proto.row_ranges()) {
+    KeyInterval interval = ToKeyInterval(range);
+    if (!interval.IsEmpty()) intervals.push_back(std::move(interval));
+  }
+  return MergeKeyIntervals(std::move(intervals));
+}
+
+// Whether any of the sorted, disjoint `intervals` intersects [start, end). An
+// empty `end` means the end of the table.
+bool IntervalsIntersect(std::vector<KeyInterval> const& intervals,
+                        std::string const& start, std::string const& end) {
+  // The intervals are disjoint, so their ends are sorted as well. Find the
+  // first one which ends after `start`.
+  auto it = std::partition_point(intervals.begin(), intervals.end(),
+                                 [&start](KeyInterval const& i) {
+                                   return !i.end.empty() && i.end <= start;
+                                 });
+  return it != intervals.end() && (end.empty() || it->start < end);
 }
 
 cbt::RowSet ComputeRowSetForWorker(cbt::RowSet const& row_set,
@@ -353,10 +1649,13 @@ cbt::RowSet ComputeRowSetForWorker(cbt::RowSet const& row_set,
   if (!start_key.empty()) {
     tablets.emplace_back(start_key, "");
   }
+  // Checking each tablet with `RowSet::Intersect` would copy the row set
+  // for every tablet, so binary search a sorted index of it instead.
+  auto const intervals = RowSetIntervals(row_set);
   tablets.erase(std::remove_if(
                     tablets.begin(), tablets.end(),
-                    [&row_set](std::pair<std::string, std::string> const& p) {
-                      return !RowSetIntersectsRange(row_set, p.first, p.second);
+                    [&intervals](std::pair<std::string, std::string> const& p) {
+                      return !IntervalsIntersect(intervals, p.first, p.second);
                     }),
                 tablets.end());
 
@@ -374,66 +1673,1551 @@ cbt::RowSet ComputeRowSetForWorker(cbt::RowSet const& row_set,
   return row_set.Intersect(cbt::RowRange::Range(start_key, end_key));
 }
 
-class BigtableDatasetIterator {
+// Size of the key and of the cells of a row, as counted by the metrics and the
+// rate limits.
+int64_t RowBytes(cbt::Row const& row) {
+  auto bytes = static_cast<int64_t>(row.row_key().size());
+  for (auto const& cell : row.cells()) {
+    bytes += static_cast<int64_t>(cell.family_name().size() +
+                                  cell.column_qualifier().size() +
+                                  cell.value().size());
+  }
+  return bytes;
+}
+
+// Stream of rows read by BigtableDatasetIterator. Rows come in row key order
+// and contain only cells passing the filter the source was created with.
+class RowSource {
  public:
-  BigtableDatasetIterator(py::object const& client, std::string const& table_id,
-                          std::optional<std::string> const& app_profile_id,
-                          py::list const& sample_row_keys,
-                          py::list const& columns, py::object cell_type,
-                          cbt::RowSet const& row_set,
-                          cbt::Filter const& versions,
-                          std::optional<py::object> default_value,
-                          int num_workers, int worker_id)
-      : column_map_(CreateColumnMap(columns)),
-        data_client_(CreateDataClient(client)),
-        default_value_(std::move(default_value)),
-        cell_type_(
-            torch::python::detail::py_object_to_dtype(std::move(cell_type))),
-        reader_(CreateTable(this->data_client_, table_id, app_profile_id)
-                    ->ReadRows(
-                        ComputeRowSetForWorker(row_set, sample_row_keys,
-                                               num_workers, worker_id),
-                        cbt::Filter::Chain(CreateColumnsFilter(column_map_),
-                                           versions, cbt::Filter::Latest(1)))),
-        it_(this->reader_.begin()) {}
+  virtual ~RowSource() = default;
+  // Returns the next row, or nullopt at the end of the stream. Must not be
+  // called again after the end. Called without the GIL held, since it may
+  // wait for the network or for a rate limiter.
+  virtual std::optional<cbt::Row> Next() = 0;
+};
 
-  torch::Tensor next() {
-    if (it_ == reader_.end()) throw py::stop_iteration();
+// Rows read from Bigtable with a single ReadRows call. The reading is
+// throttled by `limiter`, if given.
+class TableRowSource : public RowSource {
+ public:
+  TableRowSource(std::shared_ptr<cbt::DataClient> const& data_client,
+                 std::string const& table_id,
+                 std::optional<std::string> const& app_profile_id,
+                 cbt::RowSet row_set, cbt::Filter filter,
+                 std::shared_ptr<RateLimiter> limiter = nullptr)
+      : limiter_(std::move(limiter)) {
+    reader_.emplace(CreateTable(data_client, table_id, app_profile_id)
+                        ->ReadRows(std::move(row_set), std::move(filter)));
+  }
 
-    torch::Tensor tensor =
-        getFilledTensor(this->column_map_.size(), cell_type_, default_value_);
-    auto const& row = *it_;
-    for (const auto& cell : row.value().cells()) {
-      std::pair<std::string, std::string> key(cell.family_name(),
-                                              cell.column_qualifier());
-      PutCellValueInTensor(&tensor, column_map_[key], cell_type_, cell);
+  std::optional<cbt::Row> Next() override {
+    if (!it_) {
+      // The request is sent by begin(), which returns once the first row, or
+      // the end of the stream, arrived.
+      TraceSpan span("stream_open");
+      if (limiter_) limiter_->Acquire(1, 0, 0);
+      it_ = reader_->begin();
+    } else {
+      ++*it_;
     }
+    if (*it_ == reader_->end()) return std::nullopt;
+    auto& row = **it_;
+    if (!row.ok()) throw std::runtime_error(row.status().message());
+    if (limiter_) limiter_->Acquire(0, 1, RowBytes(*row));
+    return std::move(row).value();
+  }
+
+ private:
+  std::shared_ptr<RateLimiter> const limiter_;
+  std::optional<cbt::RowReader> reader_;
+  std::optional<cbt::v1::internal::RowReaderIterator> it_;
+};
+
+// A table kept in the memory of this process. It lets the decoding, batching
+// and partitioning code run at full speed, without gRPC or the emulator. Only
+// the latest value of each cell is kept.
+class MemoryTable {
+ public:
+  struct CellValue {
+    std::string value;
+    int64_t timestamp_micros;
+  };
+  using Cells = std::map<std::pair<std::string, std::string>, CellValue>;
+  using Rows = std::map<std::string, Cells>;
+
+  // Stores the cell unless the table already has a newer version of it.
+  void SetCell(std::string const& row_key, std::string family,
+               std::string qualifier, std::string value,
+               int64_t timestamp_micros) {
+    auto [it, inserted] = rows_[row_key].try_emplace(
+        std::make_pair(std::move(family), std::move(qualifier)),
+        CellValue{value, timestamp_micros});
+    if (!inserted && it->second.timestamp_micros <= timestamp_micros) {
+      it->second = CellValue{std::move(value), timestamp_micros};
+    }
+  }
+
+  void WriteTensor(torch::Tensor const& tensor, py::list const& columns,
+                   py::object const& row_keys) {
+    std::vector<std::pair<std::string, std::string>> column_pairs;
+    for (auto const& column : columns) {
+      column_pairs.push_back(ColumnNameToPair(column.cast<std::string>()));
+    }
+    auto const now = std::chrono::duration_cast<std::chrono::microseconds>(
+                         std::chrono::system_clock::now().time_since_epoch())
+                         .count();
+    auto const keys = RowKeysForTensor(tensor, row_keys);
+    EncodedTensor const values(tensor);
+    for (int64_t i = 0; i < tensor.size(0); i++) {
+      auto const& row_key = keys[i];
+      for (int64_t j = 0; j < tensor.size(1); j++) {
+        SetCell(row_key, column_pairs[j].first, column_pairs[j].second,
+                std::string(values.Value(i, j)), now);
+      }
+    }
+  }
+
+  // Emulates Bigtable's sample_row_keys, pretending that every
+  // `rows_per_tablet` rows form a tablet.
+  py::list SampleRowKeys(size_t rows_per_tablet) const {
+    py::list res;
+    size_t index = 0;
+    int64_t offset = 0;
+    for (auto const& [row_key, cells] : rows_) {
+      if (index > 0 && index % rows_per_tablet == 0) {
+        res.append(py::make_tuple(row_key, offset));
+      }
+      index++;
+      for (auto const& [column, cell] : cells) {
+        offset +=
+            static_cast<int64_t>(row_key.size() + column.first.size() +
+                                 column.second.size() + cell.value.size());
+      }
+    }
+    res.append(py::make_tuple("", offset));
+    return res;
+  }
+
+  size_t size() const { return rows_.size(); }
+
+  Rows const& rows() const { return rows_; }
+
+  // Time at which the last sync of this table as a snapshot of a Bigtable
+  // table started, if any. See SyncSnapshot.
+  std::optional<int64_t> synced_micros() const { return synced_micros_; }
+  void set_synced_micros(int64_t synced_micros) {
+    synced_micros_ = synced_micros;
+  }
+
+  // Returns the columns present in the first `rows_limit` rows of the row
+  // set.
+  std::vector<std::pair<std::string, std::string>> Columns(
+      cbt::RowSet const& row_set, size_t rows_limit) const {
+    std::set<std::pair<std::string, std::string>> columns;
+    size_t num_rows = 0;
+    for (auto const& interval : RowSetIntervals(row_set)) {
+      for (auto it = rows_.lower_bound(interval.start);
+           it != rows_.end() && interval.Contains(it->first) &&
+           num_rows < rows_limit;
+           ++it, ++num_rows) {
+        for (auto const& cell : it->second) columns.insert(cell.first);
+      }
+    }
+    return {columns.begin(), columns.end()};
+  }
+
+  py::bytes Serialize() const {
+    std::ostringstream out;
+    out.write(kMagic, sizeof(kMagic));
+    WriteInt(out, rows_.size());
+    for (auto const& [row_key, cells] : rows_) {
+      WriteString(out, row_key);
+      WriteInt(out, cells.size());
+      for (auto const& [column, cell] : cells) {
+        WriteString(out, column.first);
+        WriteString(out, column.second);
+        WriteInt(out, static_cast<uint64_t>(cell.timestamp_micros));
+        WriteString(out, cell.value);
+      }
+    }
+    WriteInt(out, synced_micros_ ? 1 : 0);
+    WriteInt(out, static_cast<uint64_t>(synced_micros_.value_or(0)));
+    return py::bytes(out.str());
+  }
+
+  static std::shared_ptr<MemoryTable> Deserialize(std::string const& data) {
+    std::istringstream in(data);
+    char magic[sizeof(kMagic)];
+    in.read(magic, sizeof(magic));
+    bool const has_synced_micros =
+        in && std::equal(magic, magic + sizeof(magic), kMagic);
+    if (!in || (!has_synced_micros &&
+                !std::equal(magic, magic + sizeof(magic), kMagicV1))) {
+      throw std::runtime_error("Not a serialized MemoryTable.");
+    }
+    auto res = std::make_shared<MemoryTable>();
+    for (uint64_t num_rows = ReadInt(in); num_rows > 0; num_rows--) {
+      auto row_key = ReadString(in);
+      auto& cells = res->rows_[row_key];
+      for (uint64_t num_cells = ReadInt(in); num_cells > 0; num_cells--) {
+        auto family = ReadString(in);
+        auto qualifier = ReadString(in);
+        auto timestamp_micros = static_cast<int64_t>(ReadInt(in));
+        cells[std::make_pair(std::move(family), std::move(qualifier))] =
+            CellValue{ReadString(in), timestamp_micros};
+      }
+    }
+    if (has_synced_micros) {
+      bool const synced = ReadInt(in) != 0;
+      auto const synced_micros = static_cast<int64_t>(ReadInt(in));
+      if (synced) res->synced_micros_ = synced_micros;
+    }
+    return res;
+  }
+
+  void Save(std::string const& path) const {
+    std::ofstream file(path, std::ios::binary | std::ios::trunc);
+    file << static_cast<std::string>(Serialize());
+    if (!file) throw std::runtime_error("Error writing " + path);
+  }
+
+  static std::shared_ptr<MemoryTable> Load(std::string const& path) {
+    std::ifstream file(path, std::ios::binary);
+    if (!file) throw std::runtime_error("Error reading " + path);
+    std::ostringstream data;
+    data << file.rdbuf();
+    return Deserialize(data.str());
+  }
+
+ private:
+  static constexpr char kMagic[8] = {'P', 'B', 'T', 'M', 'E', 'M', '0', '2'};
+  // Format without `synced_micros_`.
+  static constexpr char kMagicV1[8] = {'P', 'B', 'T', 'M', 'E', 'M', '0', '1'};
+
+  static void WriteInt(std::ostream& out, uint64_t value) {
+    char buffer[sizeof(value)];
+    for (char& byte : buffer) {
+      byte = static_cast<char>(value & 0xFFU);
+      value >>= 8U;
+    }
+    out.write(buffer, sizeof(buffer));
+  }
+
+  static uint64_t ReadInt(std::istream& in) {
+    unsigned char buffer[sizeof(uint64_t)];
+    in.read(reinterpret_cast<char*>(buffer), sizeof(buffer));
+    if (!in) throw std::runtime_error("Truncated MemoryTable.");
+    uint64_t value = 0;
+    for (size_t i = sizeof(buffer); i > 0; i--) {
+      value = (value << 8U) | buffer[i - 1];
+    }
+    return value;
+  }
+
+  static void WriteString(std::ostream& out, std::string const& s) {
+    WriteInt(out, s.size());
+    out.write(s.data(), static_cast<std::streamsize>(s.size()));
+  }
+
+  static std::string ReadString(std::istream& in) {
+    std::string s(ReadInt(in), '\0');
+    in.read(&s[0], static_cast<std::streamsize>(s.size()));
+    if (!in) throw std::runtime_error("Truncated MemoryTable.");
+    return s;
+  }
+
+  Rows rows_;
+  std::optional<int64_t> synced_micros_;
+};
+
+// Rows of a MemoryTable within a row set. Only the cells of the given columns
+// are returned, as if filtered by `CreateColumnsFilter`. If `keys_only`, all
+// the rows are returned, without any cells. The table must not be modified
+// while the source is in use.
+class MemoryRowSource : public RowSource {
+ public:
+  MemoryRowSource(std::shared_ptr<MemoryTable const> table,
+                  cbt::RowSet const& row_set, ColumnMap const& columns,
+                  bool keys_only = false)
+      : table_(std::move(table)),
+        columns_(columns),
+        intervals_(RowSetIntervals(row_set)),
+        keys_only_(keys_only) {}
 
-    it_ = std::next(it_);
+  std::optional<cbt::Row> Next() override {
+    auto const& rows = table_->rows();
+    while (interval_ < intervals_.size()) {
+      auto const& interval = intervals_[interval_];
+      if (!positioned_) {
+        it_ = rows.lower_bound(interval.start);
+        positioned_ = true;
+      }
+      if (it_ == rows.end() || !interval.Contains(it_->first)) {
+        interval_++;
+        positioned_ = false;
+        continue;
+      }
+
+      auto const& [row_key, row_cells] = *it_++;
+      if (keys_only_) return cbt::Row(row_key, {});
+      std::vector<cbt::Cell> cells;
+      for (auto const& [column, cell] : row_cells) {
+        if (columns_.find(column) == columns_.end()) continue;
+        cells.emplace_back(row_key, column.first, column.second,
+                           cell.timestamp_micros, cell.value);
+      }
+      // Like Bigtable, skip rows with none of the requested columns.
+      if (!cells.empty()) return cbt::Row(row_key, std::move(cells));
+    }
+    return std::nullopt;
+  }
+
+ private:
+  std::shared_ptr<MemoryTable const> table_;
+  ColumnMap columns_;
+  std::vector<KeyInterval> intervals_;
+  bool const keys_only_;
+  size_t interval_ = 0;
+  bool positioned_ = false;
+  MemoryTable::Rows::const_iterator it_;
+};
+
+// Iterates over the keys of the rows of a source, returning them in chunks of
+// up to `chunk_size` keys. A chunk is either a NumPy array of dtype "S", or
+// a pair of tensors: int64 offsets of the keys, one more than there are keys,
+// and uint8 data holding the keys one after another.
+class KeyChunkIterator {
+ public:
+  KeyChunkIterator(std::unique_ptr<RowSource> source, size_t chunk_size,
+                   std::string const& output)
+      : source_(std::move(source)),
+        chunk_size_(std::max<size_t>(chunk_size, 1)),
+        numpy_(output == "numpy") {
+    if (output != "numpy" && output != "offsets") {
+      throw std::invalid_argument("`output` must be \"numpy\" or \"offsets\"");
+    }
+  }
+
+  py::object next() {
+    if (finished_) throw py::stop_iteration();
+    std::string data;
+    std::vector<int64_t> offsets{0};
+    size_t max_size = 0;
+    {
+      py::gil_scoped_release release;
+      TraceSpan span("scan_keys_chunk");
+      while (offsets.size() <= chunk_size_) {
+        auto row = source_->Next();
+        if (!row) {
+          finished_ = true;
+          break;
+        }
+        data += row->row_key();
+        offsets.push_back(static_cast<int64_t>(data.size()));
+        max_size = std::max(max_size, row->row_key().size());
+      }
+    }
+    auto const num_keys = static_cast<int64_t>(offsets.size() - 1);
+    if (num_keys == 0) throw py::stop_iteration();
+
+    if (numpy_) {
+      // NumPy has no zero-length byte strings, and drops trailing NULs.
+      auto const item_size = std::max<size_t>(max_size, 1);
+      py::array res(py::dtype("S" + std::to_string(item_size)), {num_keys});
+      auto* out = static_cast<char*>(res.mutable_data());
+      std::memset(out, 0, num_keys * item_size);
+      for (int64_t i = 0; i < num_keys; i++) {
+        std::memcpy(out + i * item_size, data.data() + offsets[i],
+                    offsets[i + 1] - offsets[i]);
+      }
+      return std::move(res);
+    }
+    auto offsets_tensor = torch::empty(
+        {num_keys + 1}, torch::TensorOptions().dtype(torch::kInt64));
+    std::memcpy(offsets_tensor.data_ptr<int64_t>(), offsets.data(),
+                offsets.size() * sizeof(int64_t));
+    auto data_tensor =
+        torch::empty({static_cast<int64_t>(data.size())},
+                     torch::TensorOptions().dtype(torch::kUInt8));
+    std::memcpy(data_tensor.data_ptr<uint8_t>(), data.data(), data.size());
+    return py::make_tuple(offsets_tensor, data_tensor);
+  }
+
+ private:
+  std::unique_ptr<RowSource> source_;
+  size_t const chunk_size_;
+  bool const numpy_;
+  bool finished_ = false;
+};
+
+// Copies the latest version of the cells of a Bigtable table into
+// `snapshot`. If the snapshot was synced before, only the cells with
+// timestamps from `overlap_micros` before the start of the previous sync
+// onwards are read, and merged into it. The overlap covers cells committed
+// after that sync with slightly older timestamps, e.g. because of clock skew.
+// Cells deleted from Bigtable are not removed from the snapshot. Only the
+// `columns` and the columns matching the `wildcards` are copied, or all of
+// them if there are neither. The wildcards are matched by the server, so the
+// columns don't need to be known in advance. Returns the numbers of rows,
+// cells and bytes copied.
+py::dict SyncSnapshot(py::object const& client, std::string const& table_id,
+                      std::optional<std::string> const& app_profile_id,
+                      MemoryTable& snapshot, cbt::RowSet const& row_set,
+                      py::list const& columns, Wildcards const& wildcards,
+                      int64_t overlap_micros) {
+  ColumnMap const column_map = CreateColumnMap(columns);
+  bool const all_columns = column_map.empty() && wildcards.empty();
+  auto const start = std::chrono::duration_cast<std::chrono::microseconds>(
+                         std::chrono::system_clock::now().time_since_epoch())
+                         .count();
+  // A zero end of the range means no end.
+  auto const versions =
+      snapshot.synced_micros()
+          ? cbt::Filter::TimestampRangeMicros(
+                std::max<int64_t>(*snapshot.synced_micros() - overlap_micros,
+                                  0),
+                0)
+          : cbt::Filter::PassAllFilter();
+  auto filters = CreateWildcardFilters(wildcards);
+  if (!column_map.empty()) filters.push_back(CreateColumnsFilter(column_map));
+  // A column matched by several filters is passed once by Latest(1).
+  TableRowSource source(
+      CreateDataClient(client), table_id, app_profile_id, row_set,
+      all_columns ? cbt::Filter::Chain(versions, cbt::Filter::Latest(1))
+                  : cbt::Filter::Chain(cbt::Filter::InterleaveFromRange(
+                                           filters.begin(), filters.end()),
+                                       versions, cbt::Filter::Latest(1)),
+      GetRateLimiter(client));
+
+  int64_t rows = 0;
+  int64_t cells = 0;
+  int64_t bytes = 0;
+  {
+    py::gil_scoped_release release;
+    TraceSpan span("sync_snapshot");
+    while (auto row = source.Next()) {
+      // The filters may pass a few columns which weren't requested, see
+      // CreateColumnsFilter and CreateWildcardFilters. They're not stored.
+      bool stored = false;
+      for (auto const& cell : row->cells()) {
+        if (!all_columns &&
+            column_map.count(std::make_pair(cell.family_name(),
+                                            cell.column_qualifier())) == 0 &&
+            !MatchesWildcard(cell.family_name(), cell.column_qualifier(),
+                             wildcards)) {
+          continue;
+        }
+        if (!stored) {
+          stored = true;
+          rows++;
+          bytes += static_cast<int64_t>(row->row_key().size());
+        }
+        cells++;
+        bytes += static_cast<int64_t>(cell.family_name().size() +
+                                      cell.column_qualifier().size() +
+                                      cell.value().size());
+        snapshot.SetCell(row->row_key(), cell.family_name(),
+                         cell.column_qualifier(), cell.value(),
+                         cell.timestamp().count());
+      }
+    }
+  }
+  snapshot.set_synced_micros(start);
+
+  py::dict res;
+  res["rows"] = rows;
+  res["cells"] = cells;
+  res["bytes"] = bytes;
+  return res;
+}
+
+// Splits the share of worker `worker_id` among `num_streams` streams, the same
+// way the table is split among `num_workers * num_streams` workers. Streams
+// without any rows are left out.
+std::vector<cbt::RowSet> ComputeRowSetsForStreams(
+    cbt::RowSet const& row_set, py::list const& sample_row_keys,
+    int num_workers, int worker_id, int num_streams) {
+  std::vector<cbt::RowSet> res;
+  for (int s = 0; s < num_streams; s++) {
+    auto stream_row_set = ComputeRowSetForWorker(row_set, sample_row_keys,
+                                                 num_workers * num_streams,
+                                                 worker_id * num_streams + s);
+    if (!stream_row_set.IsEmpty()) res.push_back(std::move(stream_row_set));
+  }
+  return res;
+}
+
+// Number of partitions read by every stream of an ordered multi-stream read.
+// Smaller partitions let the streams read ahead of the consumer in smaller
+// steps, so that they wait less for it.
+constexpr int kOrderedPartitionsPerStream = 4;
+
+// Rows of many sources, read by `num_threads` threads and merged into one
+// stream. Every source buffers at most `kStreamBufferRows` rows, so a slow
+// consumer stops the readers.
+//
+// If `ordered` is false, every source gets its own thread and rows are
+// returned as soon as any source has them. Otherwise, the rows of a source
+// are returned only after all the rows of the previous ones, and a thread
+// starts reading a source only when it's among the `num_threads` first ones
+// which aren't consumed yet. Sources covering consecutive key ranges then
+// give rows in key order, with up to `num_threads` of them read ahead.
+class MultiStreamRowSource : public RowSource {
+ public:
+  using SourceFactory = std::function<std::unique_ptr<RowSource>()>;
+
+  MultiStreamRowSource(std::vector<SourceFactory> factories, size_t num_threads,
+                       bool ordered)
+      : factories_(std::move(factories)),
+        streams_(factories_.size()),
+        num_threads_(ordered ? std::max<size_t>(num_threads, 1)
+                             : factories_.size()),
+        ordered_(ordered) {
+    for (size_t i = 0; i < std::min(num_threads_, factories_.size()); i++) {
+      // Sources are created by the threads, so that the streams are opened
+      // concurrently too.
+      threads_.emplace_back([this] { Work(); });
+    }
+  }
+
+  MultiStreamRowSource(MultiStreamRowSource const&) = delete;
+  MultiStreamRowSource& operator=(MultiStreamRowSource const&) = delete;
+
+  ~MultiStreamRowSource() override {
+    {
+      std::lock_guard<std::mutex> lock(mu_);
+      cancelled_ = true;
+    }
+    cv_.notify_all();
+    py::gil_scoped_release release;
+    for (auto& thread : threads_) thread.join();
+  }
+
+  std::optional<cbt::Row> Next() override {
+    std::optional<cbt::Row> row;
+    std::optional<std::string> error;
+    {
+      std::unique_lock<std::mutex> lock(mu_);
+      std::optional<size_t> stream;
+      cv_.wait(lock, [this, &stream] {
+        stream = PickStream();
+        return error_ || stream || consumed_streams_ == streams_.size();
+      });
+      if (error_) {
+        error = error_;
+      } else if (stream) {
+        row = std::move(streams_[*stream].rows.front());
+        streams_[*stream].rows.pop_front();
+      }
+    }
+    cv_.notify_all();
+    if (error) throw std::runtime_error(*error);
+    return row;
+  }
+
+ private:
+  static constexpr size_t kStreamBufferRows = 1000;
+
+  struct Stream {
+    std::deque<cbt::Row> rows;
+    bool finished = false;
+  };
+
+  // Returns a stream with a buffered row to return next, if any. Unordered,
+  // it goes round the streams so that none of them is starved.
+  std::optional<size_t> PickStream() {
+    if (ordered_) {
+      // Streams before `consumed_streams_` are finished and drained.
+      while (consumed_streams_ < streams_.size()) {
+        auto const& stream = streams_[consumed_streams_];
+        if (!stream.rows.empty()) return consumed_streams_;
+        if (!stream.finished) return std::nullopt;
+        consumed_streams_++;
+      }
+      return std::nullopt;
+    }
+    for (size_t n = 0; n < streams_.size(); n++) {
+      size_t const s = (next_stream_ + n) % streams_.size();
+      if (!streams_[s].rows.empty()) {
+        next_stream_ = s + 1;
+        return s;
+      }
+    }
+    consumed_streams_ = finished_streams_;
+    return std::nullopt;
+  }
+
+  void Work() {
+    while (true) {
+      size_t s;
+      {
+        std::unique_lock<std::mutex> lock(mu_);
+        cv_.wait(lock, [this] {
+          return cancelled_ || started_streams_ == streams_.size() ||
+                 started_streams_ < consumed_streams_ + num_threads_;
+        });
+        if (cancelled_ || started_streams_ == streams_.size()) return;
+        s = started_streams_++;
+      }
+      if (!Read(s)) return;
+    }
+  }
+
+  // Reads stream `s` into its buffer. Returns false if cancelled.
+  bool Read(size_t s) {
+    try {
+      auto source = factories_[s]();
+      while (true) {
+        auto row = source->Next();
+        std::unique_lock<std::mutex> lock(mu_);
+        if (!row) break;
+        cv_.wait(lock, [this, s] {
+          return cancelled_ || streams_[s].rows.size() < kStreamBufferRows;
+        });
+        if (cancelled_) return false;
+        streams_[s].rows.push_back(*std::move(row));
+        cv_.notify_all();
+      }
+    } catch (std::exception const& e) {
+      std::lock_guard<std::mutex> lock(mu_);
+      if (!error_) error_ = e.what();
+    }
+    {
+      std::lock_guard<std::mutex> lock(mu_);
+      streams_[s].finished = true;
+      finished_streams_++;
+    }
+    cv_.notify_all();
+    return true;
+  }
+
+  std::vector<SourceFactory> const factories_;
+  std::mutex mu_;
+  std::condition_variable cv_;
+  std::vector<Stream> streams_;
+  size_t const num_threads_;
+  bool const ordered_;
+  size_t started_streams_ = 0;
+  size_t finished_streams_ = 0;
+  // Number of streams whose rows were all returned. Unordered, it's only
+  // updated once no rows are buffered.
+  size_t consumed_streams_ = 0;
+  size_t next_stream_ = 0;
+  std::optional<std::string> error_;
+  bool cancelled_ = false;
+  std::vector<std::thread> threads_;
+};
+
+// Creates the sources reading each of `row_sets` from Bigtable.
+std::vector<MultiStreamRowSource::SourceFactory> TableSourceFactories(
+    std::shared_ptr<cbt::DataClient> const& data_client,
+    std::string const& table_id,
+    std::optional<std::string> const& app_profile_id,
+    std::vector<cbt::RowSet> row_sets, cbt::Filter const& filter,
+    std::shared_ptr<RateLimiter> const& limiter) {
+  std::vector<MultiStreamRowSource::SourceFactory> res;
+  for (auto& row_set : row_sets) {
+    res.emplace_back(
+        [=, row_set = std::move(row_set)]() -> std::unique_ptr<RowSource> {
+          return std::make_unique<TableRowSource>(
+              data_client, table_id, app_profile_id, row_set, filter, limiter);
+        });
+  }
+  return res;
+}
+
+// Creates the sources reading each of `row_sets` from a MemoryTable.
+std::vector<MultiStreamRowSource::SourceFactory> MemorySourceFactories(
+    std::shared_ptr<MemoryTable const> const& table,
+    std::vector<cbt::RowSet> row_sets, ColumnMap const& column_map) {
+  std::vector<MultiStreamRowSource::SourceFactory> res;
+  for (auto& row_set : row_sets) {
+    res.emplace_back(
+        [=, row_set = std::move(row_set)]() -> std::unique_ptr<RowSource> {
+          return std::make_unique<MemoryRowSource>(table, row_set, column_map);
+        });
+  }
+  return res;
+}
+
+// Counters kept by every BigtableDatasetIterator. The same order is used in
+// the per-dataset tensor to which the iterators publish them, so it has to
+// match `kIteratorMetricNames`.
+enum IteratorMetric {
+  kRows,
+  kCells,
+  kBytes,
+  kStreamWaitNs,
+  kDecodeNs,
+  kFirstRowNs,
+  kNumIteratorMetrics
+};
+
+constexpr std::array<char const*, kNumIteratorMetrics> kIteratorMetricNames = {
+    "rows", "cells", "bytes", "stream_wait_ns", "decode_ns", "first_row_ns"};
+
+// How many rows an iterator reads between publishing its counters.
+constexpr int64_t kMetricsPublishInterval = 1024;
+
+int64_t NanosecondsSince(std::chrono::steady_clock::time_point start) {
+  return std::chrono::duration_cast<std::chrono::nanoseconds>(
+             std::chrono::steady_clock::now() - start)
+      .count();
+}
+
+class IteratorMetrics {
+ public:
+  // Only the iterating thread writes the counters, so a relaxed load and
+  // store is enough and keeps locked instructions out of the hot loop. Other
+  // threads may read them at any time.
+  void Add(IteratorMetric metric, int64_t value) {
+    auto& counter = counters_[metric];
+    counter.store(counter.load(std::memory_order_relaxed) + value,
+                  std::memory_order_relaxed);
+  }
+
+  int64_t Get(IteratorMetric metric) const {
+    return counters_[metric].load(std::memory_order_relaxed);
+  }
+
+  py::dict AsDict() const {
+    py::dict res;
+    for (size_t i = 0; i < kNumIteratorMetrics; i++) {
+      res[kIteratorMetricNames[i]] = Get(static_cast<IteratorMetric>(i));
+    }
+    return res;
+  }
+
+  // Adds the changes since the previous call to `slot`, which is this
+  // worker's row of the tensor shared by all the workers of a dataset. The
+  // time to first row is the maximum over the iterators instead.
+  void Publish(std::optional<torch::Tensor> const& slot) {
+    if (!slot) return;
+    int64_t* values = slot->data_ptr<int64_t>();
+    for (size_t i = 0; i < kNumIteratorMetrics; i++) {
+      int64_t const value = Get(static_cast<IteratorMetric>(i));
+      if (i == kFirstRowNs) {
+        values[i] = std::max(values[i], value);
+      } else {
+        values[i] += value - published_[i];
+      }
+      published_[i] = value;
+    }
+  }
+
+ private:
+  std::array<std::atomic<int64_t>, kNumIteratorMetrics> counters_{};
+  std::array<int64_t, kNumIteratorMetrics> published_{};
+};
+
+class BigtableDatasetIterator {
+ public:
+  BigtableDatasetIterator(std::unique_ptr<RowSource> source,
+                          ColumnMap column_map, torch::Dtype cell_type,
+                          std::optional<py::object> default_value,
+                          std::optional<torch::Tensor> metrics_slot)
+      : created_(std::chrono::steady_clock::now()),
+        column_map_(std::move(column_map)),
+        default_value_(std::move(default_value)),
+        cell_type_(cell_type),
+        metrics_slot_(std::move(metrics_slot)),
+        source_(std::move(source)),
+        batch_start_(created_) {}
+
+  BigtableDatasetIterator(BigtableDatasetIterator const&) = delete;
+  BigtableDatasetIterator& operator=(BigtableDatasetIterator const&) = delete;
+
+  ~BigtableDatasetIterator() { metrics_.Publish(metrics_slot_); }
+
+  torch::Tensor next() {
+    if (finished_) throw py::stop_iteration();
+
+    auto const wait_start = std::chrono::steady_clock::now();
+    std::optional<cbt::Row> row;
+    {
+      py::gil_scoped_release release;
+      do {
+        row = source_->Next();
+      } while (row && !HasRequestedCell(*row, column_map_));
+    }
+    auto const decode_start = std::chrono::steady_clock::now();
+    metrics_.Add(kStreamWaitNs,
+                 std::chrono::duration_cast<std::chrono::nanoseconds>(
+                     decode_start - wait_start)
+                     .count());
+    if (!first_row_seen_) {
+      first_row_seen_ = true;
+      metrics_.Add(kFirstRowNs,
+                   std::chrono::duration_cast<std::chrono::nanoseconds>(
+                       decode_start - created_)
+                       .count());
+      Tracer::Instance().Record("first_row", created_, decode_start);
+    }
+
+    if (!row) {
+      finished_ = true;
+      metrics_.Publish(metrics_slot_);
+      RecordBatchSpan();
+      Tracer::Instance().ExportToTraceDir();
+      throw py::stop_iteration();
+    }
+
+    torch::Tensor tensor =
+        getFilledTensor(this->column_map_.size(), cell_type_, default_value_);
+    int64_t const bytes = RowBytes(*row);
+    int64_t cells = 0;
+    for (const auto& cell : row->cells()) {
+      auto column = column_map_.find(
+          std::make_pair(cell.family_name(), cell.column_qualifier()));
+      if (column == column_map_.end()) continue;
+      PutCellValueInTensor(&tensor, static_cast<int64_t>(column->second),
+                           cell_type_, cell);
+      cells++;
+    }
+    metrics_.Add(kCells, cells);
+    metrics_.Add(kBytes, bytes);
+    metrics_.Add(kDecodeNs, NanosecondsSince(decode_start));
+
+    metrics_.Add(kRows, 1);
+    if (metrics_.Get(kRows) % kMetricsPublishInterval == 0) {
+      metrics_.Publish(metrics_slot_);
+      RecordBatchSpan();
+    }
     return tensor;
   }
 
+  py::dict metrics() const { return metrics_.AsDict(); }
+
  private:
-  static std::map<std::pair<std::string, std::string>, size_t> CreateColumnMap(
-      py::list const& columns) {
-    std::map<std::pair<std::string, std::string>, size_t> column_map;
-    size_t index = 0;
-    for (const auto& column_name : columns) {
-      std::pair<std::string, std::string> pair =
-          ColumnNameToPair(column_name.cast<std::string>());
-      column_map[pair] = index++;
+  // Records a span covering the rows read since the previous one.
+  void RecordBatchSpan() {
+    if (!Tracer::Instance().enabled()) return;
+    auto const now = std::chrono::steady_clock::now();
+    std::vector<std::pair<char const*, int64_t>> args;
+    for (auto metric : {kRows, kCells, kBytes, kStreamWaitNs, kDecodeNs}) {
+      int64_t const value = metrics_.Get(metric);
+      args.emplace_back(kIteratorMetricNames[metric],
+                        value - batch_start_metrics_[metric]);
+      batch_start_metrics_[metric] = value;
     }
-    return column_map;
+    Tracer::Instance().Record("read_batch", batch_start_, now, std::move(args));
+    batch_start_ = now;
   }
 
-  // Mapping between column names and their indices in tensors.  We're using a
-  // regular map because unordered_map cannot hash a pair by default.
-  std::map<std::pair<std::string, std::string>, size_t> column_map_;
-  std::shared_ptr<cbt::DataClient> data_client_;
-  torch::Dtype cell_type_;
+  std::chrono::steady_clock::time_point created_;
+  ColumnMap column_map_;
   std::optional<py::object> default_value_;
-  cbt::RowReader reader_;
-  cbt::v1::internal::RowReaderIterator it_;
+  torch::Dtype cell_type_;
+  IteratorMetrics metrics_;
+  // This worker's row of the dataset's metrics tensor, if any.
+  std::optional<torch::Tensor> metrics_slot_;
+  std::unique_ptr<RowSource> source_;
+  // Start of the span of rows covered by the next "read_batch" span.
+  std::chrono::steady_clock::time_point batch_start_;
+  std::array<int64_t, kNumIteratorMetrics> batch_start_metrics_{};
+  bool first_row_seen_ = false;
+  bool finished_ = false;
+};
+
+// One of the tables of a join: a stream of its rows and how to decode them.
+struct JoinInput {
+  std::unique_ptr<RowSource> source;
+  ColumnMap column_map;
+  torch::Dtype cell_type;
+  std::optional<py::object> default_value;
+};
+
+// Merge-joins the rows of several sources on their row keys. The sources
+// must be read over the same row set, so that the rows come in the same key
+// order. An inner join returns the rows present in all the sources, a left
+// join every row of the first source, with the columns of the missing rows
+// of the others set to their default values. Only the current row of every
+// source is kept in memory. Every result is either a single tensor with the
+// columns of all the sources, of their promoted type, or a tuple of a tensor
+// per source.
+class JoinedIterator {
+ public:
+  JoinedIterator(std::vector<std::shared_ptr<JoinInput>> inputs, bool left,
+                 bool concat)
+      : inputs_(std::move(inputs)),
+        left_(left),
+        concat_(concat),
+        heads_(inputs_.size()),
+        exhausted_(inputs_.size(), false) {
+    if (inputs_.empty()) {
+      throw std::invalid_argument("At least one table must be joined.");
+    }
+    for (auto const& input : inputs_) {
+      if (!input->source) {
+        throw std::invalid_argument("A join input can only be used once.");
+      }
+      sources_.push_back(std::move(input->source));
+    }
+    concat_type_ = inputs_.front()->cell_type;
+    for (auto const& input : inputs_) {
+      concat_type_ = c10::promoteTypes(concat_type_, input->cell_type);
+    }
+  }
+
+  JoinedIterator(JoinedIterator const&) = delete;
+  JoinedIterator& operator=(JoinedIterator const&) = delete;
+
+  py::object next() {
+    if (finished_) throw py::stop_iteration();
+    std::vector<std::optional<cbt::Row>> rows(inputs_.size());
+    {
+      py::gil_scoped_release release;
+      finished_ = !(left_ ? NextLeft(rows) : NextInner(rows));
+    }
+    if (finished_) throw py::stop_iteration();
+
+    std::vector<torch::Tensor> tensors;
+    for (size_t i = 0; i < inputs_.size(); i++) {
+      auto const& input = *inputs_[i];
+      torch::Tensor tensor = getFilledTensor(
+          input.column_map.size(), input.cell_type, input.default_value);
+      if (rows[i]) {
+        for (auto const& cell : rows[i]->cells()) {
+          auto column = input.column_map.find(
+              std::make_pair(cell.family_name(), cell.column_qualifier()));
+          if (column == input.column_map.end()) continue;
+          PutCellValueInTensor(&tensor, static_cast<int64_t>(column->second),
+                               input.cell_type, cell);
+        }
+      }
+      tensors.push_back(concat_ ? tensor.to(concat_type_) : tensor);
+    }
+    if (concat_) return py::cast(torch::cat(tensors));
+    py::tuple res(tensors.size());
+    for (size_t i = 0; i < tensors.size(); i++) res[i] = tensors[i];
+    return std::move(res);
+  }
+
+ private:
+  // Returns the current row of source `i`, or nullptr at its end. Rows
+  // without any of the columns of the source are skipped.
+  cbt::Row* Head(size_t i) {
+    while (!heads_[i] && !exhausted_[i]) {
+      heads_[i] = sources_[i]->Next();
+      exhausted_[i] = !heads_[i];
+      if (heads_[i] && !HasRequestedCell(*heads_[i], inputs_[i]->column_map)) {
+        heads_[i].reset();
+      }
+    }
+    return heads_[i] ? &*heads_[i] : nullptr;
+  }
+
+  // Skips the rows of source `i` with keys smaller than `key` and returns the
+  // first one which is not, or nullptr at the end of the source.
+  cbt::Row* SkipTo(size_t i, std::string const& key) {
+    while (Head(i) && Head(i)->row_key() < key) heads_[i].reset();
+    return Head(i);
+  }
+
+  bool NextLeft(std::vector<std::optional<cbt::Row>>& rows) {
+    if (!Head(0)) return false;
+    std::string const key = Head(0)->row_key();
+    rows[0] = std::move(heads_[0]);
+    heads_[0].reset();
+    for (size_t i = 1; i < sources_.size(); i++) {
+      auto* row = SkipTo(i, key);
+      if (row && row->row_key() == key) {
+        rows[i] = std::move(heads_[i]);
+        heads_[i].reset();
+      }
+    }
+    return true;
+  }
+
+  bool NextInner(std::vector<std::optional<cbt::Row>>& rows) {
+    while (true) {
+      // No row with a key smaller than the largest current key can be in all
+      // the sources.
+      std::string key;
+      for (size_t i = 0; i < sources_.size(); i++) {
+        auto* row = Head(i);
+        if (!row) return false;
+        if (row->row_key() > key) key = row->row_key();
+      }
+      bool matched = true;
+      for (size_t i = 0; i < sources_.size(); i++) {
+        auto* row = SkipTo(i, key);
+        if (!row) return false;
+        matched = matched && row->row_key() == key;
+      }
+      if (!matched) continue;
+      for (size_t i = 0; i < sources_.size(); i++) {
+        rows[i] = std::move(heads_[i]);
+        heads_[i].reset();
+      }
+      return true;
+    }
+  }
+
+  std::vector<std::shared_ptr<JoinInput>> inputs_;
+  std::vector<std::unique_ptr<RowSource>> sources_;
+  bool const left_;
+  bool const concat_;
+  torch::Dtype concat_type_;
+  std::vector<std::optional<cbt::Row>> heads_;
+  std::vector<bool> exhausted_;
+  bool finished_ = false;
+};
+
+// Approximate size in bytes of a tablet, and its keys. An empty `end` is the
+// end of the table.
+struct TabletSize {
+  std::string start;
+  std::string end;
+  int64_t bytes;
+};
+
+// Converts sample_row_keys, whose offsets are the sizes of all the rows
+// before each key, into the sizes of the tablets ending at the keys. The
+// tablets are sorted and disjoint. Unlike in ComputeRowSetForWorker, there's
+// no tablet after a non-empty last key: nothing tells its size. Bigtable's
+// samples end with an empty key, i.e. the end of the table, so this only
+// leaves out the tail of samples set with `set_sample_row_keys`.
+std::vector<TabletSize> TabletSizes(py::list const& sample_row_keys) {
+  std::vector<TabletSize> res;
+  std::string start;
+  int64_t offset = 0;
+  for (auto const& sample : sample_row_keys) {
+    auto const pair = sample.cast<py::tuple>();
+    auto end = pair[0].cast<std::string>();
+    auto const end_offset = pair[1].cast<int64_t>();
+    res.push_back(TabletSize{start, end, end_offset - offset});
+    start = std::move(end);
+    offset = end_offset;
+  }
+  return res;
+}
+
+// Rough size of the stored data of a row of the given columns, used for
+// turning tablet sizes into numbers of rows. Row keys are assumed to be 16
+// bytes long and every cell to take 16 bytes besides its names and value.
+int64_t EstimateRowBytes(ColumnMap const& column_map, torch::Dtype cell_type) {
+  int64_t res = 16;
+  for (auto const& [column, index] : column_map) {
+    res += static_cast<int64_t>(column.first.size() + column.second.size() +
+                                c10::elementSize(cell_type) + 16);
+  }
+  return res;
+}
+
+// Approximate size of a row set: its single keys, and the total size of the
+// tablets its ranges intersect.
+struct RowSetEstimate {
+  int64_t keys = 0;
+  int64_t tablet_bytes = 0;
+
+  // Partially covered tablets are counted whole, so both are overestimated
+  // for short ranges.
+  int64_t Rows(int64_t row_bytes) const {
+    return keys +
+           (tablet_bytes + row_bytes - 1) / std::max<int64_t>(row_bytes, 1);
+  }
+  int64_t Bytes(int64_t row_bytes) const {
+    return tablet_bytes + keys * row_bytes;
+  }
+};
+
+RowSetEstimate EstimateRowSet(cbt::RowSet const& row_set,
+                              std::vector<TabletSize> const& tablets) {
+  RowSetEstimate res;
+  std::vector<bool> counted(tablets.size());
+  for (auto const& interval : RowSetIntervals(row_set)) {
+    if (interval.IsEmpty()) continue;
+    if (interval.end == interval.start + '\0') {
+      res.keys++;
+      continue;
+    }
+    // Like in ComputeRowSetForWorker, binary search rather than check every
+    // tablet. Find the first one which ends after the interval's start.
+    auto const first = std::partition_point(
+        tablets.begin(), tablets.end(), [&interval](TabletSize const& tablet) {
+          return !tablet.end.empty() && tablet.end <= interval.start;
+        });
+    for (auto it = first; it != tablets.end() &&
+                          (interval.end.empty() || it->start < interval.end);
+         ++it) {
+      auto const t = static_cast<size_t>(it - tablets.begin());
+      // Consecutive intervals may share a tablet.
+      if (counted[t]) continue;
+      counted[t] = true;
+      res.tablet_bytes += it->bytes;
+    }
+  }
+  return res;
+}
+
+// Estimates the number of rows in `row_set`, or returns nullopt if the table
+// wasn't sampled.
+std::optional<int64_t> EstimateRows(cbt::RowSet const& row_set,
+                                    std::vector<TabletSize> const& tablets,
+                                    int64_t row_bytes) {
+  if (tablets.empty()) return std::nullopt;
+  return EstimateRowSet(row_set, tablets).Rows(row_bytes);
+}
+
+// Returns the estimated size of the share of every worker of `row_set`, as
+// dicts with `estimated_rows` and `estimated_bytes`.
+py::list EstimateWorkerShares(cbt::RowSet const& row_set,
+                              py::list const& sample_row_keys,
+                              py::list const& columns,
+                              py::object const& cell_type, int num_workers) {
+  auto const tablets = TabletSizes(sample_row_keys);
+  auto const row_bytes =
+      EstimateRowBytes(CreateColumnMap(columns),
+                       torch::python::detail::py_object_to_dtype(cell_type));
+  py::list res;
+  for (int worker_id = 0; worker_id < num_workers; worker_id++) {
+    auto const estimate =
+        EstimateRowSet(ComputeRowSetForWorker(row_set, sample_row_keys,
+                                              num_workers, worker_id),
+                       tablets);
+    py::dict share;
+    share["estimated_rows"] = estimate.Rows(row_bytes);
+    share["estimated_bytes"] = estimate.Bytes(row_bytes);
+    res.append(share);
+  }
+  return res;
+}
+
+// Returns the number of rows left in `source` with any of the columns. Must
+// be called without the GIL held.
+int64_t CountRows(RowSource& source, ColumnMap const& column_map) {
+  int64_t res = 0;
+  while (auto row = source.Next()) {
+    if (HasRequestedCell(*row, column_map)) res++;
+  }
+  return res;
+}
+
+// Largest buffer preallocated by ReadTensor for a partition, in bytes. Row
+// estimates can be far too large, e.g. for a short range inside a big tablet.
+constexpr int64_t kMaxPreallocatedBytes = 64 << 20;
+// Capacity of the buffer of a partition whose size couldn't be estimated.
+constexpr int64_t kDefaultPreallocatedRows = 1024;
+
+// Rows of a partition decoded into a tensor which grows geometrically.
+struct DecodedRows {
+  torch::Tensor values;
+  int64_t num_rows = 0;
+  std::vector<std::string> keys;
+};
+
+void DecodeRows(RowSource& source, ColumnMap const& column_map,
+                torch::Dtype cell_type, torch::Tensor const& default_row,
+                int64_t capacity, bool with_row_keys, DecodedRows& out) {
+  auto const num_columns = static_cast<int64_t>(column_map.size());
+  out.values = default_row.repeat({std::max<int64_t>(capacity, 1), 1});
+  while (auto row = source.Next()) {
+    if (!HasRequestedCell(*row, column_map)) continue;
+    if (out.num_rows == out.values.size(0)) {
+      out.values =
+          torch::cat({out.values, default_row.repeat({out.values.size(0), 1})});
+    }
+    for (auto const& cell : row->cells()) {
+      auto column = column_map.find(
+          std::make_pair(cell.family_name(), cell.column_qualifier()));
+      if (column == column_map.end()) continue;
+      PutCellValueInTensor(
+          &out.values,
+          out.num_rows * num_columns + static_cast<int64_t>(column->second),
+          cell_type, cell);
+    }
+    if (with_row_keys) out.keys.push_back(row->row_key());
+    out.num_rows++;
+  }
+}
+
+// Reads all the rows of the partitions into a single [rows, columns] tensor,
+// in the order of the partitions, and optionally their keys. The partitions
+// are decoded by `num_threads` threads, each into its own buffer
+// preallocated from the partition's estimated size. The buffers are then
+// copied into their slices of the result, or returned as is if there's only
+// one.
+std::pair<torch::Tensor, std::vector<std::string>> ReadTensor(
+    std::vector<MultiStreamRowSource::SourceFactory> const& factories,
+    std::vector<std::optional<int64_t>> const& estimated_rows,
+    ColumnMap const& column_map, torch::Dtype cell_type,
+    torch::Tensor const& default_row, bool with_row_keys, size_t num_threads) {
+  TraceSpan span("read_tensor");
+  auto const num_columns = static_cast<int64_t>(column_map.size());
+  int64_t const max_rows =
+      kMaxPreallocatedBytes /
+      std::max<int64_t>(num_columns * c10::elementSize(cell_type), 1);
+  std::vector<DecodedRows> partitions(factories.size());
+  std::atomic<size_t> next_partition{0};
+  std::mutex mu;
+  std::optional<std::string> error;
+  auto const work = [&] {
+    for (size_t p = next_partition++; p < factories.size();
+         p = next_partition++) {
+      try {
+        auto source = factories[p]();
+        DecodeRows(
+            *source, column_map, cell_type, default_row,
+            std::min(estimated_rows[p].value_or(kDefaultPreallocatedRows),
+                     max_rows),
+            with_row_keys, partitions[p]);
+      } catch (std::exception const& e) {
+        std::lock_guard<std::mutex> lock(mu);
+        if (!error) error = e.what();
+        return;
+      }
+    }
+  };
+  std::vector<std::thread> threads;
+  for (size_t i = 0;
+       i < std::min(std::max<size_t>(num_threads, 1), factories.size()); i++) {
+    threads.emplace_back(work);
+  }
+  for (auto& thread : threads) thread.join();
+  if (error) throw std::runtime_error(*error);
+
+  if (partitions.size() == 1) {
+    auto& partition = partitions.front();
+    return {partition.values.narrow(0, 0, partition.num_rows),
+            std::move(partition.keys)};
+  }
+  int64_t total_rows = 0;
+  for (auto const& partition : partitions) total_rows += partition.num_rows;
+  auto res = torch::empty({total_rows, num_columns},
+                          torch::TensorOptions().dtype(cell_type));
+  std::vector<std::string> keys;
+  int64_t offset = 0;
+  for (auto& partition : partitions) {
+    res.narrow(0, offset, partition.num_rows)
+        .copy_(partition.values.narrow(0, 0, partition.num_rows));
+    offset += partition.num_rows;
+    partition.values = torch::Tensor();
+    std::move(partition.keys.begin(), partition.keys.end(),
+              std::back_inserter(keys));
+  }
+  return {res, std::move(keys)};
+}
+
+// Reads the rows of `row_set` with ReadTensor, from the sources created by
+// `make_factories` for consecutive parts of the row set.
+template <typename MakeFactories>
+py::object ReadTensorFromPartitions(
+    py::list const& sample_row_keys, ColumnMap const& column_map,
+    py::object const& cell_type, cbt::RowSet const& row_set,
+    std::optional<py::object> const& default_value, bool with_row_keys,
+    int num_streams, MakeFactories const& make_factories) {
+  auto const dtype = torch::python::detail::py_object_to_dtype(cell_type);
+  num_streams = std::max(num_streams, 1);
+  auto row_sets =
+      ComputeRowSetsForStreams(row_set, sample_row_keys, 1, 0,
+                               num_streams * kOrderedPartitionsPerStream);
+  auto const tablets = TabletSizes(sample_row_keys);
+  auto const row_bytes = EstimateRowBytes(column_map, dtype);
+  std::vector<std::optional<int64_t>> estimated_rows;
+  for (auto const& partition_row_set : row_sets) {
+    estimated_rows.push_back(
+        EstimateRows(partition_row_set, tablets, row_bytes));
+  }
+  auto const default_row =
+      getFilledTensor(column_map.size(), dtype, default_value);
+  auto const factories = make_factories(std::move(row_sets));
+
+  std::pair<torch::Tensor, std::vector<std::string>> res;
+  {
+    py::gil_scoped_release release;
+    if (factories.empty()) {
+      res.first = default_row.repeat({0, 1});
+    } else {
+      res = ReadTensor(factories, estimated_rows, column_map, dtype,
+                       default_row, with_row_keys, num_streams);
+    }
+  }
+  if (!with_row_keys) return py::cast(res.first);
+  return py::make_tuple(res.first, res.second);
+}
+
+// State of a single `BigtableLookup::Lookup` call, shared with the threads
+// reading its chunks. A hedged request which lost the race may still be
+// running after the call returns, hence the shared ownership.
+struct LookupState {
+  explicit LookupState(size_t num_chunks)
+      : rows(num_chunks),
+        started(num_chunks),
+        attempts(num_chunks, 0),
+        failures(num_chunks, 0),
+        pending(num_chunks) {}
+
+  std::mutex mu;
+  std::condition_variable cv;
+  // Rows of each chunk, set by the first attempt which succeeds.
+  std::vector<std::optional<std::vector<cbt::Row>>> rows;
+  // When a thread picked up the first attempt of each chunk.
+  std::vector<std::optional<std::chrono::steady_clock::time_point>> started;
+  std::vector<int> attempts;
+  std::vector<int> failures;
+  size_t pending;
+  // Set when every attempt of some chunk has failed.
+  std::optional<std::string> error;
+  // Set when the lookup returned or failed, so that the attempts which have
+  // not started yet are skipped.
+  bool abandoned = false;
+};
+
+// Number of threads of a BigtableLookup, i.e. the maximum number of its
+// ReadRows calls in flight.
+constexpr size_t kLookupThreads = 16;
+// Deadline of the ReadRows calls of lookups without a timeout.
+constexpr std::chrono::seconds kLookupRpcTimeout{60};
+
+// Point lookups of many row keys at once. The keys are split into chunks which
+// are read concurrently, each with its own ReadRows call, by a pool of
+// `kLookupThreads` threads. If a chunk did not arrive within `hedge_after` of
+// its request being sent, a duplicate request is sent and whichever finishes
+// first wins. Duplicates go ahead of the queued first attempts, so that they
+// aren't delayed by them, and chunks still waiting for a thread aren't hedged
+// at all. Every call has the deadline of its lookup, so the calls abandoned by
+// a lookup which timed out don't keep running.
+class BigtableLookup {
+ public:
+  BigtableLookup(py::object const& client, std::string const& table_id,
+                 std::optional<std::string> const& app_profile_id)
+      : data_client_(CreateDataClient(client)),
+        table_id_(table_id),
+        app_profile_id_(app_profile_id) {
+    for (size_t i = 0; i < kLookupThreads; i++) {
+      threads_.emplace_back([this] { Work(); });
+    }
+  }
+
+  BigtableLookup(BigtableLookup const&) = delete;
+  BigtableLookup& operator=(BigtableLookup const&) = delete;
+
+  ~BigtableLookup() {
+    {
+      std::lock_guard<std::mutex> lock(mu_);
+      stopping_ = true;
+    }
+    cv_.notify_all();
+    py::gil_scoped_release release;
+    for (auto& thread : threads_) thread.join();
+  }
+
+  py::tuple Lookup(py::list const& keys, py::list const& columns,
+                   py::object cell_type, cbt::Filter const& versions,
+                   std::optional<py::object> const& default_value,
+                   std::optional<double> timeout,
+                   std::optional<double> hedge_after, size_t keys_per_request) {
+    auto const start = std::chrono::steady_clock::now();
+    auto const dtype =
+        torch::python::detail::py_object_to_dtype(std::move(cell_type));
+    ColumnMap column_map = CreateColumnMap(columns);
+    cbt::Filter filter = CreateReadFilter(column_map, versions);
+
+    // Positions of every key in the output. A key may be requested more than
+    // once, but it is only read once.
+    std::unordered_map<std::string, std::vector<size_t>> positions;
+    std::vector<std::vector<std::string>> chunks;
+    size_t index = 0;
+    for (auto const& key_handle : keys) {
+      auto key = key_handle.cast<std::string>();
+      auto& key_positions = positions[key];
+      if (key_positions.empty()) {
+        if (chunks.empty() || chunks.back().size() >= keys_per_request) {
+          chunks.emplace_back();
+        }
+        chunks.back().push_back(std::move(key));
+      }
+      key_positions.push_back(index++);
+    }
+
+    auto state = std::make_shared<LookupState>(chunks.size());
+    std::vector<cbt::RowSet> row_sets(chunks.size());
+    for (size_t i = 0; i < chunks.size(); i++) {
+      for (auto& key : chunks[i]) row_sets[i].Append(std::move(key));
+    }
+
+    {
+      py::gil_scoped_release release;
+      std::unique_lock<std::mutex> lock(state->mu);
+      std::optional<std::chrono::steady_clock::time_point> deadline;
+      if (timeout) deadline = start + ToDuration(*timeout);
+      auto const rpc_deadline = deadline.value_or(start + kLookupRpcTimeout);
+      for (size_t i = 0; i < chunks.size(); i++) {
+        StartAttempt(state, i, row_sets[i], filter, rpc_deadline,
+                     /*hedge=*/false);
+      }
+      auto done = [&state] {
+        return state->pending == 0 || state->error.has_value();
+      };
+      std::vector<bool> hedged(chunks.size(), false);
+      bool finished = true;
+      while (!done()) {
+        // Wakes up at the deadline, at the earliest hedge, or when a chunk
+        // arrives or its first attempt starts.
+        auto wake_at = deadline;
+        if (hedge_after) {
+          auto const now = std::chrono::steady_clock::now();
+          for (size_t i = 0; i < chunks.size(); i++) {
+            if (hedged[i] || state->rows[i] || !state->started[i]) continue;
+            auto const hedge_at = *state->started[i] + ToDuration(*hedge_after);
+            if (hedge_at <= now) {
+              hedged[i] = true;
+              StartAttempt(state, i, row_sets[i], filter, rpc_deadline,
+                           /*hedge=*/true);
+            } else if (!wake_at || hedge_at < *wake_at) {
+              wake_at = hedge_at;
+            }
+          }
+        }
+        if (!wake_at) {
+          state->cv.wait(lock);
+        } else if (state->cv.wait_until(lock, *wake_at) ==
+                       std::cv_status::timeout &&
+                   deadline && std::chrono::steady_clock::now() >= *deadline &&
+                   !done()) {
+          finished = false;
+          break;
+        }
+      }
+      state->abandoned = true;
+      if (!finished) throw std::runtime_error("Lookup deadline exceeded.");
+      if (state->error) throw std::runtime_error(*state->error);
+    }
+
+    auto const num_keys = static_cast<int64_t>(index);
+    auto const num_columns = static_cast<int64_t>(column_map.size());
+    torch::Tensor tensor =
+        getFilledTensor(num_keys * num_columns, dtype, default_value);
+    torch::Tensor found = torch::zeros(num_keys, torch::kBool);
+    bool* found_ptr = found.data_ptr<bool>();
+    for (auto const& chunk_rows : state->rows) {
+      for (auto const& row : *chunk_rows) {
+        if (!HasRequestedCell(row, column_map)) continue;
+        auto const& row_positions = positions[row.row_key()];
+        for (auto const& cell : row.cells()) {
+          auto column = column_map.find(
+              std::make_pair(cell.family_name(), cell.column_qualifier()));
+          if (column == column_map.end()) continue;
+          for (size_t position : row_positions) {
+            PutCellValueInTensor(
+                &tensor,
+                static_cast<int64_t>(position) * num_columns + column->second,
+                dtype, cell);
+          }
+        }
+        for (size_t position : row_positions) found_ptr[position] = true;
+      }
+    }
+    return py::make_tuple(tensor.reshape({num_keys, num_columns}), found);
+  }
+
+ private:
+  static std::chrono::steady_clock::duration ToDuration(double seconds) {
+    return std::chrono::duration_cast<std::chrono::steady_clock::duration>(
+        std::chrono::duration<double>(seconds));
+  }
+
+  // A ReadRows call of one chunk of a lookup.
+  struct Attempt {
+    std::shared_ptr<LookupState> state;
+    size_t chunk;
+    cbt::RowSet row_set;
+    cbt::Filter filter;
+    std::chrono::steady_clock::time_point deadline;
+  };
+
+  // Queues an attempt, at the front if it's a `hedge`. Must be called with
+  // `state->mu` held.
+  void StartAttempt(std::shared_ptr<LookupState> const& state, size_t chunk,
+                    cbt::RowSet row_set, cbt::Filter filter,
+                    std::chrono::steady_clock::time_point deadline,
+                    bool hedge) {
+    state->attempts[chunk]++;
+    {
+      std::lock_guard<std::mutex> lock(mu_);
+      Attempt attempt{state, chunk, std::move(row_set), std::move(filter),
+                      deadline};
+      if (hedge) {
+        queue_.push_front(std::move(attempt));
+      } else {
+        queue_.push_back(std::move(attempt));
+      }
+    }
+    cv_.notify_one();
+  }
+
+  void Work() {
+    while (true) {
+      std::optional<Attempt> attempt;
+      {
+        std::unique_lock<std::mutex> lock(mu_);
+        cv_.wait(lock, [this] { return stopping_ || !queue_.empty(); });
+        if (stopping_) return;
+        attempt = std::move(queue_.front());
+        queue_.pop_front();
+      }
+      auto& state = *attempt->state;
+      auto const chunk = attempt->chunk;
+      {
+        std::lock_guard<std::mutex> lock(state.mu);
+        if (state.abandoned || state.rows[chunk]) continue;
+        if (!state.started[chunk]) {
+          // The lookup hedges the chunk `hedge_after` from now.
+          state.started[chunk] = std::chrono::steady_clock::now();
+          state.cv.notify_all();
+        }
+      }
+
+      std::vector<cbt::Row> rows;
+      std::optional<std::string> error;
+      auto const timeout =
+          std::chrono::duration_cast<std::chrono::milliseconds>(
+              attempt->deadline - std::chrono::steady_clock::now());
+      if (timeout.count() <= 0) {
+        error = "Lookup deadline exceeded.";
+      } else {
+        // The retry policy sets the deadline of the call.
+        auto table = TableWithRetryPolicy(cbt::LimitedTimeRetryPolicy(timeout));
+        for (auto& row : table.ReadRows(std::move(attempt->row_set),
+                                        std::move(attempt->filter))) {
+          if (!row.ok()) {
+            error = row.status().message();
+            break;
+          }
+          rows.emplace_back(*std::move(row));
+        }
+      }
+
+      std::lock_guard<std::mutex> lock(state.mu);
+      if (state.rows[chunk]) continue;
+      if (error) {
+        if (++state.failures[chunk] < state.attempts[chunk]) continue;
+        if (!state.error) state.error = std::move(error);
+      } else {
+        state.rows[chunk] = std::move(rows);
+        state.pending--;
+      }
+      state.cv.notify_all();
+    }
+  }
+
+  cbt::Table TableWithRetryPolicy(
+      cbt::LimitedTimeRetryPolicy const& policy) const {
+    return app_profile_id_
+               ? cbt::Table(data_client_, *app_profile_id_, table_id_, policy)
+               : cbt::Table(data_client_, table_id_, policy);
+  }
+
+  std::shared_ptr<cbt::DataClient> const data_client_;
+  std::string const table_id_;
+  std::optional<std::string> const app_profile_id_;
+
+  std::mutex mu_;
+  std::condition_variable cv_;
+  std::deque<Attempt> queue_;
+  bool stopping_ = false;
+  std::vector<std::thread> threads_;
 };
 
 std::string PrintRowRange(cbt::RowRange const& row_range) {
@@ -454,6 +3238,32 @@ std::string PrintFilter(cbt::Filter const& filter) {
   return res;
 }
 
+// Row sets, ranges and filters are pickled as their protobuf wire format,
+// which is compact and is parsed back without going through Python.
+template <typename Proto>
+py::bytes ProtoToBytes(Proto const& proto) {
+  return py::bytes(proto.SerializeAsString());
+}
+
+template <typename Proto>
+Proto ProtoFromBytes(py::bytes const& data) {
+  Proto proto;
+  if (!proto.ParseFromString(static_cast<std::string>(data))) {
+    throw std::runtime_error("Error parsing a pickled " + proto.GetTypeName() +
+                             ".");
+  }
+  return proto;
+}
+
+cbt::RowSet RowSetFromProto(google::bigtable::v2::RowSet const& proto) {
+  cbt::RowSet res;
+  for (auto const& row_key : proto.row_keys()) res.Append(row_key);
+  for (auto const& range : proto.row_ranges()) {
+    res.Append(cbt::RowRange(range));
+  }
+  return res;
+}
+
 void AppendRowOrRange(cbt::RowSet& row_set, py::args const& args) {
   for (auto const& arg : args) {
     if (py::isinstance<cbt::RowRange>(arg))
@@ -465,6 +3275,417 @@ void AppendRowOrRange(cbt::RowSet& row_set, py::args const& args) {
           "argument must be a row (str) or a range (RowRange)");
   }
 }
+
+// Builds a row set of the given keys and ranges. Keys are sorted and
+// deduplicated, overlapping or touching ranges are merged and keys covered
+// by the ranges are dropped, so that the reader gets the smallest
+// equivalent row set.
+cbt::RowSet BuildRowSet(std::vector<std::string> keys,
+                        std::vector<cbt::RowRange> const& ranges) {
+  std::vector<KeyInterval> intervals;
+  for (auto const& range : ranges) {
+    KeyInterval interval = ToKeyInterval(range.as_proto());
+    if (!interval.IsEmpty()) intervals.push_back(std::move(interval));
+  }
+  auto merged = MergeKeyIntervals(std::move(intervals));
+
+  std::sort(keys.begin(), keys.end());
+  keys.erase(std::unique(keys.begin(), keys.end()), keys.end());
+  keys.erase(std::remove_if(
+                 keys.begin(), keys.end(),
+                 [&merged](std::string const& key) {
+                   auto it = std::upper_bound(
+                       merged.begin(), merged.end(), key,
+                       [](std::string const& k, KeyInterval const& interval) {
+                         return k < interval.start;
+                       });
+                   return it != merged.begin() && std::prev(it)->Contains(key);
+                 }),
+             keys.end());
+
+  cbt::RowSet res;
+  // A row set without any keys or ranges means the whole table, so an empty
+  // set has to be spelled out.
+  if (keys.empty() && merged.empty()) res.Append(cbt::RowRange::Empty());
+  for (auto& key : keys) res.Append(std::move(key));
+  for (auto& interval : merged) {
+    if (interval.end.empty()) {
+      res.Append(cbt::RowRange::StartingAt(std::move(interval.start)));
+    } else {
+      res.Append(cbt::RowRange::RightOpen(std::move(interval.start),
+                                          std::move(interval.end)));
+    }
+  }
+  return res;
+}
+
+// Reads newline-delimited row keys from a file. The file is mapped into
+// memory, so that it is read without extra copies. Empty lines are skipped
+// and "\r\n" line endings are accepted.
+std::vector<std::string> KeysFromFile(std::string const& path) {
+  int fd = open(path.c_str(), O_RDONLY);
+  if (fd < 0) throw std::runtime_error("Error opening " + path);
+  struct stat file_stat {};
+  if (fstat(fd, &file_stat) != 0) {
+    close(fd);
+    throw std::runtime_error("Error reading " + path);
+  }
+  std::vector<std::string> res;
+  auto const size = static_cast<size_t>(file_stat.st_size);
+  if (size == 0) {
+    close(fd);
+    return res;
+  }
+  void* mapped = mmap(nullptr, size, PROT_READ, MAP_PRIVATE, fd, 0);
+  close(fd);
+  if (mapped == MAP_FAILED) throw std::runtime_error("Error reading " + path);
+  auto const* data = static_cast<char const*>(mapped);
+  auto const* end = data + size;
+  while (data < end) {
+    auto const* line_end =
+        static_cast<char const*>(std::memchr(data, '\n', end - data));
+    if (line_end == nullptr) line_end = end;
+    auto const* key_end = line_end;
+    if (key_end > data && key_end[-1] == '\r') key_end--;
+    if (key_end > data) res.emplace_back(data, key_end);
+    data = line_end + 1;
+  }
+  munmap(mapped, size);
+  return res;
+}
+
+cbt::RowSet RowSetFromKeys(py::object const& keys,
+                           std::vector<cbt::RowRange> const& ranges) {
+  auto key_list = KeysFromPython(keys);
+  py::gil_scoped_release release;
+  return BuildRowSet(std::move(key_list), ranges);
+}
+
+cbt::RowSet RowSetFromKeyFile(std::string const& path,
+                              std::vector<cbt::RowRange> const& ranges) {
+  py::gil_scoped_release release;
+  return BuildRowSet(KeysFromFile(path), ranges);
+}
+
+// Sorted and deduplicated row keys, read with `KeyListRowSource`. They are
+// kept outside of Python, so that DataLoader workers inherit them without
+// touching millions of Python objects.
+class KeyList {
+ public:
+  explicit KeyList(std::vector<std::string> keys) : keys_(std::move(keys)) {
+    std::sort(keys_.begin(), keys_.end());
+    keys_.erase(std::unique(keys_.begin(), keys_.end()), keys_.end());
+  }
+
+  static std::shared_ptr<KeyList> FromPython(py::object const& keys) {
+    auto key_list = KeysFromPython(keys);
+    py::gil_scoped_release release;
+    return std::make_shared<KeyList>(std::move(key_list));
+  }
+
+  size_t size() const { return keys_.size(); }
+
+  std::vector<std::string> const& keys() const { return keys_; }
+
+  // Returns the [begin, end) indices of the keys read by `worker_id`. Every
+  // worker gets a consecutive share of the same size, give or take one.
+  std::pair<size_t, size_t> WorkerShare(int num_workers, int worker_id) const {
+    return {keys_.size() * worker_id / num_workers,
+            keys_.size() * (worker_id + 1) / num_workers};
+  }
+
+  cbt::RowSet WorkerRowSet(int num_workers, int worker_id) const {
+    auto [begin, end] = WorkerShare(num_workers, worker_id);
+    cbt::RowSet res;
+    if (begin == end) res.Append(cbt::RowRange::Empty());
+    for (size_t i = begin; i < end; i++) res.Append(keys_[i]);
+    return res;
+  }
+
+ private:
+  std::vector<std::string> keys_;
+};
+
+// Rows of a range of a KeyList, read in chunks of `keys_per_request` keys.
+// Each chunk is a separate ReadRows call, issued by a pool of
+// `max_in_flight` threads. Chunks are returned in the order in which they
+// complete. At most `max_in_flight` chunks are being read, buffered or
+// returned at any time, which bounds the memory regardless of the number of
+// keys.
+class KeyListRowSource : public RowSource {
+ public:
+  KeyListRowSource(std::shared_ptr<cbt::DataClient> const& data_client,
+                   std::string const& table_id,
+                   std::optional<std::string> const& app_profile_id,
+                   std::shared_ptr<KeyList const> keys,
+                   std::pair<size_t, size_t> share, cbt::Filter const& filter,
+                   size_t keys_per_request, size_t max_in_flight,
+                   std::shared_ptr<RateLimiter> limiter = nullptr)
+      : limiter_(std::move(limiter)),
+        keys_(std::move(keys)),
+        begin_(share.first),
+        end_(share.second),
+        keys_per_request_(std::max<size_t>(keys_per_request, 1)),
+        max_in_flight_(std::max<size_t>(max_in_flight, 1)),
+        num_chunks_((end_ - begin_ + keys_per_request_ - 1) /
+                    keys_per_request_) {
+    auto table = CreateTable(data_client, table_id, app_profile_id);
+    for (size_t i = 0; i < std::min(max_in_flight_, num_chunks_); i++) {
+      // Copies of a `cbt::Table` share the connection pool, but a single
+      // instance must not be used from many threads at once.
+      threads_.emplace_back(
+          [this, table = *table, filter]() mutable { Work(table, filter); });
+    }
+  }
+
+  KeyListRowSource(KeyListRowSource const&) = delete;
+  KeyListRowSource& operator=(KeyListRowSource const&) = delete;
+
+  ~KeyListRowSource() override {
+    {
+      std::lock_guard<std::mutex> lock(mu_);
+      cancelled_ = true;
+    }
+    cv_.notify_all();
+    py::gil_scoped_release release;
+    for (auto& thread : threads_) thread.join();
+  }
+
+  std::optional<cbt::Row> Next() override {
+    if (pos_ < current_.size()) return std::move(current_[pos_++]);
+    std::optional<std::string> error;
+    {
+      std::unique_lock<std::mutex> lock(mu_);
+      if (has_current_) {
+        has_current_ = false;
+        slots_--;
+        cv_.notify_all();
+      }
+      // Chunks without any existing rows are skipped.
+      while (true) {
+        if (consumed_ == num_chunks_) return std::nullopt;
+        cv_.wait(lock, [this] { return !completed_.empty() || error_; });
+        if (error_) {
+          error = error_;
+          break;
+        }
+        current_ = std::move(completed_.front());
+        completed_.pop_front();
+        consumed_++;
+        pos_ = 0;
+        if (!current_.empty()) {
+          has_current_ = true;
+          break;
+        }
+        slots_--;
+        cv_.notify_all();
+      }
+    }
+    if (error) throw std::runtime_error(*error);
+    return std::move(current_[pos_++]);
+  }
+
+ private:
+  void Work(cbt::Table& table, cbt::Filter const& filter) {
+    while (true) {
+      size_t chunk;
+      {
+        std::unique_lock<std::mutex> lock(mu_);
+        cv_.wait(lock, [this] {
+          return cancelled_ || error_ || slots_ < max_in_flight_;
+        });
+        if (cancelled_ || error_ || next_chunk_ == num_chunks_) return;
+        chunk = next_chunk_++;
+        slots_++;
+      }
+
+      auto const start = std::chrono::steady_clock::now();
+      size_t const chunk_begin = begin_ + chunk * keys_per_request_;
+      size_t const chunk_end = std::min(end_, chunk_begin + keys_per_request_);
+      cbt::RowSet row_set;
+      for (size_t i = chunk_begin; i < chunk_end; i++) {
+        row_set.Append(keys_->keys()[i]);
+      }
+      std::vector<cbt::Row> rows;
+      std::optional<std::string> error;
+      if (limiter_) limiter_->Acquire(1, 0, 0);
+      for (auto& row : table.ReadRows(std::move(row_set), filter)) {
+        if (!row.ok()) {
+          error = row.status().message();
+          break;
+        }
+        if (limiter_) limiter_->Acquire(0, 1, RowBytes(*row));
+        rows.emplace_back(*std::move(row));
+      }
+      Tracer::Instance().Record(
+          "read_chunk", start, std::chrono::steady_clock::now(),
+          {{"keys", static_cast<int64_t>(chunk_end - chunk_begin)},
+           {"rows", static_cast<int64_t>(rows.size())}});
+
+      {
+        std::lock_guard<std::mutex> lock(mu_);
+        if (error) {
+          if (!error_) error_ = std::move(error);
+        } else {
+          completed_.push_back(std::move(rows));
+        }
+      }
+      cv_.notify_all();
+    }
+  }
+
+  std::shared_ptr<RateLimiter> const limiter_;
+  std::shared_ptr<KeyList const> keys_;
+  size_t const begin_;
+  size_t const end_;
+  size_t const keys_per_request_;
+  size_t const max_in_flight_;
+  size_t const num_chunks_;
+
+  std::mutex mu_;
+  std::condition_variable cv_;
+  // Chunks read, but not yet returned.
+  std::deque<std::vector<cbt::Row>> completed_;
+  // Index of the next chunk to read.
+  size_t next_chunk_ = 0;
+  // Number of chunks taken out of `completed_`.
+  size_t consumed_ = 0;
+  // Number of chunks being read, buffered in `completed_` or in `current_`.
+  size_t slots_ = 0;
+  std::optional<std::string> error_;
+  bool cancelled_ = false;
+  std::vector<std::thread> threads_;
+
+  // Only accessed by the consuming thread.
+  std::vector<cbt::Row> current_;
+  size_t pos_ = 0;
+  bool has_current_ = false;
+};
+
+// Same as EstimateWorkerShares, for a list of keys. Every key is counted as
+// a row, although the ones which don't exist aren't read.
+py::list EstimateKeyListShares(KeyList const& keys, py::list const& columns,
+                               py::object const& cell_type, int num_workers) {
+  auto const row_bytes =
+      EstimateRowBytes(CreateColumnMap(columns),
+                       torch::python::detail::py_object_to_dtype(cell_type));
+  py::list res;
+  for (int worker_id = 0; worker_id < num_workers; worker_id++) {
+    auto const [begin, end] = keys.WorkerShare(num_workers, worker_id);
+    auto const rows = static_cast<int64_t>(end - begin);
+    py::dict share;
+    share["estimated_rows"] = rows;
+    share["estimated_bytes"] = rows * row_bytes;
+    res.append(share);
+  }
+  return res;
+}
+
+// Microbenchmarks of the hot loops, exported as private hooks so that they
+// can be timed from python without a Bigtable instance. Each returns the
+// number of nanoseconds it took.
+
+// Results of the benchmarked calls are stored here, so that the compiler
+// cannot optimize them away.
+volatile double benchmark_sink;
+
+template <typename Func>
+int64_t TimeNanoseconds(Func&& func) {
+  auto const start = std::chrono::steady_clock::now();
+  func();
+  return NanosecondsSince(start);
+}
+
+int64_t BenchmarkBytesToFloat(size_t num_values) {
+  std::vector<std::string> encoded;
+  encoded.reserve(num_values);
+  for (size_t i = 0; i < num_values; i++) {
+    encoded.push_back(FloatToBytes(static_cast<float>(i) / 7));
+  }
+  return TimeNanoseconds([&encoded] {
+    float sum = 0;
+    for (auto const& bytes : encoded) sum += BytesToFloat(bytes);
+    benchmark_sink = sum;
+  });
+}
+
+int64_t BenchmarkDoubleToBytes(size_t num_values) {
+  return TimeNanoseconds([num_values] {
+    size_t size = 0;
+    for (size_t i = 0; i < num_values; i++) {
+      size += DoubleToBytes(static_cast<double>(i) / 7).size();
+    }
+    benchmark_sink = static_cast<double>(size);
+  });
+}
+
+// Encodes every value of `tensor` into a cell value, the same way as the
+// write path.
+int64_t BenchmarkGetTensorValueAsBytes(torch::Tensor const& tensor) {
+  return TimeNanoseconds([&tensor] {
+    EncodedTensor const values(tensor);
+    size_t size = 0;
+    for (int64_t i = 0; i < tensor.size(0); i++) {
+      for (int64_t j = 0; j < tensor.size(1); j++) {
+        size += std::string(values.Value(i, j)).size();
+      }
+    }
+    benchmark_sink = static_cast<double>(size);
+  });
+}
+
+// Decodes every row of `tensor`, encoded as cells, into a new tensor the same
+// way BigtableDatasetIterator does.
+int64_t BenchmarkPutCellValueInTensor(torch::Tensor const& tensor) {
+  EncodedTensor const values(tensor);
+  std::vector<std::vector<cbt::Cell>> rows(tensor.size(0));
+  for (int64_t i = 0; i < tensor.size(0); i++) {
+    for (int64_t j = 0; j < tensor.size(1); j++) {
+      rows[i].emplace_back("row", "fam", "col" + std::to_string(j), 0,
+                           std::string(values.Value(i, j)));
+    }
+  }
+  torch::Dtype const cell_type = tensor.scalar_type();
+  torch::Tensor output = getFilledTensor(tensor.size(1), cell_type, {});
+  return TimeNanoseconds([&rows, &output, cell_type] {
+    for (auto const& cells : rows) {
+      for (size_t j = 0; j < cells.size(); j++) {
+        PutCellValueInTensor(&output, static_cast<int64_t>(j), cell_type,
+                             cells[j]);
+      }
+    }
+  });
+}
+
+int64_t BenchmarkGetFilledTensor(
+    size_t num_tensors, size_t size, py::object const& cell_type,
+    std::optional<py::object> const& default_value) {
+  torch::Dtype const dtype =
+      torch::python::detail::py_object_to_dtype(cell_type);
+  return TimeNanoseconds([num_tensors, size, dtype, &default_value] {
+    int64_t numel = 0;
+    for (size_t i = 0; i < num_tensors; i++) {
+      numel += getFilledTensor(size, dtype, default_value).numel();
+    }
+    benchmark_sink = static_cast<double>(numel);
+  });
+}
+
+// Computes the row_sets of all the workers.
+int64_t BenchmarkComputeRowSetForWorker(cbt::RowSet const& row_set,
+                                        py::list const& sample_row_keys,
+                                        int num_workers) {
+  return TimeNanoseconds([&row_set, &sample_row_keys, num_workers] {
+    size_t empty = 0;
+    for (int worker_id = 0; worker_id < num_workers; worker_id++) {
+      empty += ComputeRowSetForWorker(row_set, sample_row_keys, num_workers,
+                                      worker_id)
+                   .IsEmpty();
+    }
+    benchmark_sink = static_cast<double>(empty);
+  });
+}
+
 }  // namespace
 
 PYBIND11_MODULE(TORCH_EXTENSION_NAME, m) {
@@ -475,27 +3696,489 @@ PYBIND11_MODULE(TORCH_EXTENSION_NAME, m) {
   m.def("write_tensor", &WriteTensor, "write tensor to BigTable",
         py::arg("client"), py::arg("table_id"),
         py::arg("app_profile_id") = py::none(), py::arg("tensor"),
-        py::arg("columns"), py::arg("row_key_list"),
-        py::arg("row_key_generator"));
+        py::arg("columns"), py::arg("row_keys"));
+
+  m.def("write_tensor_by_tablet", &WriteTensorByTablet,
+        "write tensor to BigTable from many threads, grouped by tablet",
+        py::arg("client"), py::arg("table_id"),
+        py::arg("app_profile_id") = py::none(), py::arg("tensor"),
+        py::arg("columns"), py::arg("row_keys"), py::arg("sample_row_keys"),
+        py::arg("concurrency"), py::arg("rows_per_request"),
+        py::arg("max_in_flight_per_tablet"));
+
+  m.def(
+      "read_tensor",
+      [](py::object const& client, std::string const& table_id,
+         std::optional<std::string> const& app_profile_id,
+         py::list const& sample_row_keys, py::list const& columns,
+         py::object const& cell_type, cbt::RowSet const& row_set,
+         cbt::Filter const& versions, std::optional<py::object> default_value,
+         bool with_row_keys, int num_streams) {
+        ColumnMap const column_map = CreateColumnMap(columns);
+        auto data_client = CreateDataClient(client);
+        auto filter = CreateReadFilter(column_map, versions);
+        auto limiter = GetRateLimiter(client);
+        return ReadTensorFromPartitions(
+            sample_row_keys, column_map, cell_type, row_set, default_value,
+            with_row_keys, num_streams, [&](std::vector<cbt::RowSet> row_sets) {
+              return TableSourceFactories(data_client, table_id, app_profile_id,
+                                          std::move(row_sets), filter, limiter);
+            });
+      },
+      "read a row_set from BigTable into a single tensor", py::arg("client"),
+      py::arg("table_id"), py::arg("app_profile_id") = py::none(),
+      py::arg("sample_row_keys"), py::arg("columns"), py::arg("cell_type"),
+      py::arg("row_set"), py::arg("versions"),
+      py::arg("default_value") = py::none(), py::arg("with_row_keys") = false,
+      py::arg("num_streams") = 1);
+  m.def(
+      "read_tensor",
+      [](std::shared_ptr<MemoryTable> const& table,
+         py::list const& sample_row_keys, py::list const& columns,
+         py::object const& cell_type, cbt::RowSet const& row_set,
+         std::optional<py::object> default_value, bool with_row_keys,
+         int num_streams) {
+        ColumnMap const column_map = CreateColumnMap(columns);
+        return ReadTensorFromPartitions(
+            sample_row_keys, column_map, cell_type, row_set, default_value,
+            with_row_keys, num_streams, [&](std::vector<cbt::RowSet> row_sets) {
+              return MemorySourceFactories(table, std::move(row_sets),
+                                           column_map);
+            });
+      },
+      "read a row_set from a MemoryTable into a single tensor",
+      py::arg("table"), py::arg("sample_row_keys"), py::arg("columns"),
+      py::arg("cell_type"), py::arg("row_set"),
+      py::arg("default_value") = py::none(), py::arg("with_row_keys") = false,
+      py::arg("num_streams") = 1);
+
+  m.def("estimate_row_set", &EstimateWorkerShares,
+        "estimated size of the share of every worker of a row_set",
+        py::arg("row_set"), py::arg("sample_row_keys"), py::arg("columns"),
+        py::arg("cell_type"), py::arg("num_workers") = 1);
+  m.def("estimate_keys", &EstimateKeyListShares,
+        "estimated size of the share of every worker of a KeyList",
+        py::arg("keys"), py::arg("columns"), py::arg("cell_type"),
+        py::arg("num_workers") = 1);
+  m.def(
+      "count_rows",
+      [](std::shared_ptr<MemoryTable> const& table, cbt::RowSet const& row_set,
+         py::list const& columns) {
+        auto const column_map = CreateColumnMap(columns);
+        MemoryRowSource source(table, row_set, column_map);
+        py::gil_scoped_release release;
+        return CountRows(source, column_map);
+      },
+      "count the rows of a row_set of a MemoryTable with any of the columns",
+      py::arg("table"), py::arg("row_set"), py::arg("columns"));
+  m.def(
+      "count_rows",
+      [](std::shared_ptr<MemoryTable> const& table,
+         std::shared_ptr<KeyList> const& keys, py::list const& columns) {
+        auto const column_map = CreateColumnMap(columns);
+        MemoryRowSource source(table, keys->WorkerRowSet(1, 0), column_map);
+        py::gil_scoped_release release;
+        return CountRows(source, column_map);
+      },
+      "count the rows of a KeyList in a MemoryTable with any of the columns",
+      py::arg("table"), py::arg("keys"), py::arg("columns"));
+  m.def(
+      "count_rows",
+      [](py::object const& client, std::string const& table_id,
+         std::optional<std::string> const& app_profile_id,
+         cbt::RowSet const& row_set, py::list const& columns,
+         cbt::Filter const& versions) {
+        auto const column_map = CreateColumnMap(columns);
+        TableRowSource source(
+            CreateDataClient(client), table_id, app_profile_id, row_set,
+            CreateKeysOnlyFilter(column_map, versions), GetRateLimiter(client));
+        py::gil_scoped_release release;
+        return CountRows(source, column_map);
+      },
+      "count the rows of a row_set with any of the columns, reading only "
+      "their keys",
+      py::arg("client"), py::arg("table_id"),
+      py::arg("app_profile_id") = py::none(), py::arg("row_set"),
+      py::arg("columns"), py::arg("versions"));
+  m.def(
+      "count_rows",
+      [](py::object const& client, std::string const& table_id,
+         std::optional<std::string> const& app_profile_id,
+         std::shared_ptr<KeyList> const& keys, py::list const& columns,
+         cbt::Filter const& versions, size_t keys_per_request,
+         size_t max_in_flight) {
+        auto const column_map = CreateColumnMap(columns);
+        KeyListRowSource source(
+            CreateDataClient(client), table_id, app_profile_id, keys,
+            {0, keys->size()}, CreateKeysOnlyFilter(column_map, versions),
+            keys_per_request, max_in_flight, GetRateLimiter(client));
+        py::gil_scoped_release release;
+        return CountRows(source, column_map);
+      },
+      "count the rows of a KeyList with any of the columns, reading only "
+      "their keys",
+      py::arg("client"), py::arg("table_id"),
+      py::arg("app_profile_id") = py::none(), py::arg("keys"),
+      py::arg("columns"), py::arg("versions"), py::arg("keys_per_request"),
+      py::arg("max_in_flight"));
+
+  py::class_<KeyChunkIterator>(m, "KeyScanner")
+      .def(py::init([](py::object const& client, std::string const& table_id,
+                       std::optional<std::string> const& app_profile_id,
+                       py::list const& sample_row_keys,
+                       cbt::RowSet const& row_set, int num_workers,
+                       int worker_id, size_t chunk_size,
+                       std::string const& output) {
+             auto source = std::make_unique<TableRowSource>(
+                 CreateDataClient(client), table_id, app_profile_id,
+                 ComputeRowSetForWorker(row_set, sample_row_keys, num_workers,
+                                        worker_id),
+                 CreateKeysOnlyFilter({}, cbt::Filter::PassAllFilter()),
+                 GetRateLimiter(client, num_workers));
+             return std::make_unique<KeyChunkIterator>(std::move(source),
+                                                       chunk_size, output);
+           }),
+           "iterate over the keys of a row_set in chunks", py::arg("client"),
+           py::arg("table_id"), py::arg("app_profile_id") = py::none(),
+           py::arg("sample_row_keys"), py::arg("row_set"),
+           py::arg("num_workers"), py::arg("worker_id"), py::arg("chunk_size"),
+           py::arg("output"))
+      .def(py::init([](std::shared_ptr<MemoryTable> const& table,
+                       py::list const& sample_row_keys,
+                       cbt::RowSet const& row_set, int num_workers,
+                       int worker_id, size_t chunk_size,
+                       std::string const& output) {
+             auto source = std::make_unique<MemoryRowSource>(
+                 table,
+                 ComputeRowSetForWorker(row_set, sample_row_keys, num_workers,
+                                        worker_id),
+                 ColumnMap(), true);
+             return std::make_unique<KeyChunkIterator>(std::move(source),
+                                                       chunk_size, output);
+           }),
+           "iterate over the keys of a row_set of a MemoryTable in chunks",
+           py::arg("table"), py::arg("sample_row_keys"), py::arg("row_set"),
+           py::arg("num_workers"), py::arg("worker_id"), py::arg("chunk_size"),
+           py::arg("output"))
+      .def("__iter__",
+           [](KeyChunkIterator& it) -> KeyChunkIterator& { return it; })
+      .def("__next__", &KeyChunkIterator::next);
 
   py::class_<BigtableDatasetIterator>(m, "Iterator")
-      .def(py::init<py::object, std::string, std::optional<std::string>,
-                    py::list, py::list, py::object, cbt::RowSet const&,
-                    cbt::Filter, std::optional<py::object>, int, int>(),
+      .def(py::init([](py::object const& client, std::string const& table_id,
+                       std::optional<std::string> const& app_profile_id,
+                       py::list const& sample_row_keys, py::list const& columns,
+                       py::object const& cell_type, cbt::RowSet const& row_set,
+                       cbt::Filter const& versions,
+                       std::optional<py::object> default_value, int num_workers,
+                       int worker_id, std::optional<torch::Tensor> metrics_slot,
+                       int num_streams, bool ordered) {
+             ColumnMap column_map = CreateColumnMap(columns);
+             auto data_client = CreateDataClient(client);
+             auto filter = CreateReadFilter(column_map, versions);
+             auto limiter = GetRateLimiter(client, num_workers);
+             std::unique_ptr<RowSource> source;
+             if (num_streams <= 1) {
+               source = std::make_unique<TableRowSource>(
+                   data_client, table_id, app_profile_id,
+                   ComputeRowSetForWorker(row_set, sample_row_keys, num_workers,
+                                          worker_id),
+                   filter, limiter);
+             } else {
+               auto factories = TableSourceFactories(
+                   data_client, table_id, app_profile_id,
+                   ComputeRowSetsForStreams(
+                       row_set, sample_row_keys, num_workers, worker_id,
+                       ordered ? num_streams * kOrderedPartitionsPerStream
+                               : num_streams),
+                   filter, limiter);
+               source = std::make_unique<MultiStreamRowSource>(
+                   std::move(factories), num_streams, ordered);
+             }
+             return std::make_unique<BigtableDatasetIterator>(
+                 std::move(source), std::move(column_map),
+                 torch::python::detail::py_object_to_dtype(cell_type),
+                 std::move(default_value), std::move(metrics_slot));
+           }),
            "get BigTable ReadRows iterator", py::arg("client"),
            py::arg("table_id"), py::arg("app_profile_id") = py::none(),
            py::arg("sample_row_keys"), py::arg("columns"), py::arg("cell_type"),
            py::arg("row_set"), py::arg("versions"),
            py::arg("default_value") = py::none(), py::arg("num_workers"),
-           py::arg("worker_id"))
+           py::arg("worker_id"), py::arg("metrics_slot") = py::none(),
+           py::arg("num_streams") = 1, py::arg("ordered") = false)
+      .def(py::init([](std::shared_ptr<MemoryTable> const& table,
+                       py::list const& sample_row_keys, py::list const& columns,
+                       py::object const& cell_type, cbt::RowSet const& row_set,
+                       std::optional<py::object> default_value, int num_workers,
+                       int worker_id, std::optional<torch::Tensor> metrics_slot,
+                       int num_streams, bool ordered) {
+             ColumnMap column_map = CreateColumnMap(columns);
+             std::unique_ptr<RowSource> source;
+             if (num_streams <= 1) {
+               source = std::make_unique<MemoryRowSource>(
+                   table,
+                   ComputeRowSetForWorker(row_set, sample_row_keys, num_workers,
+                                          worker_id),
+                   column_map);
+             } else {
+               auto factories = MemorySourceFactories(
+                   table,
+                   ComputeRowSetsForStreams(
+                       row_set, sample_row_keys, num_workers, worker_id,
+                       ordered ? num_streams * kOrderedPartitionsPerStream
+                               : num_streams),
+                   column_map);
+               source = std::make_unique<MultiStreamRowSource>(
+                   std::move(factories), num_streams, ordered);
+             }
+             return std::make_unique<BigtableDatasetIterator>(
+                 std::move(source), std::move(column_map),
+                 torch::python::detail::py_object_to_dtype(cell_type),
+                 std::move(default_value), std::move(metrics_slot));
+           }),
+           "get an iterator over rows of a MemoryTable", py::arg("table"),
+           py::arg("sample_row_keys"), py::arg("columns"), py::arg("cell_type"),
+           py::arg("row_set"), py::arg("default_value") = py::none(),
+           py::arg("num_workers"), py::arg("worker_id"),
+           py::arg("metrics_slot") = py::none(), py::arg("num_streams") = 1,
+           py::arg("ordered") = false)
+      .def(py::init(
+               [](py::object const& client, std::string const& table_id,
+                  std::optional<std::string> const& app_profile_id,
+                  std::shared_ptr<KeyList> const& keys, py::list const& columns,
+                  py::object const& cell_type, cbt::Filter const& versions,
+                  std::optional<py::object> default_value, int num_workers,
+                  int worker_id, size_t keys_per_request, size_t max_in_flight,
+                  std::optional<torch::Tensor> metrics_slot) {
+                 ColumnMap column_map = CreateColumnMap(columns);
+                 auto source = std::make_unique<KeyListRowSource>(
+                     CreateDataClient(client), table_id, app_profile_id, keys,
+                     keys->WorkerShare(num_workers, worker_id),
+                     CreateReadFilter(column_map, versions), keys_per_request,
+                     max_in_flight, GetRateLimiter(client, num_workers));
+                 return std::make_unique<BigtableDatasetIterator>(
+                     std::move(source), std::move(column_map),
+                     torch::python::detail::py_object_to_dtype(cell_type),
+                     std::move(default_value), std::move(metrics_slot));
+               }),
+           "get an iterator reading a list of keys in chunks",
+           py::arg("client"), py::arg("table_id"),
+           py::arg("app_profile_id") = py::none(), py::arg("keys"),
+           py::arg("columns"), py::arg("cell_type"), py::arg("versions"),
+           py::arg("default_value") = py::none(), py::arg("num_workers"),
+           py::arg("worker_id"), py::arg("keys_per_request"),
+           py::arg("max_in_flight"), py::arg("metrics_slot") = py::none())
+      .def(py::init([](std::shared_ptr<MemoryTable> const& table,
+                       std::shared_ptr<KeyList> const& keys,
+                       py::list const& columns, py::object const& cell_type,
+                       std::optional<py::object> default_value, int num_workers,
+                       int worker_id,
+                       std::optional<torch::Tensor> metrics_slot) {
+             ColumnMap column_map = CreateColumnMap(columns);
+             auto source = std::make_unique<MemoryRowSource>(
+                 table, keys->WorkerRowSet(num_workers, worker_id), column_map);
+             return std::make_unique<BigtableDatasetIterator>(
+                 std::move(source), std::move(column_map),
+                 torch::python::detail::py_object_to_dtype(cell_type),
+                 std::move(default_value), std::move(metrics_slot));
+           }),
+           "get an iterator over a list of keys of a MemoryTable",
+           py::arg("table"), py::arg("keys"), py::arg("columns"),
+           py::arg("cell_type"), py::arg("default_value") = py::none(),
+           py::arg("num_workers"), py::arg("worker_id"),
+           py::arg("metrics_slot") = py::none())
       .def("__iter__",
            [](BigtableDatasetIterator& it) -> BigtableDatasetIterator& {
              return it;
            })
-      .def("__next__", &BigtableDatasetIterator::next);
+      .def("__next__", &BigtableDatasetIterator::next)
+      .def("metrics", &BigtableDatasetIterator::metrics,
+           "counters of rows, cells and bytes read and of nanoseconds spent "
+           "waiting for the stream and decoding");
+
+  py::class_<JoinInput, std::shared_ptr<JoinInput>>(m, "JoinInput")
+      .def(py::init([](py::object const& client, std::string const& table_id,
+                       std::optional<std::string> const& app_profile_id,
+                       cbt::RowSet const& row_set, py::list const& columns,
+                       py::object const& cell_type, cbt::Filter const& versions,
+                       std::optional<py::object> default_value,
+                       int num_workers) {
+             ColumnMap column_map = CreateColumnMap(columns);
+             auto source = std::make_unique<TableRowSource>(
+                 CreateDataClient(client), table_id, app_profile_id, row_set,
+                 CreateReadFilter(column_map, versions),
+                 GetRateLimiter(client, num_workers));
+             return std::make_shared<JoinInput>(
+                 JoinInput{std::move(source), std::move(column_map),
+                           torch::python::detail::py_object_to_dtype(cell_type),
+                           std::move(default_value)});
+           }),
+           "a table read by a JoinedIterator", py::arg("client"),
+           py::arg("table_id"), py::arg("app_profile_id") = py::none(),
+           py::arg("row_set"), py::arg("columns"), py::arg("cell_type"),
+           py::arg("versions"), py::arg("default_value") = py::none(),
+           py::arg("num_workers") = 1)
+      .def(py::init([](std::shared_ptr<MemoryTable> const& table,
+                       cbt::RowSet const& row_set, py::list const& columns,
+                       py::object const& cell_type,
+                       std::optional<py::object> default_value) {
+             ColumnMap column_map = CreateColumnMap(columns);
+             auto source =
+                 std::make_unique<MemoryRowSource>(table, row_set, column_map);
+             return std::make_shared<JoinInput>(
+                 JoinInput{std::move(source), std::move(column_map),
+                           torch::python::detail::py_object_to_dtype(cell_type),
+                           std::move(default_value)});
+           }),
+           "a MemoryTable read by a JoinedIterator", py::arg("table"),
+           py::arg("row_set"), py::arg("columns"), py::arg("cell_type"),
+           py::arg("default_value") = py::none());
+
+  py::class_<JoinedIterator>(m, "JoinedIterator")
+      .def(py::init<std::vector<std::shared_ptr<JoinInput>>, bool, bool>(),
+           "merge-join the rows of several tables on their row keys",
+           py::arg("inputs"), py::arg("left"), py::arg("concat"))
+      .def("__iter__", [](JoinedIterator& it) -> JoinedIterator& { return it; })
+      .def("__next__", &JoinedIterator::next);
+
+  m.def(
+      "_tracer_enable",
+      [](std::optional<std::string> trace_dir, int worker_id,
+         std::string run_id) {
+        Tracer::Instance().Enable(std::move(trace_dir), worker_id,
+                                  std::move(run_id));
+      },
+      "start recording trace spans", py::arg("trace_dir") = py::none(),
+      py::arg("worker_id") = -1, py::arg("run_id") = "");
+  m.def(
+      "_tracer_disable", []() { Tracer::Instance().Disable(); },
+      "stop recording trace spans");
+  m.def(
+      "_tracer_enabled", []() { return Tracer::Instance().enabled(); },
+      "whether trace spans are being recorded");
+  m.def(
+      "_tracer_export",
+      [](std::string const& path) { Tracer::Instance().Export(path); },
+      "write recorded trace spans to a file in Chrome trace format",
+      py::arg("path"));
+  m.def(
+      "_tracer_clear", []() { Tracer::Instance().Clear(); },
+      "discard recorded trace spans");
+
+  py::tuple metric_names(static_cast<size_t>(kNumIteratorMetrics));
+  for (size_t i = 0; i < kNumIteratorMetrics; i++) {
+    metric_names[i] = kIteratorMetricNames[i];
+  }
+  m.attr("_iterator_metrics") = metric_names;
+
+  py::class_<KeyList, std::shared_ptr<KeyList>>(m, "KeyList")
+      .def(py::init(&KeyList::FromPython), py::arg("keys"))
+      .def("__len__", &KeyList::size)
+      .def(py::pickle(
+          [](KeyList const& keys) {
+            google::bigtable::v2::RowSet proto;
+            for (auto const& key : keys.keys()) proto.add_row_keys(key);
+            return ProtoToBytes(proto);
+          },
+          [](py::bytes const& data) {
+            auto proto = ProtoFromBytes<google::bigtable::v2::RowSet>(data);
+            auto& row_keys = *proto.mutable_row_keys();
+            return std::make_shared<KeyList>(std::vector<std::string>(
+                std::make_move_iterator(row_keys.begin()),
+                std::make_move_iterator(row_keys.end())));
+          }));
+
+  py::class_<MemoryTable, std::shared_ptr<MemoryTable>>(m, "MemoryTable")
+      .def(py::init<>())
+      .def("write_tensor", &MemoryTable::WriteTensor,
+           "store a tensor the same way write_tensor stores it in BigTable",
+           py::arg("tensor"), py::arg("columns"), py::arg("row_keys"))
+      .def("sample_row_keys", &MemoryTable::SampleRowKeys,
+           "sample_row_keys as if every `rows_per_tablet` rows were a tablet",
+           py::arg("rows_per_tablet"))
+      .def("save", &MemoryTable::Save, "write the table to a file",
+           py::arg("path"))
+      .def_static("load", &MemoryTable::Load, "read a table from a file",
+                  py::arg("path"))
+      .def("columns", &MemoryTable::Columns,
+           "columns present in the first `rows_limit` rows of a row set",
+           py::arg("row_set"), py::arg("rows_limit"))
+      .def("__len__", &MemoryTable::size)
+      .def_property_readonly("synced_micros", &MemoryTable::synced_micros,
+                             "start of the last sync as a snapshot, if any")
+      .def(py::pickle(
+          [](MemoryTable const& table) { return table.Serialize(); },
+          [](py::bytes const& data) {
+            return MemoryTable::Deserialize(static_cast<std::string>(data));
+          }));
+
+  m.def("sync_snapshot", &SyncSnapshot,
+        "Merge the cells of a table changed since the last sync into a "
+        "MemoryTable",
+        py::arg("client"), py::arg("table_id"),
+        py::arg("app_profile_id") = py::none(), py::arg("snapshot"),
+        py::arg("row_set"), py::arg("columns"), py::arg("wildcards"),
+        py::arg("overlap_micros"));
+
+  m.def("discover_columns", &DiscoverColumns,
+        "Find columns matching (family, qualifier prefix) patterns in the "
+        "first rows of a row set",
+        py::arg("client"), py::arg("table_id"),
+        py::arg("app_profile_id") = py::none(), py::arg("row_set"),
+        py::arg("patterns"), py::arg("rows_limit"));
+
+  py::class_<RowKeyGenerator>(m, "RowKeyGenerator")
+      .def(py::init<std::string const&, int64_t, std::optional<int64_t>,
+                    std::optional<int64_t>>(),
+           py::arg("format"), py::arg("start") = 0,
+           py::arg("column") = py::none(), py::arg("salt_buckets") = py::none())
+      .def(
+          "generate",
+          [](RowKeyGenerator const& generator, torch::Tensor const& tensor,
+             int64_t offset) { return generator.Generate(tensor, offset); },
+          "keys of the rows of a tensor", py::arg("tensor"),
+          py::arg("offset") = 0);
+
+  py::class_<BigtableWriter>(m, "Writer")
+      .def(py::init<py::object const&, std::string const&,
+                    std::optional<std::string> const&, py::list const&, size_t,
+                    size_t, std::optional<double>, size_t>(),
+           "Open a writer buffering rows and writing them in the background",
+           py::arg("client"), py::arg("table_id"),
+           py::arg("app_profile_id") = py::none(), py::arg("columns"),
+           py::arg("max_rows"), py::arg("max_bytes"),
+           py::arg("flush_interval") = py::none(), py::arg("concurrency"))
+      .def("append", &BigtableWriter::Append,
+           "Queue the rows of a tensor for writing", py::arg("tensor"),
+           py::arg("row_keys"))
+      .def("flush", &BigtableWriter::Flush,
+           "Write all the queued rows and raise errors of previous writes")
+      .def("close", &BigtableWriter::Close, "Flush and stop the writer")
+      .def_property_readonly("rows_written", &BigtableWriter::rows_written);
+
+  py::class_<BigtableLookup>(m, "Lookup")
+      .def(py::init<py::object, std::string, std::optional<std::string>>(),
+           "create a session for point lookups in BigTable", py::arg("client"),
+           py::arg("table_id"), py::arg("app_profile_id") = py::none())
+      .def("lookup", &BigtableLookup::Lookup,
+           "read given row_keys into a tensor in request order",
+           py::arg("keys"), py::arg("columns"), py::arg("cell_type"),
+           py::arg("versions"), py::arg("default_value") = py::none(),
+           py::arg("timeout") = py::none(), py::arg("hedge_after") = py::none(),
+           py::arg("keys_per_request"));
 
   // NOLINTNEXTLINE(bugprone-unused-raii)
-  py::class_<cbt::RowRange>(m, "RowRange").def("__repr__", &PrintRowRange);
+  py::class_<cbt::RowRange>(m, "RowRange")
+      .def("__repr__", &PrintRowRange)
+      .def(py::pickle(
+          [](cbt::RowRange const& row_range) {
+            return ProtoToBytes(row_range.as_proto());
+          },
+          [](py::bytes const& data) {
+            return cbt::RowRange(
+                ProtoFromBytes<google::bigtable::v2::RowRange>(data));
+          }));
 
   m.def("infinite_row_range", &cbt::RowRange::InfiniteRange,
         "Create an infinite row range");
@@ -529,9 +4212,33 @@ PYBIND11_MODULE(TORCH_EXTENSION_NAME, m) {
       .def("append", &AppendRowOrRange)
       .def("intersect", &cbt::RowSet::Intersect, py::arg("row_range"))
       .def("is_empty", &cbt::RowSet::IsEmpty)
-      .def("__repr__", &PrintRowSet);
+      .def("__repr__", &PrintRowSet)
+      .def(py::pickle(
+          [](cbt::RowSet const& row_set) {
+            return ProtoToBytes(row_set.as_proto());
+          },
+          [](py::bytes const& data) {
+            return RowSetFromProto(
+                ProtoFromBytes<google::bigtable::v2::RowSet>(data));
+          }));
+
+  m.def("row_set_from_keys", &RowSetFromKeys,
+        "Create a row set of sorted and deduplicated keys and merged ranges",
+        py::arg("keys"), py::arg("ranges"));
+  m.def("row_set_from_key_file", &RowSetFromKeyFile,
+        "Create a row set of keys read from a newline-delimited file",
+        py::arg("path"), py::arg("ranges"));
 
-  py::class_<cbt::Filter>(m, "Filter").def("__repr__", &PrintFilter);
+  py::class_<cbt::Filter>(m, "Filter")
+      .def("__repr__", &PrintFilter)
+      .def(py::pickle(
+          [](cbt::Filter const& filter) {
+            return ProtoToBytes(filter.as_proto());
+          },
+          [](py::bytes const& data) {
+            return cbt::Filter(
+                ProtoFromBytes<google::bigtable::v2::RowFilter>(data));
+          }));
 
   m.def("latest_version_filter", &cbt::Filter::Latest, py::arg("n"));
   m.def("timestamp_range_micros", &cbt::Filter::TimestampRangeMicros,
@@ -551,4 +4258,49 @@ PYBIND11_MODULE(TORCH_EXTENSION_NAME, m) {
         "chunk of work.",
         py::arg("row_set"), py::arg("sample_row_keys"), py::arg("num_workers"),
         py::arg("worker_id"));
+
+  m.def(
+      "_columns_filter",
+      [](py::list const& columns) {
+        return CreateColumnsFilter(CreateColumnMap(columns));
+      },
+      "Create the filter used to read the given columns", py::arg("columns"));
+
+  m.def(
+      "_encode_tensor",
+      [](torch::Tensor const& tensor) {
+        EncodedTensor const values(tensor);
+        py::list rows;
+        for (int64_t i = 0; i < tensor.size(0); i++) {
+          py::list row;
+          for (int64_t j = 0; j < tensor.size(1); j++) {
+            row.append(py::bytes(std::string(values.Value(i, j))));
+          }
+          rows.append(row);
+        }
+        return rows;
+      },
+      "Cell values of the values of a 2D tensor, for tests.",
+      py::arg("tensor"));
+
+  m.def("_benchmark_bytes_to_float", &BenchmarkBytesToFloat,
+        "Nanoseconds taken by decoding `num_values` floats.",
+        py::arg("num_values"));
+  m.def("_benchmark_double_to_bytes", &BenchmarkDoubleToBytes,
+        "Nanoseconds taken by encoding `num_values` doubles.",
+        py::arg("num_values"));
+  m.def("_benchmark_get_tensor_value_as_bytes", &BenchmarkGetTensorValueAsBytes,
+        "Nanoseconds taken by encoding every value of a 2D tensor.",
+        py::arg("tensor"));
+  m.def("_benchmark_put_cell_value_in_tensor", &BenchmarkPutCellValueInTensor,
+        "Nanoseconds taken by decoding every row of a 2D tensor from cells.",
+        py::arg("tensor"));
+  m.def("_benchmark_get_filled_tensor", &BenchmarkGetFilledTensor,
+        "Nanoseconds taken by creating `num_tensors` tensors.",
+        py::arg("num_tensors"), py::arg("size"), py::arg("cell_type"),
+        py::arg("default_value") = py::none());
+  m.def("_benchmark_compute_row_set_for_worker",
+        &BenchmarkComputeRowSetForWorker,
+        "Nanoseconds taken by computing the row_sets of all the workers.",
+        py::arg("row_set"), py::arg("sample_row_keys"), py::arg("num_workers"));
 }
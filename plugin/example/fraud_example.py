@@ -97,21 +97,11 @@ def train_model(model, loader, optimizer, loss_fn, epochs=20):
                f"{total_prec / batch_counter :.4f}")
 
 
-def eval_model(model, loader):
+def eval_model(model, data):
   model.eval()
   with torch.no_grad():
-    y_all = None
-    y_pred_all = None
-    for batch in loader:
-      X, y = batch[:, :-1], batch[:, -1]
-      y_pred = model(X)
-      if y_all is None:
-        y_all = y
-        y_pred_all = y_pred
-      else:
-        y_all = torch.cat((y_all, y), 0)
-        y_pred_all = torch.cat((y_pred_all, y_pred), 0)
-
+    X, y = data[:, :-1], data[:, -1]
+    y_pred = model(X)
     print(f"average precision: {average_precision_score(y, y_pred)}")
 
 
@@ -132,11 +122,12 @@ def main(args):
                                     pbt.row_set.from_rows_or_ranges(
                                       pbt.row_range.infinite()))
 
-  test_set = test_table.read_rows(torch.float32, ["cf1:" + column for column in
-                                                  INPUT_FEATURES] + [
-                                    "cf1:" + OUTPUT_FEATURE],
-                                  pbt.row_set.from_rows_or_ranges(
-                                    pbt.row_range.infinite()))
+  test_set = test_table.read_tensor(torch.float32,
+                                    ["cf1:" + column for column in
+                                     INPUT_FEATURES] + [
+                                      "cf1:" + OUTPUT_FEATURE],
+                                    pbt.row_set.from_rows_or_ranges(
+                                      pbt.row_range.infinite()))
 
   print("creating a model")
   model = create_model()
@@ -147,17 +138,15 @@ def main(args):
                                              num_workers=5)
   optimizer = torch.optim.Adam(model.parameters(), lr=learning_rate)
 
-  test_loader = torch.utils.data.DataLoader(test_set, batch_size=batch_size)
-
   print("initial testing")
-  eval_model(model=model, loader=test_loader)
+  eval_model(model=model, data=test_set)
 
   print("training")
   train_model(model=model, loader=train_loader, optimizer=optimizer,
               loss_fn=torch.nn.BCELoss(), epochs=20)
 
   print("testing after training")
-  eval_model(model=model, loader=test_loader)
+  eval_model(model=model, data=test_set)
 
 
 def parse_arguments():
@@ -15,7 +15,9 @@
 """Connector for BigTable"""
 from .bigtable_dataset import *
 from . import pbt_C
+from . import row_keys
 from . import row_range
 from . import row_set
+from . import tracing
 from . import version_filters
 
@@ -13,10 +13,118 @@
 # limitations under the License.
 
 """Module containing core functionality of pytorch bigtable dataset"""
+import json
+import os
+import threading
+import time
+import uuid
+import weakref
 import torch
 from . import pbt_C
-from typing import List, Union, Callable
+from typing import Dict, List, Union, Callable, Tuple
 import pytorch_bigtable.version_filters as filters
+from . import tracing
+
+# sample_row_keys shared by all BigtableTable handles in this process. Maps a
+# table identifier to a tuple of (time fetched, sample_row_keys).
+_sample_row_keys_cache = {}
+_sample_row_keys_cache_lock = threading.Lock()
+# Held while a table is being sampled, one per table identifier, so that
+# concurrent misses send a single request.
+_sample_row_keys_fill_locks = {}
+
+# Number of workers whose metrics can be collected by a dataset. Workers with
+# higher ids don't report their metrics.
+_MAX_METRICS_WORKERS = 256
+
+# Datasets whose metrics are not in shared memory yet. They're moved there
+# right before this process forks, e.g. to start DataLoader workers, so that
+# datasets read by a single process don't allocate any shared memory.
+_unshared_metrics_datasets = weakref.WeakSet()
+
+
+def _share_metrics_before_fork():
+  for dataset in list(_unshared_metrics_datasets):
+    dataset._share_metrics()
+
+
+os.register_at_fork(before=_share_metrics_before_fork)
+
+
+def _check_write_tensor_args(tensor: torch.Tensor, columns: List[str],
+                             row_keys) -> None:
+  """Raises ValueError if the arguments of `write_tensor` don't match."""
+  if tensor.dim() != 2:
+    raise ValueError("`tensor` must have exactly two dimensions")
+
+  if not isinstance(row_keys, pbt_C.RowKeyGenerator) and not callable(
+      row_keys) and len(row_keys) != tensor.shape[0]:
+    raise ValueError("`row_keys` must have the same length as tensor.shape[0]")
+
+  if len(columns) != tensor.shape[1]:
+    raise ValueError("`columns` must have the same length as tensor.shape[1]")
+
+  for i, column_id in enumerate(columns):
+    if len(column_id.split(":")) != 2:
+      raise ValueError(f"`columns[{i}]` must be a string in format:"
+                       " \"column_family:column_name\"")
+
+
+def _check_scan_keys_args(chunk_size: int, output: str) -> None:
+  """Raises ValueError if the arguments of `scan_keys` are invalid."""
+  if chunk_size < 1:
+    raise ValueError("`chunk_size` must be positive")
+  if output not in ("numpy", "offsets"):
+    raise ValueError("`output` must be \"numpy\" or \"offsets\"")
+
+
+def _key_list(keys) -> pbt_C.KeyList:
+  """Converts row keys accepted by `read_keys` to a `pbt_C.KeyList`."""
+  if isinstance(keys, pbt_C.KeyList):
+    return keys
+  return pbt_C.KeyList(keys)
+
+
+def _parse_wildcard(column: str) -> Union[Tuple[str, str], None]:
+  """Returns the family and qualifier prefix of a wildcard column, or None
+  if `column` is not a wildcard."""
+  family, _, qualifier = column.partition(":")
+  if not qualifier.endswith("*"):
+    return None
+  return family, qualifier[:-1]
+
+
+def _resolve_columns(table, columns: List[str], row_set: pbt_C.RowSet,
+                     schema_row_key: Union[str, None],
+                     discovery_rows: int) -> List[str]:
+  """Expands the wildcards in `columns`. See `BigtableTable.read_rows`."""
+  patterns = [_parse_wildcard(column) for column in columns]
+  if not any(patterns):
+    return columns
+  if schema_row_key is not None:
+    row_set = pbt_C.RowSet()
+    row_set.append(schema_row_key)
+    discovery_rows = 1
+  found = table._discover_columns(row_set,
+                                  [pattern for pattern in patterns if pattern],
+                                  discovery_rows)
+
+  res = []
+  seen = set()
+  for column, pattern in zip(columns, patterns):
+    if pattern is None:
+      matches = [column]
+    else:
+      family, prefix = pattern
+      matches = sorted(f"{f}:{q}" for f, q in found
+                       if f == family and q.startswith(prefix))
+      if not matches:
+        raise ValueError(f"No columns matching `{column}` were found")
+    for match in matches:
+      if match not in seen:
+        seen.add(match)
+        res.append(match)
+  return res
 
 
 class BigtableCredentials:
@@ -45,9 +153,20 @@ class BigtableClient:
 
   def __init__(self, project_id: str, instance_id: str,
                credentials: BigtableCredentials = None,
-               endpoint: str = None, ) -> None:
+               endpoint: str = None,
+               max_requests_per_second: float = None,
+               max_rows_per_second: float = None,
+               max_bytes_per_second: float = None) -> None:
     """Creates a BigtableClient object storing details about the connection.
 
+    The optional limits throttle all the reads and writes of the tables of
+    this client with token buckets, holding up to one second worth of
+    requests, rows or bytes. They apply to the whole process: all the
+    datasets, iterators, writers and `write_tensor` calls of the client
+    share them. An iterator running in one of N DataLoader workers gets
+    1/N of the limits, so that the workers together use the whole budget.
+    Rows and bytes are counted as they are written or arrive.
+
     Args:
         project_id (str): The assigned project ID of the project.
         instance_id (str): The assigned instance ID.
@@ -59,51 +178,162 @@ class BigtableClient:
             information.
         endpoint (str): A custom URL, where Cloud Bigtable is available. If
             set to None, the default will be used.
+        max_requests_per_second (float): maximum rate of ReadRows, MutateRow
+            and MutateRows calls. Defaults to no limit.
+        max_rows_per_second (float): maximum rate of rows read or written.
+            Defaults to no limit.
+        max_bytes_per_second (float): maximum rate of bytes read or written,
+            counting row keys, column names and values. Defaults to no
+            limit.
     """
+    for name, limit in (("max_requests_per_second", max_requests_per_second),
+                        ("max_rows_per_second", max_rows_per_second),
+                        ("max_bytes_per_second", max_bytes_per_second)):
+      if limit is not None and limit <= 0:
+        raise ValueError(f"`{name}` must be positive")
     self._project_id = project_id
     self._instance_id = instance_id
     self._credentials = credentials
     self._endpoint = endpoint
+    self._max_requests_per_second = max_requests_per_second
+    self._max_rows_per_second = max_rows_per_second
+    self._max_bytes_per_second = max_bytes_per_second
+    # Identifies the limits of this client and of its copies in DataLoader
+    # workers.
+    self._rate_limiter_id = uuid.uuid4().hex
 
-  def get_table(self, table_id: str, app_profile_id: str = None):
+  def get_table(self, table_id: str, app_profile_id: str = None,
+                sample_row_keys_ttl: float = 300.):
     """Creates an instance of BigtableTable
 
     Args:
         table_id (str): the ID of the table.
         app_profile_id (str): The assigned application profile ID. Defaults
         to None.
+        sample_row_keys_ttl (float): number of seconds for which the
+        sample_row_keys of the table are cached. None means forever.
     Returns:
         BigtableTable: The relevant table operated through this client.
     """
-    return BigtableTable(self, table_id, app_profile_id)
+    return BigtableTable(self, table_id, app_profile_id, sample_row_keys_ttl)
 
 
 class BigtableTable:
   """Entry point for reading data from Cloud Bigtable.
 
-      Prefetches the sample_row_keys and creates a list with them.
+      The sample_row_keys of the table are fetched when they are first needed
+      and cached for all the handles of the same table in this process.
       Each sample is a range open from the right, represented as a pair of two
       row_keys: the first key included in the sample and the first that is
       too big.
   """
 
   def __init__(self, client: BigtableClient, table_id: str,
-               app_profile_id: str = None, ) -> None:
+               app_profile_id: str = None,
+               sample_row_keys_ttl: float = 300., ) -> None:
     """
     Args:
         table_id (str): The ID of the table.
         app_profile_id (str): The assigned application profile ID.
         client (BigtableClient): The client on which to operate.
+        sample_row_keys_ttl (float): number of seconds for which the
+            sample_row_keys of the table are cached. None means forever.
     """
     self._client = client
     self._table_id = table_id
     self._app_profile_id = app_profile_id
-    self._sample_row_keys = pbt_C.sample_row_keys(self._client, self._table_id,
-                                                  self._app_profile_id)
+    self._sample_row_keys_ttl = sample_row_keys_ttl
+    self._lookup_session = None
+    self._lookup_session_lock = threading.Lock()
+
+  def __getstate__(self):
+    # The lookup session holds a connection, which can't be pickled. It is
+    # recreated when needed.
+    state = self.__dict__.copy()
+    state["_lookup_session"] = None
+    del state["_lookup_session_lock"]
+    return state
+
+  def __setstate__(self, state):
+    self.__dict__.update(state)
+    self._lookup_session_lock = threading.Lock()
+
+  def _cache_key(self):
+    return (self._client._project_id, self._client._instance_id,
+            self._client._endpoint, self._table_id, self._app_profile_id)
+
+  @property
+  def _sample_row_keys(self):
+    return self.sample_row_keys()
+
+  def sample_row_keys(self) -> List[Tuple[str, int]]:
+    """Returns the sample_row_keys of the table.
+
+    They are only fetched from Bigtable if there are no cached ones younger
+    than the `sample_row_keys_ttl` of this table.
+
+    Returns:
+        List[Tuple[str, int]]: a list of pairs of the last row_key of a
+        tablet and its offset in bytes. It's a copy, so it may be modified.
+    """
+    key = self._cache_key()
+    with _sample_row_keys_cache_lock:
+      fill_lock = _sample_row_keys_fill_locks.setdefault(key,
+                                                         threading.Lock())
+    with fill_lock:
+      with _sample_row_keys_cache_lock:
+        cached = _sample_row_keys_cache.get(key)
+      if cached is not None:
+        fetched_at, samples = cached
+        if self._sample_row_keys_ttl is None or (
+            time.monotonic() - fetched_at < self._sample_row_keys_ttl):
+          return list(samples)
+
+      self.set_sample_row_keys(
+        pbt_C.sample_row_keys(self._client, self._table_id,
+                              self._app_profile_id))
+      with _sample_row_keys_cache_lock:
+        return list(_sample_row_keys_cache[key][1])
+
+  def set_sample_row_keys(self, samples: List[Tuple[str, int]]) -> None:
+    """Puts the given sample_row_keys in the cache shared by all the handles
+    of this table in this process.
+
+    This is useful for sampling the table only once, i.e. on rank 0 of a
+    distributed job, and broadcasting the result to the other ranks.
+
+    Args:
+        samples (List[Tuple[str, int]]): sample_row_keys as returned by
+            `sample_row_keys`.
+    """
+    samples = [(str(row_key), int(offset)) for row_key, offset in samples]
+    with _sample_row_keys_cache_lock:
+      _sample_row_keys_cache[self._cache_key()] = (time.monotonic(), samples)
+
+  def save_sample_row_keys(self, path: str) -> None:
+    """Saves the sample_row_keys of the table to a JSON file.
+
+    Args:
+        path (str): path of the file to write.
+    """
+    with open(path, "w", encoding="UTF-8") as f:
+      json.dump(self.sample_row_keys(), f)
+
+  def load_sample_row_keys(self, path: str) -> None:
+    """Loads sample_row_keys saved with `save_sample_row_keys` into the
+    cache.
+
+    Args:
+        path (str): path of the file to read.
+    """
+    with open(path, "r", encoding="UTF-8") as f:
+      self.set_sample_row_keys(json.load(f))
 
   def write_tensor(self, tensor: torch.Tensor, columns: List[str],
-                   row_keys: Union[
-                     List[str], Callable[[torch.Tensor, int], str]]):
+                   row_keys: Union[List[str], pbt_C.RowKeyGenerator, Callable[
+                     [torch.Tensor, int], str]], parallel: bool = False,
+                   concurrency: int = 8, rows_per_request: int = 1000,
+                   max_in_flight_per_tablet: int = 1):
     """Opens a connection and writes data from tensor. Each row of this
     tensor will become a row in Bigtable so you should provide as many
     row-keys as tensor.shape(1). Please note that using this function is
@@ -118,43 +348,92 @@ class BigtableTable:
             [ "column_family_a:column_name_a",
             "column_family_a:column_name_b",
             ...]
-        row_keys: a list or a callback.
+        row_keys: a list, a generator or a callback.
           If a list, it is a set of row_keys
-          that should be used for the rows in the tensor.
+          that should be used for the rows in the tensor. A NumPy array of
+          bytes or str is accepted as well.
+          If a generator from `pytorch_bigtable.row_keys`, the keys are built
+          from its template without calling into Python for every row.
           If a callback, it is called with the `tensor`'s row and index and is
           expected to return a row_key for that row.
+        parallel: if True, the rows are sorted by key, grouped by the tablets
+          of the table's `sample_row_keys` and written in batches from many
+          threads at once, which spreads the load over the tablet servers.
+          Otherwise, they are written one by one in the tensor's order.
+        concurrency: number of threads writing in parallel.
+        rows_per_request: maximum number of rows written by a single
+          request in parallel.
+        max_in_flight_per_tablet: maximum number of requests writing to a
+          single tablet at once in parallel.
 
     """
-    if tensor.dim() != 2:
-      raise ValueError("`tensor` must have exactly two dimensions")
+    _check_write_tensor_args(tensor, columns, row_keys)
+    if not parallel:
+      pbt_C.write_tensor(self._client, self._table_id, self._app_profile_id,
+                         tensor, columns, row_keys)
+      return
+    if concurrency < 1 or rows_per_request < 1 or max_in_flight_per_tablet < 1:
+      raise ValueError("`concurrency`, `rows_per_request` and "
+                       "`max_in_flight_per_tablet` must be positive")
+    pbt_C.write_tensor_by_tablet(self._client, self._table_id,
+                                 self._app_profile_id, tensor, columns,
+                                 row_keys, self.sample_row_keys(), concurrency,
+                                 rows_per_request, max_in_flight_per_tablet)
 
-    if isinstance(row_keys, List) and len(row_keys) != tensor.shape[0]:
-      raise ValueError(
-        "`row_keys` must have the same length as tensor.shape[0]")
+  def writer(self, columns: List[str], max_rows: int = 1000,
+             max_bytes: int = 4 << 20, flush_interval: float = 1.,
+             concurrency: int = 4) -> "BigtableWriter":
+    """Opens a writer for streaming large amounts of data to the table.
+
+    See `BigtableWriter` for details. Use it as a context manager, so that
+    it is closed and all the rows are written at the end:
 
-    if len(columns) != tensor.shape[1]:
-      raise ValueError("`columns` must have the same length as tensor.shape[1]")
+        with table.writer(["cf1:col1", "cf1:col2"]) as writer:
+          for tensor, row_keys in batches:
+            writer.append(tensor, row_keys)
 
+    Args:
+        columns (List[str]): names of the columns for the consecutive
+            columns of the appended tensors.
+        max_rows (int): maximum number of rows written by a single
+            BulkApply call.
+        max_bytes (int): maximum size of a single BulkApply call in bytes.
+        flush_interval (float): number of seconds after which rows are
+            written even if their batch isn't full. None means never.
+        concurrency (int): number of concurrent BulkApply calls.
+    Returns:
+        BigtableWriter: an open writer.
+    """
     for i, column_id in enumerate(columns):
       if len(column_id.split(":")) != 2:
         raise ValueError(f"`columns[{i}]` must be a string in format:"
                          " \"column_family:column_name\"")
-    row_key_list = None
-    row_key_callable = None
-    if callable(row_keys):
-      row_key_callable = row_keys
-    else:
-      row_key_list = row_keys
-
-    pbt_C.write_tensor(self._client, self._table_id, self._app_profile_id,
-                       tensor, columns, row_key_list, row_key_callable)
+    if max_rows < 1 or max_bytes < 1 or concurrency < 1:
+      raise ValueError(
+        "`max_rows`, `max_bytes` and `concurrency` must be positive")
+    if flush_interval is not None and flush_interval <= 0:
+      raise ValueError("`flush_interval` must be positive")
+    return BigtableWriter(
+      pbt_C.Writer(self._client, self._table_id, self._app_profile_id,
+                   columns, max_rows, max_bytes, flush_interval, concurrency),
+      columns)
 
   def read_rows(self, cell_type: torch.dtype, columns: List[str],
                 row_set: pbt_C.RowSet,
                 versions: pbt_C.Filter = filters.latest(), default_value: Union[
-        int, float] = None) -> torch.utils.data.IterableDataset:
+        int, float] = None, schema_row_key: str = None,
+                discovery_rows: int = 1000, num_streams: int = 1,
+                ordered: bool = False) -> torch.utils.data.IterableDataset:
     """Returns a `CloudBigtableIterableDataset` object.
 
+    A column may be a wildcard: "family:*" stands for all the columns of the
+    family and "family:prefix*" for the ones whose qualifier starts with
+    prefix. Wildcards are expanded once, here, to the matching columns
+    found in the first `discovery_rows` rows of `row_set`, or in the row
+    `schema_row_key` if given. The matches of every wildcard are sorted.
+    The resulting list of columns is available as the `columns` attribute
+    of the dataset and is used by all the workers.
+
     Args:
         cell_type (torch.dtype): the type as which to interpret the data in
             the cells
@@ -164,19 +443,516 @@ class BigtableTable:
         versions (Filter):
             specifies which version should be retrieved. Defaults to latest.
         default_value (float|int): value to fill missing values with.
+        schema_row_key (str): key of a row with all the columns, used for
+            expanding wildcards.
+        discovery_rows (int): number of rows scanned for expanding wildcards
+            if `schema_row_key` is not given.
+        num_streams (int): number of concurrent ReadRows streams opened by
+            every iterator, each over a disjoint part of the iterator's
+            share of the tablets. Rows are read and parsed by native threads
+            and yielded as soon as any stream has them, so a single process
+            can read as fast as many DataLoader workers. With more than one
+            stream, rows don't come in row key order unless `ordered`.
+        ordered (bool): if True, the rows of every iterator come in row key
+            order even with many streams. The streams read consecutive
+            parts of the key range ahead of the consumer into bounded
+            buffers, which are returned one after another. DataLoader
+            workers still return their rows interleaved, in a reproducible
+            order.
+    """
+    if num_streams < 1:
+      raise ValueError("`num_streams` must be positive")
+    columns = _resolve_columns(self, columns, row_set, schema_row_key,
+                               discovery_rows)
+    return _BigtableDataset(self, columns, cell_type, row_set, versions,
+                            default_value, num_streams, ordered)
+
+  def read_tensor(self, cell_type: torch.dtype, columns: List[str],
+                  row_set: pbt_C.RowSet,
+                  versions: pbt_C.Filter = filters.latest(),
+                  default_value: Union[int, float] = None,
+                  with_row_keys: bool = False, num_streams: int = 4,
+                  schema_row_key: str = None, discovery_rows: int = 1000
+                  ) -> Union[torch.Tensor, Tuple[torch.Tensor, List[str]]]:
+    """Reads all the rows of `row_set` into a single tensor, in row key
+    order.
+
+    Unlike concatenating the batches of a dataset, the rows are decoded
+    straight into buffers preallocated from an estimate of the number of
+    rows, based on the table's `sample_row_keys`, which grow geometrically
+    if the estimate is too low. The row set is split into consecutive
+    partitions, read concurrently by `num_streams` native threads.
+
+    Args:
+        cell_type (torch.dtype): the type as which to interpret the data in
+            the cells
+        columns (List[str]): the list of columns to read from, possibly with
+            wildcards. See `read_rows`.
+        row_set (RowSet): set of rows to read.
+        versions (Filter):
+            specifies which version should be retrieved. Defaults to latest.
+        default_value (float|int): value to fill missing values with.
+        with_row_keys (bool): if True, the keys of the rows are returned as
+            well.
+        num_streams (int): number of concurrent ReadRows streams.
+        schema_row_key (str): see `read_rows`.
+        discovery_rows (int): see `read_rows`.
+    Returns:
+        torch.Tensor: a tensor of shape [rows, len(columns)] or, if
+        `with_row_keys`, a tuple of it and the list of the rows' keys.
+    """
+    if num_streams < 1:
+      raise ValueError("`num_streams` must be positive")
+    columns = _resolve_columns(self, columns, row_set, schema_row_key,
+                               discovery_rows)
+    return pbt_C.read_tensor(self._client, self._table_id,
+                             self._app_profile_id, self.sample_row_keys(),
+                             columns, cell_type, row_set, versions,
+                             default_value, with_row_keys, num_streams)
+
+  def read_keys(self, cell_type: torch.dtype, columns: List[str], keys,
+                versions: pbt_C.Filter = filters.latest(),
+                default_value: Union[int, float] = None,
+                keys_per_request: int = 1000,
+                max_in_flight: int = 4) -> torch.utils.data.IterableDataset:
+    """Returns a dataset reading the rows with the given keys.
+
+    Unlike `read_rows` with a row_set of the keys, the keys are not sent in
+    a single request. They are sorted and split evenly among the DataLoader
+    workers. Every worker reads its share in chunks of `keys_per_request`
+    keys, with up to `max_in_flight` ReadRows calls at a time, and yields
+    the rows of every chunk as soon as it arrives. At most
+    `max_in_flight` chunks of rows are held in memory by a worker. Keys of
+    rows that don't exist are skipped.
+
+    Args:
+        cell_type (torch.dtype): the type as which to interpret the data in
+            the cells
+        columns (List[str]): the list of columns to read from; the order on
+            this list will determine the order in the output tensors
+        keys: row_keys to read, as a list of str or bytes, a numpy array of
+            dtype "S" or "U", or a `pbt_C.KeyList`. Duplicates are read once.
+        versions (Filter):
+            specifies which version should be retrieved. Defaults to latest.
+        default_value (float|int): value to fill missing values with.
+        keys_per_request (int): number of keys read by a single ReadRows
+            call.
+        max_in_flight (int): number of concurrent ReadRows calls in every
+            worker.
+    """
+    return _BigtableKeysDataset(self, columns, cell_type, _key_list(keys),
+                                versions, default_value, keys_per_request,
+                                max_in_flight)
+
+  def scan_keys(self, row_set: pbt_C.RowSet, chunk_size: int = 10000,
+                output: str = "numpy") -> torch.utils.data.IterableDataset:
+    """Returns a dataset over the keys of the rows in `row_set`, in chunks.
+
+    Only the keys are transferred: every row is read with the
+    `CellsRowLimit(1)` and strip value filters, and the keys are gathered
+    into chunks natively, without creating a Python object per key. Like
+    `read_rows`, the row set is split among the DataLoader workers along
+    the table's tablets. Use the dataset with `batch_size=None`.
+
+    Args:
+        row_set (RowSet): set of rows to scan.
+        chunk_size (int): maximum number of keys in a chunk.
+        output (str): format of the chunks. "numpy" gives a NumPy array of
+            dtype "S", padded with NULs, so keys ending with NUL bytes lose
+            them. "offsets" gives a tuple of an int64 tensor of offsets,
+            with one more element than there are keys, and a uint8 tensor
+            with the keys one after another: key `i` is
+            `data[offsets[i]:offsets[i + 1]]`.
+    """
+    _check_scan_keys_args(chunk_size, output)
+    return _BigtableKeyScan(self, row_set, chunk_size, output)
+
+  def sync_snapshot(self, snapshot: "InMemoryTable" = None,
+                    columns: List[str] = None,
+                    row_set: pbt_C.RowSet = None, overlap: float = 60.
+                    ) -> Tuple["InMemoryTable", Dict[str, int]]:
+    """Copies the table into a local snapshot, or brings a snapshot up to
+    date.
+
+    The first sync of a snapshot reads the latest version of every cell.
+    Later syncs only read the cells written since the previous sync started,
+    with a `timestamp_range_micros` filter, and merge them into the
+    snapshot, so they transfer just the changes. The snapshot is an
+    `InMemoryTable`, which can be read like the table itself and saved to
+    a file together with the time of its last sync.
+
+    Cells and rows deleted from the table stay in the snapshot. The snapshot
+    must not be read while it is being synced.
+
+    Args:
+        snapshot (InMemoryTable): the snapshot to update. Defaults to a new,
+            empty one.
+        columns (List[str]): the columns to copy, possibly with wildcards,
+            which are matched by Bigtable in every row, so columns added to
+            the table later are copied too. Defaults to all.
+        row_set (RowSet): the rows to copy. Defaults to all.
+        overlap (float): number of seconds before the start of the previous
+            sync from which cells are read again, to catch the ones
+            committed after it with slightly older timestamps, e.g. because
+            of clock skew between the writers and this process.
+    Returns:
+        Tuple[InMemoryTable, Dict[str, int]]: the updated snapshot and the
+            numbers of `rows`, `cells` and payload `bytes` copied into it.
+    """
+    if overlap < 0:
+      raise ValueError("`overlap` must not be negative")
+    if snapshot is None:
+      snapshot = InMemoryTable()
+    if row_set is None:
+      row_set = pbt_C.RowSet()
+      row_set.append(pbt_C.infinite_row_range())
+    columns = columns or []
+    wildcards = [_parse_wildcard(column) for column in columns]
+    stats = pbt_C.sync_snapshot(
+      self._client, self._table_id, self._app_profile_id, snapshot._table,
+      row_set,
+      [column for column, wildcard in zip(columns, wildcards) if not wildcard],
+      [wildcard for wildcard in wildcards if wildcard], int(overlap * 1e6))
+    return snapshot, stats
+
+  def _discover_columns(self, row_set, patterns, rows_limit):
+    return pbt_C.discover_columns(self._client, self._table_id,
+                                  self._app_profile_id, row_set, patterns,
+                                  rows_limit)
+
+  def _read_iterator(self, sample_row_keys, columns, cell_type, row_set,
+                     versions, default_value, num_workers, worker_id,
+                     metrics_slot, num_streams,
+                     ordered) -> pbt_C.Iterator:
+    return pbt_C.Iterator(self._client, self._table_id, self._app_profile_id,
+                          sample_row_keys, columns, cell_type, row_set,
+                          versions, default_value, num_workers, worker_id,
+                          metrics_slot, num_streams=num_streams,
+                          ordered=ordered)
+
+  def _count_rows(self, columns, row_set, versions) -> int:
+    return pbt_C.count_rows(self._client, self._table_id, self._app_profile_id,
+                            row_set, columns, versions)
+
+  def _count_keys(self, columns, keys, versions, keys_per_request,
+                  max_in_flight) -> int:
+    return pbt_C.count_rows(self._client, self._table_id, self._app_profile_id,
+                            keys, columns, versions, keys_per_request,
+                            max_in_flight)
+
+  def _join_input(self, row_set, columns, cell_type, versions,
+                  default_value, num_workers) -> pbt_C.JoinInput:
+    return pbt_C.JoinInput(self._client, self._table_id, self._app_profile_id,
+                           row_set, columns, cell_type, versions,
+                           default_value, num_workers)
+
+  def _scan_keys_iterator(self, sample_row_keys, row_set, num_workers,
+                          worker_id, chunk_size, output) -> pbt_C.KeyScanner:
+    return pbt_C.KeyScanner(self._client, self._table_id,
+                            self._app_profile_id, sample_row_keys, row_set,
+                            num_workers, worker_id, chunk_size, output)
+
+  def _read_keys_iterator(self, keys, columns, cell_type, versions,
+                          default_value, num_workers, worker_id,
+                          keys_per_request, max_in_flight,
+                          metrics_slot) -> pbt_C.Iterator:
+    return pbt_C.Iterator(self._client, self._table_id, self._app_profile_id,
+                          keys, columns, cell_type, versions, default_value,
+                          num_workers, worker_id, keys_per_request,
+                          max_in_flight, metrics_slot)
+
+  def lookup(self, keys: List[str], columns: List[str],
+             cell_type: torch.dtype, timeout: float = None,
+             hedge_after: float = None,
+             versions: pbt_C.Filter = filters.latest(),
+             default_value: Union[int, float] = None,
+             keys_per_request: int = 50) -> Tuple[torch.Tensor, torch.Tensor]:
+    """Reads the given rows and returns them as a single tensor.
+
+    This is meant for low-latency serving, where only a handful of rows is
+    needed at a time. The connection is kept open between calls. The keys
+    are split into chunks of `keys_per_request`, which are read in parallel.
+
+    Args:
+        keys (List[str]): row_keys to read. Keys may repeat.
+        columns (List[str]): the list of columns to read from; the order on
+            this list will determine the order in the output tensor.
+        cell_type (torch.dtype): the type as which to interpret the data in
+            the cells.
+        timeout (float): deadline for the whole call in seconds. If the
+            rows don't arrive in time, a RuntimeError is raised. Defaults to
+            no deadline.
+        hedge_after (float): number of seconds after sending the request
+            for a chunk after which, if the chunk has not arrived yet, a
+            duplicate request is sent. The first response wins. Defaults to
+            no hedging.
+        versions (Filter):
+            specifies which version should be retrieved. Defaults to latest.
+        default_value (float|int): value to fill missing values with.
+        keys_per_request (int): maximum number of keys read by a single
+            ReadRows call.
+    Returns:
+        A tuple of a tensor of shape [len(keys), len(columns)] with the
+        rows in the order of `keys`, and a boolean tensor of shape
+        [len(keys)] telling which of the rows were found. A row is found if
+        it has a value in at least one of the `columns`.
+    """
+    if keys_per_request < 1:
+      raise ValueError("`keys_per_request` must be positive")
+    if timeout is not None and timeout <= 0:
+      raise ValueError("`timeout` must be positive")
+    if hedge_after is not None and hedge_after <= 0:
+      raise ValueError("`hedge_after` must be positive")
+
+    with self._lookup_session_lock:
+      if self._lookup_session is None:
+        self._lookup_session = pbt_C.Lookup(self._client, self._table_id,
+                                            self._app_profile_id)
+    return self._lookup_session.lookup(keys, columns, cell_type, versions,
+                                       default_value, timeout, hedge_after,
+                                       keys_per_request)
+
+
+class BigtableWriter:
+  """Writes tensors to Bigtable in the background.
+
+  `append` encodes the rows and returns immediately; they are buffered and
+  written in batches with BulkApply by native background threads. If the
+  threads fall behind, `append` blocks until the buffered data fits within
+  a few batches, which bounds the memory used. Errors of the background
+  writes are raised by the next `flush` or `close`. Cells are written with
+  a client-side timestamp, so failed writes can be retried safely.
+
+  Create it with `BigtableTable.writer`.
+  """
+
+  def __init__(self, writer: pbt_C.Writer, columns: List[str]) -> None:
+    self._writer = writer
+    self._columns = columns
+
+  def append(self, tensor: torch.Tensor, row_keys: Union[
+    List[str], pbt_C.RowKeyGenerator, Callable[
+      [torch.Tensor, int], str]]) -> None:
+    """Queues the rows of the tensor for writing.
+
+    Args:
+        tensor: Two dimensional PyTorch Tensor with a column for every
+            column of the writer.
+        row_keys: a list, a generator or a callback. See
+            `BigtableTable.write_tensor`. Generators number the rows
+            consecutively across the appends.
+    """
+    _check_write_tensor_args(tensor, self._columns, row_keys)
+    self._writer.append(tensor, row_keys)
+
+  def flush(self) -> None:
+    """Waits until all the appended rows are written.
+
+    Raises:
+        RuntimeError: if any of the writes since the previous flush failed.
+    """
+    self._writer.flush()
+
+  def close(self) -> None:
+    """Flushes the writer and stops its threads. Closing a closed writer
+    does nothing."""
+    self._writer.close()
+
+  @property
+  def rows_written(self) -> int:
+    """Number of rows successfully written so far."""
+    return self._writer.rows_written
+
+  def __enter__(self) -> "BigtableWriter":
+    return self
+
+  def __exit__(self, exc_type, exc_value, traceback) -> None:
+    if exc_type is None:
+      self.close()
+      return
+    # Don't let a failed flush hide the exception raised in the block.
+    try:
+      self.close()
+    except RuntimeError:
+      pass
+
+
+class InMemoryTable:
+  """A table kept in the memory of this process, with the reading and
+  writing interface of `BigtableTable`.
+
+  Reads from it go through the same decoding, partitioning and metrics code
+  as reads from Bigtable, but without any gRPC calls. This makes it useful
+  for tests and for profiling the client side of the pipeline. Only the
+  latest version of every cell is kept, so the `versions` filter is
+  ignored. The table can be saved to a file and is picklable, so it can be
+  passed to DataLoader workers.
+  """
+
+  def __init__(self, rows_per_tablet: int = 1000) -> None:
+    """
+    Args:
+        rows_per_tablet (int): number of rows in every tablet reported by
+            `sample_row_keys`. It determines how rows are split among
+            DataLoader workers.
+    """
+    if rows_per_tablet < 1:
+      raise ValueError("`rows_per_tablet` must be positive")
+    self._rows_per_tablet = rows_per_tablet
+    self._table = pbt_C.MemoryTable()
+
+  @classmethod
+  def load(cls, path: str, rows_per_tablet: int = 1000) -> "InMemoryTable":
+    """Reads a table saved with `save`.
+
+    Args:
+        path (str): path of the file to read.
+        rows_per_tablet (int): see `__init__`.
+    """
+    res = cls(rows_per_tablet)
+    res._table = pbt_C.MemoryTable.load(path)
+    return res
+
+  def save(self, path: str) -> None:
+    """Writes the table to a file.
+
+    Args:
+        path (str): path of the file to write.
+    """
+    self._table.save(path)
+
+  def __len__(self) -> int:
+    return len(self._table)
+
+  @property
+  def synced_micros(self) -> Union[int, None]:
+    """Start of the last `BigtableTable.sync_snapshot` of this table, in
+    microseconds since the epoch, or None if it was never synced."""
+    return self._table.synced_micros
+
+  def sample_row_keys(self) -> List[Tuple[str, int]]:
+    """Returns sample_row_keys as if every `rows_per_tablet` rows were
+    stored in a separate tablet."""
+    return self._table.sample_row_keys(self._rows_per_tablet)
+
+  def write_tensor(self, tensor: torch.Tensor, columns: List[str],
+                   row_keys: Union[List[str], pbt_C.RowKeyGenerator, Callable[
+                     [torch.Tensor, int], str]]):
+    """Stores data from tensor, encoded the same way as in
+    `BigtableTable.write_tensor`.
+
+    Args:
+        tensor: Two dimensional PyTorch Tensor.
+        columns: List with names of the columns for the consecutive columns
+            of the tensor.
+        row_keys: a list, a generator or a callback. See
+            `BigtableTable.write_tensor`.
     """
+    _check_write_tensor_args(tensor, columns, row_keys)
+    self._table.write_tensor(tensor, columns, row_keys)
 
+  def read_rows(self, cell_type: torch.dtype, columns: List[str],
+                row_set: pbt_C.RowSet,
+                versions: pbt_C.Filter = filters.latest(), default_value: Union[
+        int, float] = None, schema_row_key: str = None,
+                discovery_rows: int = 1000, num_streams: int = 1,
+                ordered: bool = False) -> torch.utils.data.IterableDataset:
+    """Returns a dataset over the table. See `BigtableTable.read_rows`."""
+    if num_streams < 1:
+      raise ValueError("`num_streams` must be positive")
+    columns = _resolve_columns(self, columns, row_set, schema_row_key,
+                               discovery_rows)
     return _BigtableDataset(self, columns, cell_type, row_set, versions,
-                            default_value)
+                            default_value, num_streams, ordered)
+
+  def read_tensor(self, cell_type: torch.dtype, columns: List[str],
+                  row_set: pbt_C.RowSet,
+                  versions: pbt_C.Filter = filters.latest(),
+                  default_value: Union[int, float] = None,
+                  with_row_keys: bool = False, num_streams: int = 4,
+                  schema_row_key: str = None, discovery_rows: int = 1000
+                  ) -> Union[torch.Tensor, Tuple[torch.Tensor, List[str]]]:
+    """Reads all the rows of `row_set` into a single tensor. See
+    `BigtableTable.read_tensor`."""
+    del versions  # Only the latest version of every cell is stored.
+    if num_streams < 1:
+      raise ValueError("`num_streams` must be positive")
+    columns = _resolve_columns(self, columns, row_set, schema_row_key,
+                               discovery_rows)
+    return pbt_C.read_tensor(self._table, self.sample_row_keys(), columns,
+                             cell_type, row_set, default_value, with_row_keys,
+                             num_streams)
+
+  def read_keys(self, cell_type: torch.dtype, columns: List[str], keys,
+                versions: pbt_C.Filter = filters.latest(),
+                default_value: Union[int, float] = None,
+                keys_per_request: int = 1000,
+                max_in_flight: int = 4) -> torch.utils.data.IterableDataset:
+    """Returns a dataset reading the rows with the given keys. See
+    `BigtableTable.read_keys`."""
+    return _BigtableKeysDataset(self, columns, cell_type, _key_list(keys),
+                                versions, default_value, keys_per_request,
+                                max_in_flight)
+
+  def scan_keys(self, row_set: pbt_C.RowSet, chunk_size: int = 10000,
+                output: str = "numpy") -> torch.utils.data.IterableDataset:
+    """Returns a dataset over the keys of the rows in `row_set`, in chunks.
+    See `BigtableTable.scan_keys`."""
+    _check_scan_keys_args(chunk_size, output)
+    return _BigtableKeyScan(self, row_set, chunk_size, output)
+
+  def _discover_columns(self, row_set, patterns, rows_limit):
+    del patterns  # The matching columns are picked by `_resolve_columns`.
+    return self._table.columns(row_set, rows_limit)
+
+  def _read_iterator(self, sample_row_keys, columns, cell_type, row_set,
+                     versions, default_value, num_workers, worker_id,
+                     metrics_slot, num_streams,
+                     ordered) -> pbt_C.Iterator:
+    del versions  # Only the latest version of every cell is stored.
+    return pbt_C.Iterator(self._table, sample_row_keys, columns, cell_type,
+                          row_set, default_value, num_workers, worker_id,
+                          metrics_slot, num_streams=num_streams,
+                          ordered=ordered)
+
+  def _count_rows(self, columns, row_set, versions) -> int:
+    del versions  # Only the latest version of every cell is stored.
+    return pbt_C.count_rows(self._table, row_set, columns)
+
+  def _count_keys(self, columns, keys, versions, keys_per_request,
+                  max_in_flight) -> int:
+    del versions, keys_per_request, max_in_flight
+    return pbt_C.count_rows(self._table, keys, columns)
+
+  def _join_input(self, row_set, columns, cell_type, versions,
+                  default_value, num_workers) -> pbt_C.JoinInput:
+    del versions, num_workers
+    return pbt_C.JoinInput(self._table, row_set, columns, cell_type,
+                           default_value)
+
+  def _scan_keys_iterator(self, sample_row_keys, row_set, num_workers,
+                          worker_id, chunk_size, output) -> pbt_C.KeyScanner:
+    return pbt_C.KeyScanner(self._table, sample_row_keys, row_set,
+                            num_workers, worker_id, chunk_size, output)
+
+  def _read_keys_iterator(self, keys, columns, cell_type, versions,
+                          default_value, num_workers, worker_id,
+                          keys_per_request, max_in_flight,
+                          metrics_slot) -> pbt_C.Iterator:
+    del versions, keys_per_request, max_in_flight
+    return pbt_C.Iterator(self._table, keys, columns, cell_type,
+                          default_value, num_workers, worker_id, metrics_slot)
 
 
 class _BigtableDataset(torch.utils.data.IterableDataset):
   """Dataset that handles iterating over BigTable."""
 
-  def __init__(self, table: BigtableTable, columns: List[str],
+  def __init__(self, table: Union[BigtableTable, InMemoryTable],
+               columns: List[str],
                cell_type: torch.dtype, row_set: pbt_C.RowSet,
                versions: pbt_C.Filter = filters.latest(),
-               default_value: Union[int, float] = None) -> None:
+               default_value: Union[int, float] = None,
+               num_streams: int = 1, ordered: bool = False) -> None:
     super(_BigtableDataset).__init__()
 
     self._table = table
@@ -185,6 +961,126 @@ class _BigtableDataset(torch.utils.data.IterableDataset):
     self._row_set = row_set
     self._versions = versions
     self._default_value = default_value
+    self._num_streams = num_streams
+    self._ordered = ordered
+    # Sampled when first needed, see `_get_sample_row_keys`.
+    self._sample_row_keys = None
+    # Exact number of rows, once counted by `count_rows`.
+    self._num_rows = None
+    # One row of counters per worker, allocated when first needed. See
+    # `_share_metrics`.
+    self._metrics = None
+    _unshared_metrics_datasets.add(self)
+
+  @property
+  def columns(self) -> List[str]:
+    """The columns read, in the order of the values in the output tensors.
+    """
+    return list(self._columns)
+
+  def metrics(self) -> Dict[str, int]:
+    """Returns the metrics of all the iterators over this dataset, including
+    the ones running in DataLoader workers.
+
+    Counters are summed over the iterators, except for `first_row_ns`,
+    which is the longest time to first row among them. Iterators report
+    their counters every few thousand rows and when they're done.
+
+    Returns:
+        Dict[str, int]: the number of `rows`, `cells` and payload `bytes`
+        read, and the nanoseconds spent waiting for the stream
+        (`stream_wait_ns`) and decoding (`decode_ns`).
+    """
+    res = {}
+    for i, name in enumerate(pbt_C._iterator_metrics):
+      column = self._get_metrics()[:, i]
+      res[name] = (column.max() if name == "first_row_ns" else
+                   column.sum()).item()
+    return res
+
+  def reset_metrics(self) -> None:
+    """Sets all the metrics of this dataset to zero."""
+    if self._metrics is not None:
+      self._metrics.zero_()
+
+  def _get_metrics(self) -> torch.Tensor:
+    """Returns the metrics tensor, with a single row for the main process
+    unless it has been moved to shared memory."""
+    if self._metrics is None:
+      self._metrics = torch.zeros((1, len(pbt_C._iterator_metrics)),
+                                  dtype=torch.int64)
+    return self._metrics
+
+  def _share_metrics(self) -> None:
+    """Moves the metrics to a tensor in shared memory with a row for every
+    worker, so that the counters of the DataLoader workers are visible in the
+    main process."""
+    _unshared_metrics_datasets.discard(self)
+    if self._metrics is not None and self._metrics.is_shared():
+      return
+    metrics = torch.zeros(
+      (_MAX_METRICS_WORKERS, len(pbt_C._iterator_metrics)),
+      dtype=torch.int64).share_memory_()
+    if self._metrics is not None:
+      metrics[:len(self._metrics)] = self._metrics
+    self._metrics = metrics
+
+  def __getstate__(self):
+    # Workers started without forking get a pickled copy of the dataset.
+    self._share_metrics()
+    return self.__dict__.copy()
+
+  def estimate(self, num_workers: int = 1) -> List[Dict[str, int]]:
+    """Estimates the size of the share of every DataLoader worker without
+    reading any rows.
+
+    The estimate combines the sizes of the tablets from the table's
+    `sample_row_keys` with the row set: a single key counts as one row and
+    a range as all the rows of the tablets it intersects, so short ranges
+    are overestimated. Rows are assumed to have 16 byte keys and all the
+    columns.
+
+    Args:
+        num_workers (int): number of DataLoader workers.
+    Returns:
+        List[Dict[str, int]]: `estimated_rows` and `estimated_bytes` of
+        every worker's share.
+    """
+    return pbt_C.estimate_row_set(self._row_set, self._get_sample_row_keys(),
+                                  self._columns, self._cell_type, num_workers)
+
+  @property
+  def estimated_rows(self) -> int:
+    """Estimated number of rows of the dataset. See `estimate`."""
+    return self.estimate()[0]["estimated_rows"]
+
+  @property
+  def estimated_bytes(self) -> int:
+    """Estimated size of the rows of the dataset. See `estimate`."""
+    return self.estimate()[0]["estimated_bytes"]
+
+  def count_rows(self) -> int:
+    """Counts the rows of the dataset exactly and caches the count, after
+    which `len()` of the dataset works.
+
+    Only the key of every row is read, so this is much cheaper than
+    iterating over the dataset, but it's still a full scan.
+
+    Returns:
+        int: the number of rows with any of the columns.
+    """
+    self._num_rows = self._count()
+    return self._num_rows
+
+  def _count(self) -> int:
+    return self._table._count_rows(self._columns, self._row_set,
+                                   self._versions)
+
+  def __len__(self) -> int:
+    if self._num_rows is None:
+      raise TypeError("The number of rows is unknown. Call count_rows() "
+                      "first.")
+    return self._num_rows
 
   def __iter__(self):
     """
@@ -201,9 +1097,194 @@ class _BigtableDataset(torch.utils.data.IterableDataset):
     worker_info = torch.utils.data.get_worker_info()
     num_workers = worker_info.num_workers if worker_info is not None else 1
     worker_id = worker_info.id if worker_info is not None else 0
+    if worker_info is not None:
+      tracing._setup_worker(worker_id)
+
+    metrics = self._get_metrics()
+    metrics_slot = metrics[worker_id] if worker_id < len(metrics) else None
+    return self._iterator(num_workers, worker_id, metrics_slot)
+
+  def _get_sample_row_keys(self):
+    """Returns the sample_row_keys of the table, which are only fetched the
+    first time they're needed, i.e. not for reads by a single stream.
+
+    Samples taken before the dataset is shipped to the DataLoader workers are
+    shipped with it, so that all the workers split the row set along the same
+    tablets. Otherwise every worker takes them from the table's cache, which
+    forked workers inherit from the main process.
+    """
+    if self._sample_row_keys is None:
+      self._sample_row_keys = self._table.sample_row_keys()
+    return self._sample_row_keys
+
+  def _iterator(self, num_workers, worker_id, metrics_slot):
+    # A single stream gets the whole row_set.
+    sample_row_keys = (self._get_sample_row_keys()
+                       if num_workers * self._num_streams > 1 else [])
+    return self._table._read_iterator(sample_row_keys, self._columns,
+                                      self._cell_type, self._row_set,
+                                      self._versions, self._default_value,
+                                      num_workers, worker_id, metrics_slot,
+                                      self._num_streams, self._ordered)
+
+
+class _BigtableKeysDataset(_BigtableDataset):
+  """Dataset reading a list of row keys in chunks."""
+
+  def __init__(self, table: Union[BigtableTable, InMemoryTable],
+               columns: List[str], cell_type: torch.dtype,
+               keys: pbt_C.KeyList, versions: pbt_C.Filter,
+               default_value: Union[int, float], keys_per_request: int,
+               max_in_flight: int) -> None:
+    super().__init__(table, columns, cell_type, None, versions, default_value)
+    self._keys = keys
+    self._keys_per_request = keys_per_request
+    self._max_in_flight = max_in_flight
+
+  def estimate(self, num_workers: int = 1) -> List[Dict[str, int]]:
+    """Estimates the size of the share of every DataLoader worker, counting
+    every key as a row, although keys of missing rows are skipped.
+
+    Args:
+        num_workers (int): number of DataLoader workers.
+    Returns:
+        List[Dict[str, int]]: `estimated_rows` and `estimated_bytes` of
+        every worker's share.
+    """
+    return pbt_C.estimate_keys(self._keys, self._columns, self._cell_type,
+                               num_workers)
+
+  def _count(self) -> int:
+    return self._table._count_keys(self._columns, self._keys, self._versions,
+                                   self._keys_per_request, self._max_in_flight)
+
+  def _iterator(self, num_workers, worker_id, metrics_slot):
+    # Every worker reads an equal, consecutive share of the sorted keys.
+    return self._table._read_keys_iterator(self._keys, self._columns,
+                                           self._cell_type, self._versions,
+                                           self._default_value, num_workers,
+                                           worker_id, self._keys_per_request,
+                                           self._max_in_flight, metrics_slot)
+
+
+class _BigtableKeyScan(torch.utils.data.IterableDataset):
+  """Dataset over the keys of a row set, in chunks."""
+
+  def __init__(self, table: Union[BigtableTable, InMemoryTable],
+               row_set: pbt_C.RowSet, chunk_size: int, output: str) -> None:
+    super().__init__()
+    self._table = table
+    self._row_set = row_set
+    self._chunk_size = chunk_size
+    self._output = output
+    # Sampled only by several workers. See `_BigtableDataset`.
+    self._sample_row_keys = None
+
+  def __iter__(self):
+    worker_info = torch.utils.data.get_worker_info()
+    num_workers = worker_info.num_workers if worker_info is not None else 1
+    worker_id = worker_info.id if worker_info is not None else 0
+    if worker_info is not None:
+      tracing._setup_worker(worker_id)
+
+    if num_workers > 1 and self._sample_row_keys is None:
+      self._sample_row_keys = self._table.sample_row_keys()
+    sample_row_keys = self._sample_row_keys if num_workers > 1 else []
+    return self._table._scan_keys_iterator(sample_row_keys, self._row_set,
+                                           num_workers, worker_id,
+                                           self._chunk_size, self._output)
+
+
+def read_joined(tables: List[Tuple[Union[BigtableTable, InMemoryTable],
+                                   List[str], torch.dtype]],
+                row_set: pbt_C.RowSet, how: str = "inner",
+                concat: bool = True,
+                versions: pbt_C.Filter = filters.latest(),
+                default_value: Union[int, float] = None,
+                schema_row_key: str = None, discovery_rows: int = 1000
+                ) -> torch.utils.data.IterableDataset:
+  """Returns a dataset joining the rows of several tables with the same row
+  keys, e.g. features and labels kept in separate tables.
+
+  Every iterator opens one stream per table over the same share of
+  `row_set`, split along the tablets of the first table, and merge-joins
+  them on row key natively. Only the current row of every stream is held in
+  memory, so nothing is buffered regardless of the size of the tables.
+
+  Args:
+      tables: a list of tuples of a table, the columns to read from it,
+          possibly with wildcards, and the type of its cells. The tables
+          must all be `BigtableTable`s or all `InMemoryTable`s.
+      row_set (RowSet): set of rows to read from every table.
+      how (str): "inner" returns the rows present in all the tables, "left"
+          every row of the first table, with the columns of the rows missing
+          from the others set to `default_value`. A row is present in a
+          table if it has any of the columns read from it.
+      concat (bool): if True, every item is a single tensor with the
+          columns of all the tables, in order, of their promoted type.
+          Otherwise it's a tuple of a tensor per table.
+      versions (Filter):
+          specifies which version should be retrieved. Defaults to latest.
+      default_value (float|int): value to fill missing values with.
+      schema_row_key (str): key of a row with all the columns of every
+          table, used for expanding wildcards. See
+          `BigtableTable.read_rows`.
+      discovery_rows (int): number of rows of every table scanned for
+          expanding its wildcards if `schema_row_key` is not given.
+  """
+  if not tables:
+    raise ValueError("`tables` must not be empty")
+  if how not in ("inner", "left"):
+    raise ValueError("`how` must be \"inner\" or \"left\"")
+  if len({isinstance(table, InMemoryTable) for table, _, _ in tables}) > 1:
+    raise ValueError("`tables` must not mix Bigtable and in-memory tables")
+  tables = [(table,
+             _resolve_columns(table, columns, row_set, schema_row_key,
+                              discovery_rows), cell_type)
+            for table, columns, cell_type in tables]
+  return _BigtableJoinedDataset(tables, row_set, how == "left", concat,
+                                versions, default_value)
+
+
+class _BigtableJoinedDataset(torch.utils.data.IterableDataset):
+  """Dataset merge-joining several tables on row key."""
+
+  def __init__(self, tables, row_set: pbt_C.RowSet, left: bool, concat: bool,
+               versions: pbt_C.Filter,
+               default_value: Union[int, float]) -> None:
+    super().__init__()
+    self._tables = tables
+    self._row_set = row_set
+    self._left = left
+    self._concat = concat
+    self._versions = versions
+    self._default_value = default_value
+    # All the streams must read the same keys, so they're all split along
+    # the tablets of the first table, sampled only by several workers. See
+    # `_BigtableDataset`.
+    self._sample_row_keys = None
+
+  @property
+  def columns(self) -> List[str]:
+    """The columns of all the tables, in the order of the values in the
+    concatenated output tensors."""
+    return [column for _, columns, _ in self._tables for column in columns]
+
+  def __iter__(self):
+    worker_info = torch.utils.data.get_worker_info()
+    num_workers = worker_info.num_workers if worker_info is not None else 1
+    worker_id = worker_info.id if worker_info is not None else 0
+    if worker_info is not None:
+      tracing._setup_worker(worker_id)
 
-    return pbt_C.Iterator(self._table._client, self._table._table_id,
-                          self._table._app_profile_id,
-                          self._table._sample_row_keys, self._columns,
-                          self._cell_type, self._row_set, self._versions,
-                          self._default_value, num_workers, worker_id)
+    if num_workers > 1 and self._sample_row_keys is None:
+      self._sample_row_keys = self._tables[0][0].sample_row_keys()
+    sample_row_keys = self._sample_row_keys if num_workers > 1 else []
+    row_set = pbt_C._compute_row_set_for_worker(self._row_set,
+                                                sample_row_keys, num_workers,
+                                                worker_id)
+    inputs = [
+      table._join_input(row_set, columns, cell_type, self._versions,
+                        self._default_value, num_workers)
+      for table, columns, cell_type in self._tables]
+    return pbt_C.JoinedIterator(inputs, self._left, self._concat)
@@ -0,0 +1,56 @@
+# Copyright 2021 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Module implementing row key generators for writing tensors.
+
+The generators build the row keys in C++, so unlike a Python callback they
+don't call into Python for every row of the tensor.
+"""
+from . import pbt_C
+from typing import Optional
+
+
+def template(fmt: str, start: int = 0,
+             salt_buckets: Optional[int] = None) -> pbt_C.RowKeyGenerator:
+  """Create a generator of keys numbering the rows consecutively.
+
+  Args:
+    fmt (str): the format of the keys. "{index}" is replaced with the number
+        of the row, "{index:08}" with the number padded with zeros to 8
+        digits and "{salt}" with a hash of the number modulo
+        `salt_buckets`. "{{" and "}}" stand for literal braces.
+    start (int): the number of the first row. When the generator is used by
+        a writer, the numbering continues across its appends.
+    salt_buckets (int): number of different salts. Required if `fmt` has a
+        "{salt}" placeholder.
+  Returns:
+    RowKeyGenerator: a generator to pass as `row_keys` to `write_tensor`.
+  """
+  return pbt_C.RowKeyGenerator(fmt, start, None, salt_buckets)
+
+
+def from_column(column: int, fmt: str = "{index}",
+                salt_buckets: Optional[int] = None) -> pbt_C.RowKeyGenerator:
+  """Create a generator of keys taken from a column of the tensor.
+
+  Args:
+    column (int): the index of the column of the tensor holding the ids of
+        the rows. Its values are converted to integers.
+    fmt (str): the format of the keys, with "{index}" replaced with the id.
+        See `template`.
+    salt_buckets (int): number of different salts. See `template`.
+  Returns:
+    RowKeyGenerator: a generator to pass as `row_keys` to `write_tensor`.
+  """
+  return pbt_C.RowKeyGenerator(fmt, 0, column, salt_buckets)
@@ -0,0 +1,28 @@
+# Copyright 2021 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# disable module docstring for tests
+# pylint: disable=C0114
+from typing import Iterable, List, Union
+
+
+def row_keys(rows: Union[int, Iterable[int]]) -> List[str]:
+  """Returns the keys "row0000", "row0001", ... of the given rows.
+
+  Args:
+    rows: a number of rows, numbered from 0, or the numbers of the rows.
+  """
+  if isinstance(rows, int):
+    rows = range(rows)
+  return ["row" + str(i).rjust(4, "0") for i in rows]
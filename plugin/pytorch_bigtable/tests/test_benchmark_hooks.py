@@ -0,0 +1,75 @@
+# Copyright 2021 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# disable module docstring for tests
+# pylint: disable=C0114
+# disable class docstring for tests
+# pylint: disable=C0115
+# disable warning for access to protected members
+# pylint: disable=W0212
+from unittest import TestCase
+import torch
+from pytorch_bigtable import pbt_C, row_set, row_range
+
+
+def _fastest(benchmark, repeats=5):
+  return min(benchmark() for _ in range(repeats))
+
+
+class BenchmarkHooksTest(TestCase):
+  def test_codec(self):
+    for benchmark in [pbt_C._benchmark_bytes_to_float,
+                      pbt_C._benchmark_double_to_bytes]:
+      self.assertGreater(benchmark(10), 0)
+      # The time must cover the work, which grows with the number of values.
+      self.assertGreater(_fastest(lambda b=benchmark: b(100000)),
+                         _fastest(lambda b=benchmark: b(10)))
+
+  def test_tensors(self):
+    for dtype in [torch.float32, torch.float64, torch.int32, torch.int64,
+                  torch.bool]:
+      tensor = torch.ones(3, 2, dtype=dtype)
+      self.assertGreater(
+        pbt_C._benchmark_get_tensor_value_as_bytes(tensor), 0)
+      self.assertGreater(
+        pbt_C._benchmark_put_cell_value_in_tensor(tensor), 0)
+      self.assertGreater(
+        pbt_C._benchmark_get_filled_tensor(3, 2, dtype), 0)
+
+    small = torch.ones(2, 10)
+    large = torch.ones(2000, 10)
+    for benchmark in [pbt_C._benchmark_get_tensor_value_as_bytes,
+                      pbt_C._benchmark_put_cell_value_in_tensor]:
+      self.assertGreater(_fastest(lambda b=benchmark: b(large)),
+                         _fastest(lambda b=benchmark: b(small)))
+
+  def test_unsupported_dtype(self):
+    tensor = torch.ones(3, 2, dtype=torch.float16)
+    self.assertRaises(RuntimeError,
+                      pbt_C._benchmark_get_tensor_value_as_bytes, tensor)
+    self.assertRaises(RuntimeError,
+                      pbt_C._benchmark_put_cell_value_in_tensor, tensor)
+    self.assertRaises(RuntimeError, pbt_C._benchmark_get_filled_tensor, 3, 2,
+                      torch.float16)
+
+  def test_compute_row_set_for_worker(self):
+    rs = row_set.from_rows_or_ranges(row_range.infinite(), "row-a")
+    samples = [("row-a", 10), ("row-c", 10)]
+    self.assertGreater(
+      pbt_C._benchmark_compute_row_set_for_worker(rs, samples, 3), 0)
+    self.assertGreater(
+      _fastest(lambda: pbt_C._benchmark_compute_row_set_for_worker(
+        rs, samples, 1000)),
+      _fastest(lambda: pbt_C._benchmark_compute_row_set_for_worker(
+        rs, samples, 1)))
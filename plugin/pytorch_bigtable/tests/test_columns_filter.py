@@ -0,0 +1,106 @@
+# Copyright 2021 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# disable module docstring for tests
+# pylint: disable=C0114
+# disable class docstring for tests
+# pylint: disable=C0115
+import unittest
+import torch
+import os
+from .bigtable_emulator import BigtableEmulator
+from pytorch_bigtable import BigtableClient, row_set, row_range
+from pytorch_bigtable.pbt_C import _columns_filter
+
+
+class ColumnsFilterTest(unittest.TestCase):
+  def test_single_column(self):
+    expected = ('column_range_filter {\n'
+                '  family_name: "fam1"\n'
+                '  start_qualifier_closed: "c1"\n'
+                '  end_qualifier_closed: "c1"\n'
+                '}\n')
+    self.assertEqual(expected, repr(_columns_filter(["fam1:c1"])))
+
+  def test_qualifier_regex(self):
+    expected = ('chain {\n'
+                '  filters {\n'
+                '    family_name_regex_filter: "^fam1$"\n'
+                '  }\n'
+                '  filters {\n'
+                '    column_qualifier_regex_filter: "^(?:a\\\\.b|c1|c2)$"\n'
+                '  }\n'
+                '}\n')
+    self.assertEqual(expected,
+                     repr(_columns_filter(["fam1:c2", "fam1:a.b", "fam1:c1"])))
+
+  def test_many_families(self):
+    output = repr(_columns_filter(["fam1:c1", "fam2:c1", "fam2:c2"]))
+    self.assertTrue(output.startswith("interleave {"))
+    self.assertEqual(output.count("column_range_filter"), 1)
+    self.assertEqual(output.count("column_qualifier_regex_filter"), 1)
+
+  def test_large_family_split_among_regexes(self):
+    qualifiers = ["c" + str(i).rjust(5, "0") for i in range(1000)]
+    output = repr(_columns_filter(["fam1:" + q for q in qualifiers]))
+    self.assertNotIn("column_range_filter", output)
+    self.assertEqual(output.count("column_qualifier_regex_filter"), 2)
+    for qualifier in qualifiers:
+      self.assertIn(qualifier, output)
+
+  def test_huge_family_falls_back_to_range(self):
+    columns = ["fam1:c" + str(i).rjust(5, "0") for i in range(5000)]
+    output = repr(_columns_filter(columns + ["fam2:a", "fam2:b"]))
+    self.assertIn('start_qualifier_closed: "c00000"', output)
+    self.assertIn('end_qualifier_closed: "c04999"', output)
+    self.assertIn('column_qualifier_regex_filter: "^(?:a|b)$"', output)
+    self.assertLess(len(output), 1000)
+
+
+class ColumnsFilterReadTest(unittest.TestCase):
+  def setUp(self):
+    self.emulator = BigtableEmulator()
+
+  def tearDown(self):
+    self.emulator.stop()
+
+  def test_read(self):
+    os.environ["BIGTABLE_EMULATOR_HOST"] = self.emulator.get_addr()
+    self.emulator.create_table("fake_project", "fake_instance", "test-table",
+                               ["fam1", "fam2"])
+    client = BigtableClient("fake_project", "fake_instance",
+                            endpoint=self.emulator.get_addr())
+    table = client.get_table("test-table")
+    # Qualifiers too long to fit in the filter, so that the unrequested
+    # column in the middle of the range is dropped by the reader.
+    long_names = ["fam1:" + c * 9000 for c in "abc"]
+    columns = long_names + ["fam1:x.y", "fam1:xzy", "fam2:z"]
+    ten = torch.Tensor(list(range(60))).reshape(10, 6)
+    table.write_tensor(ten, columns,
+                       ["row" + str(i).rjust(3, "0") for i in range(10)])
+    # Rows with only the unrequested column are skipped.
+    table.write_tensor(torch.ones(5, 1), long_names[1:2],
+                       ["other" + str(i) for i in range(5)])
+
+    requested = [long_names[2], long_names[0], "fam1:x.y", "fam2:z"]
+    ds = table.read_rows(torch.float32, requested,
+                         row_set.from_rows_or_ranges(row_range.infinite()))
+    output = torch.stack(list(ds))
+
+    self.assertTrue((output == ten[:, [2, 0, 3, 5]]).all())
+    self.assertEqual(ds.count_rows(), 10)
+    tensor = table.read_tensor(
+      torch.float32, requested,
+      row_set.from_rows_or_ranges(row_range.infinite()))
+    self.assertTrue((tensor == ten[:, [2, 0, 3, 5]]).all())
@@ -99,3 +99,27 @@ class ComputeRowSetForWorkerTest(TestCase):
 
     output_2 = _compute_row_set_for_worker(rs, samples, 3, 2)
     self.assertTrue(output_2.is_empty())
+
+  def test_many_keys(self):
+    keys = ["row" + str(i).rjust(5, "0") for i in range(0, 10000, 7)]
+    rs = row_set.from_rows_or_ranges(*keys)
+    samples = [("row" + str(i).rjust(5, "0"), i) for i in range(0, 10000, 90)]
+
+    output = []
+    for worker_id in range(7):
+      worker_set = _compute_row_set_for_worker(rs, samples, 7, worker_id)
+      worker_keys = [line.split('"')[1] for line in
+                     repr(worker_set).splitlines()]
+      self.assertGreater(len(worker_keys), 0)
+      output.extend(worker_keys)
+    self.assertEqual(output, keys)
+
+  def test_skips_tablets_outside_row_set(self):
+    rs = row_set.from_rows_or_ranges("row-b", "row-f")
+    samples = [("row-a", 10), ("row-c", 10), ("row-e", 10), ("row-g", 10)]
+
+    output_0 = _compute_row_set_for_worker(rs, samples, 2, 0)
+    self.assertEqual(repr(output_0), 'row_keys: "row-b"\n')
+
+    output_1 = _compute_row_set_for_worker(rs, samples, 2, 1)
+    self.assertEqual(repr(output_1), 'row_keys: "row-f"\n')
@@ -0,0 +1,60 @@
+# Copyright 2021 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# disable module docstring for tests
+# pylint: disable=C0114
+# disable class docstring for tests
+# pylint: disable=C0115
+# disable warning for access to protected members
+# pylint: disable=W0212
+import struct
+import unittest
+import torch
+from pytorch_bigtable import InMemoryTable, pbt_C, row_set, row_range
+
+_FORMATS = {torch.float32: ">f", torch.float64: ">d", torch.int32: ">i",
+            torch.int64: ">q"}
+
+
+class EncodeTensorTest(unittest.TestCase):
+  def test_big_endian(self):
+    for dtype, fmt in _FORMATS.items():
+      tensor = torch.tensor([[1, -2, 3], [400000, 5, -6]], dtype=dtype)
+      expected = [[struct.pack(fmt, v) for v in row] for row in
+                  tensor.tolist()]
+      self.assertEqual(pbt_C._encode_tensor(tensor), expected)
+
+  def test_bool(self):
+    tensor = torch.tensor([[True, False]])
+    self.assertEqual(pbt_C._encode_tensor(tensor), [[b"\xff", b"\x00"]])
+
+  def test_non_contiguous(self):
+    tensor = torch.arange(24, dtype=torch.int64).reshape(4, 6)
+    for view in [tensor.t(), tensor[::2, 1::3], tensor[:, 2:4]]:
+      self.assertFalse(view.is_contiguous())
+      self.assertEqual(pbt_C._encode_tensor(view),
+                       pbt_C._encode_tensor(view.contiguous()))
+
+  def test_write_non_contiguous(self):
+    tensor = torch.arange(20, dtype=torch.float32).reshape(2, 10).t()
+    table = InMemoryTable()
+    table.write_tensor(tensor, ["fam1:col1", "fam1:col2"],
+                       ["row" + str(i).rjust(2, "0") for i in range(10)])
+    ds = table.read_rows(torch.float32, ["fam1:col1", "fam1:col2"],
+                         row_set.from_rows_or_ranges(row_range.infinite()))
+    self.assertTrue((torch.stack(list(ds)) == tensor).all())
+
+  def test_unsupported_dtype(self):
+    with self.assertRaises(RuntimeError):
+      pbt_C._encode_tensor(torch.ones(2, 2, dtype=torch.float16))
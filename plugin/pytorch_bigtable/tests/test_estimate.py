@@ -0,0 +1,93 @@
+# Copyright 2021 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# disable module docstring for tests
+# pylint: disable=C0114
+# disable class docstring for tests
+# pylint: disable=C0115
+import unittest
+import torch
+from .helpers import row_keys
+from pytorch_bigtable import InMemoryTable, row_set, row_range
+from torch.utils.data import DataLoader
+
+_COLUMNS = ["fam1:col1", "fam2:col2"]
+
+
+class EstimateTest(unittest.TestCase):
+  def setUp(self):
+    self.ten = torch.Tensor(list(range(2000))).reshape(1000, 2)
+    self.table = InMemoryTable(rows_per_tablet=100)
+    self.table.write_tensor(self.ten, _COLUMNS, row_keys(1000))
+    # Rows without any of the columns which are read.
+    self.table.write_tensor(self.ten[:10, :1], ["fam1:other"],
+                            ["other" + str(i) for i in range(10)])
+    self.all_rows = row_set.from_rows_or_ranges(row_range.infinite())
+    self.table_bytes = self.table.sample_row_keys()[-1][1]
+
+  def test_estimate_whole_table(self):
+    ds = self.table.read_rows(torch.float32, _COLUMNS, self.all_rows)
+    self.assertEqual(ds.estimated_bytes, self.table_bytes)
+    self.assertGreater(ds.estimated_rows, 0)
+
+  def test_estimate_workers(self):
+    ds = self.table.read_rows(torch.float32, _COLUMNS, self.all_rows)
+    shares = ds.estimate(num_workers=3)
+    self.assertEqual(len(shares), 3)
+    self.assertEqual(sum(share["estimated_bytes"] for share in shares),
+                     self.table_bytes)
+    self.assertTrue(all(share["estimated_rows"] > 0 for share in shares))
+
+  def test_estimate_ranges(self):
+    samples = self.table.sample_row_keys()
+    keys = [key for key, _ in samples]
+    offsets = [offset for _, offset in samples]
+    # The first two ranges share a tablet, which is counted once.
+    rs = row_set.from_rows_or_ranges(
+      row_range.right_open(keys[0], keys[0] + "a"),
+      row_range.right_open(keys[0] + "b", keys[1]),
+      row_range.right_open(keys[2], keys[4]))
+    ds = self.table.read_rows(torch.float32, _COLUMNS, rs)
+    self.assertEqual(ds.estimated_bytes,
+                     offsets[1] - offsets[0] + offsets[4] - offsets[2])
+
+  def test_estimate_keys(self):
+    rs = row_set.from_keys(["row0001", "row0500", "row0999"])
+    ds = self.table.read_rows(torch.float32, _COLUMNS, rs)
+    self.assertEqual(ds.estimated_rows, 3)
+    ds = self.table.read_keys(torch.float32, _COLUMNS,
+                              ["row0001", "row0500", "missing"])
+    shares = ds.estimate(num_workers=2)
+    self.assertEqual(sum(share["estimated_rows"] for share in shares), 3)
+
+  def test_len(self):
+    ds = self.table.read_rows(torch.float32, _COLUMNS, self.all_rows)
+    with self.assertRaises(TypeError):
+      len(ds)
+    self.assertEqual(ds.count_rows(), 1000)
+    self.assertEqual(len(ds), 1000)
+    self.assertEqual(len(DataLoader(ds, batch_size=10)), 100)
+
+  def test_count_row_set(self):
+    rs = row_set.from_rows_or_ranges(
+      row_range.right_open("row0100", "row0250"), "row0900", "other1")
+    ds = self.table.read_rows(torch.float32, _COLUMNS, rs)
+    self.assertEqual(ds.count_rows(), 151)
+    self.assertEqual(len(ds), len(list(ds)))
+
+  def test_count_keys(self):
+    ds = self.table.read_keys(torch.float32, _COLUMNS,
+                              ["row0001", "row0500", "missing", "other2"])
+    self.assertEqual(ds.count_rows(), 2)
+    self.assertEqual(len(ds), 2)
@@ -0,0 +1,107 @@
+# Copyright 2021 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# disable module docstring for tests
+# pylint: disable=C0114
+# disable class docstring for tests
+# pylint: disable=C0115
+import os
+import pickle
+import tempfile
+import unittest
+import torch
+from .helpers import row_keys
+from pytorch_bigtable import InMemoryTable, row_set, row_range
+from torch.utils.data import DataLoader
+
+
+class InMemoryTableTest(unittest.TestCase):
+  def setUp(self):
+    self.ten = torch.Tensor(list(range(200))).reshape(100, 2)
+    self.table = InMemoryTable(rows_per_tablet=10)
+    self.table.write_tensor(self.ten, ["fam1:col1", "fam2:col2"],
+                            row_keys(100))
+
+  def read_all(self, table, row_set_=None, columns=None):
+    if row_set_ is None:
+      row_set_ = row_set.from_rows_or_ranges(row_range.infinite())
+    ds = table.read_rows(torch.float32, columns or ["fam1:col1", "fam2:col2"],
+                         row_set_)
+    return torch.stack(list(ds))
+
+  def test_read(self):
+    self.assertEqual(len(self.table), 100)
+    self.assertTrue((self.read_all(self.table) == self.ten).all())
+
+  def test_read_row_set(self):
+    rs = row_set.from_rows_or_ranges(
+      row_range.closed_range("row0010", "row0019"), "row0050",
+      row_range.right_open("row0015", "row0025"))
+    expected = torch.cat([self.ten[10:25], self.ten[50:51]])
+    self.assertTrue((self.read_all(self.table, rs) == expected).all())
+
+  def test_read_columns_subset(self):
+    output = self.read_all(self.table, columns=["fam2:col2"])
+    self.assertTrue((output == self.ten[:, 1:]).all())
+
+  def test_callback_row_keys(self):
+    table = InMemoryTable()
+    table.write_tensor(self.ten, ["fam1:col1", "fam2:col2"],
+                       lambda tensor, index: "key" + str(index).rjust(3, "0"))
+    self.assertTrue((self.read_all(table) == self.ten).all())
+
+  def test_overwrite(self):
+    self.table.write_tensor(torch.zeros(1, 2), ["fam1:col1", "fam2:col2"],
+                            ["row0000"])
+    self.assertTrue((self.read_all(self.table)[0] == 0).all())
+
+  def test_sample_row_keys(self):
+    samples = self.table.sample_row_keys()
+    self.assertEqual([key for key, _ in samples],
+                     row_keys(range(10, 100, 10)) + [""])
+    offsets = [offset for _, offset in samples]
+    self.assertEqual(offsets, sorted(offsets))
+
+  def test_parallel_read(self):
+    ds = self.table.read_rows(torch.float32, ["fam1:col1", "fam2:col2"],
+                              row_set.from_rows_or_ranges(row_range.infinite()))
+    output = list(DataLoader(ds, num_workers=3))
+    output = sorted(output, key=lambda x: x[0, 0].item())
+    self.assertTrue((torch.cat(output) == self.ten).all())
+    self.assertEqual(ds.metrics()["rows"], 100)
+
+  def test_save_load(self):
+    with tempfile.TemporaryDirectory() as directory:
+      path = os.path.join(directory, "table.bin")
+      self.table.save(path)
+      loaded = InMemoryTable.load(path)
+    self.assertTrue((self.read_all(loaded) == self.ten).all())
+
+  def test_pickle(self):
+    unpickled = pickle.loads(pickle.dumps(self.table))
+    self.assertTrue((self.read_all(unpickled) == self.ten).all())
+
+  def test_load_garbage(self):
+    with tempfile.TemporaryDirectory() as directory:
+      path = os.path.join(directory, "table.bin")
+      with open(path, "wb") as f:
+        f.write(b"definitely not a table")
+      self.assertRaises(RuntimeError, InMemoryTable.load, path)
+
+  def test_write_arguments(self):
+    self.assertRaises(ValueError, self.table.write_tensor, self.ten,
+                      ["fam1:col1"], row_keys(100))
+    self.assertRaises(ValueError, self.table.write_tensor, self.ten,
+                      ["col1", "col2"], row_keys(100))
+    self.assertRaises(ValueError, InMemoryTable, 0)
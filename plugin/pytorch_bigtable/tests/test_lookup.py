@@ -0,0 +1,107 @@
+# Copyright 2021 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# disable module docstring for tests
+# pylint: disable=C0114
+# disable class docstring for tests
+# pylint: disable=C0115
+import unittest
+import torch
+import os
+from concurrent.futures import ThreadPoolExecutor
+from .bigtable_emulator import BigtableEmulator
+from pytorch_bigtable import BigtableClient
+
+
+class BigtableLookupTest(unittest.TestCase):
+  def setUp(self):
+    self.emulator = BigtableEmulator()
+
+  def tearDown(self):
+    self.emulator.stop()
+
+  def _create_table(self):
+    os.environ["BIGTABLE_EMULATOR_HOST"] = self.emulator.get_addr()
+    self.emulator.create_table("fake_project", "fake_instance", "test-table",
+                               ["fam1", "fam2"])
+    client = BigtableClient("fake_project", "fake_instance",
+                            endpoint=self.emulator.get_addr())
+    table = client.get_table("test-table")
+    ten = torch.Tensor(list(range(40))).reshape(20, 2)
+    table.write_tensor(ten, ["fam1:col1", "fam2:col2"],
+                       ["row" + str(i).rjust(3, "0") for i in range(20)])
+    return table, ten
+
+  def test_lookup(self):
+    table, ten = self._create_table()
+
+    keys = ["row015", "row003", "missing", "row003", "row019"]
+    result, found = table.lookup(keys, ["fam2:col2", "fam1:col1"],
+                                 torch.float32, keys_per_request=2)
+
+    self.assertEqual(list(result.shape), [5, 2])
+    self.assertEqual(found.tolist(), [True, True, False, True, True])
+    for i, row in [(0, 15), (1, 3), (3, 3), (4, 19)]:
+      self.assertEqual(result[i].tolist(),
+                       [ten[row, 1].item(), ten[row, 0].item()])
+    self.assertEqual(result[2].tolist(), [0., 0.])
+
+  def test_lookup_default_value(self):
+    table, ten = self._create_table()
+
+    result, found = table.lookup(["row007", "missing"],
+                                 ["fam1:col1", "fam1:col2"], torch.float32,
+                                 timeout=10, hedge_after=0.001,
+                                 default_value=-1.)
+
+    self.assertEqual(found.tolist(), [True, False])
+    self.assertEqual(result.tolist(), [[ten[7, 0].item(), -1.], [-1., -1.]])
+
+  def test_lookup_hedged_many_chunks(self):
+    table, ten = self._create_table()
+
+    # More chunks than threads, so that some wait in the queue past
+    # `hedge_after`.
+    keys = ["row" + str(i).rjust(3, "0") for i in range(20)]
+    result, found = table.lookup(keys, ["fam1:col1", "fam2:col2"],
+                                 torch.float32, timeout=10, hedge_after=0.001,
+                                 keys_per_request=1)
+
+    self.assertTrue(found.all().item())
+    self.assertTrue(torch.equal(result, ten))
+
+  def test_lookup_from_threads(self):
+    table, ten = self._create_table()
+
+    def lookup(i):
+      key = "row" + str(i).rjust(3, "0")
+      return table.lookup([key], ["fam1:col1", "fam2:col2"], torch.float32)[0]
+
+    with ThreadPoolExecutor(8) as executor:
+      results = list(executor.map(lookup, range(20)))
+    self.assertTrue(torch.equal(torch.cat(results), ten))
+    session = table._lookup_session
+    self.assertIsNotNone(session)
+    lookup(0)
+    self.assertIs(table._lookup_session, session)
+
+  def test_lookup_arguments(self):
+    table, _ = self._create_table()
+
+    self.assertRaises(ValueError, table.lookup, ["row000"], ["fam1:col1"],
+                      torch.float32, keys_per_request=0)
+    self.assertRaises(ValueError, table.lookup, ["row000"], ["fam1:col1"],
+                      torch.float32, timeout=0)
+    self.assertRaises(ValueError, table.lookup, ["row000"], ["fam1:col1"],
+                      torch.float32, hedge_after=-1)
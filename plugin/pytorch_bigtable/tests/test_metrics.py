@@ -0,0 +1,87 @@
+# Copyright 2021 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# disable module docstring for tests
+# pylint: disable=C0114
+# disable class docstring for tests
+# pylint: disable=C0115
+import unittest
+import torch
+import os
+from .bigtable_emulator import BigtableEmulator
+from pytorch_bigtable import BigtableClient, row_set, row_range
+from torch.utils.data import DataLoader
+
+
+class BigtableMetricsTest(unittest.TestCase):
+  def setUp(self):
+    self.emulator = BigtableEmulator()
+    os.environ["BIGTABLE_EMULATOR_HOST"] = self.emulator.get_addr()
+    self.emulator.create_table("fake_project", "fake_instance", "test-table",
+                               ["fam1", "fam2"],
+                               ["row" + str(i).rjust(3, "0") for i in
+                                range(0, 100, 25)])
+    client = BigtableClient("fake_project", "fake_instance",
+                            endpoint=self.emulator.get_addr())
+    self.table = client.get_table("test-table")
+    ten = torch.Tensor(list(range(200))).reshape(100, 2)
+    self.table.write_tensor(ten, ["fam1:col1", "fam2:col2"],
+                            ["row" + str(i).rjust(3, "0") for i in
+                             range(100)])
+
+  def tearDown(self):
+    self.emulator.stop()
+
+  def test_iterator_metrics(self):
+    ds = self.table.read_rows(torch.float32, ["fam1:col1", "fam2:col2"],
+                              row_set.from_rows_or_ranges(
+                                row_range.infinite()))
+    it = iter(ds)
+    for _ in it:
+      pass
+
+    metrics = it.metrics()
+    self.assertEqual(metrics["rows"], 100)
+    self.assertEqual(metrics["cells"], 200)
+    self.assertGreater(metrics["bytes"], 100 * 2 * 4)
+    self.assertGreater(metrics["stream_wait_ns"], 0)
+    self.assertGreater(metrics["decode_ns"], 0)
+    self.assertGreater(metrics["first_row_ns"], 0)
+    self.assertEqual(ds.metrics(), metrics)
+
+  def test_cells_of_requested_columns(self):
+    ds = self.table.read_rows(torch.float32, ["fam1:col1"],
+                              row_set.from_rows_or_ranges(
+                                row_range.infinite()))
+    for _ in ds:
+      pass
+    self.assertEqual(ds.metrics()["cells"], 100)
+    # Reading in this process doesn't need shared memory.
+    self.assertFalse(ds._metrics.is_shared())
+
+  def test_dataset_metrics(self):
+    ds = self.table.read_rows(torch.float32, ["fam1:col1", "fam2:col2"],
+                              row_set.from_rows_or_ranges(
+                                row_range.infinite()))
+    for _ in DataLoader(ds, num_workers=3):
+      pass
+    self.assertEqual(ds.metrics()["rows"], 100)
+    self.assertEqual(ds.metrics()["cells"], 200)
+
+    for _ in DataLoader(ds, num_workers=2):
+      pass
+    self.assertEqual(ds.metrics()["rows"], 200)
+
+    ds.reset_metrics()
+    self.assertEqual(ds.metrics()["rows"], 0)
@@ -0,0 +1,93 @@
+# Copyright 2021 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# disable module docstring for tests
+# pylint: disable=C0114
+# disable class docstring for tests
+# pylint: disable=C0115
+import unittest
+import torch
+from pytorch_bigtable import InMemoryTable, row_set, row_range
+from torch.utils.data import DataLoader
+
+
+class MultiStreamTest(unittest.TestCase):
+  def setUp(self):
+    self.ten = torch.Tensor(list(range(2000))).reshape(1000, 2)
+    self.table = InMemoryTable(rows_per_tablet=10)
+    self.table.write_tensor(self.ten, ["fam1:col1", "fam2:col2"],
+                            ["row" + str(i).rjust(4, "0")
+                             for i in range(1000)])
+    self.all_rows = row_set.from_rows_or_ranges(row_range.infinite())
+
+  def sorted_rows(self, tensors):
+    output = torch.stack(list(tensors))
+    return output[output[:, 0].argsort()]
+
+  def test_read(self):
+    for num_streams in [1, 2, 7, 200]:
+      ds = self.table.read_rows(torch.float32, ["fam1:col1", "fam2:col2"],
+                                self.all_rows, num_streams=num_streams)
+      self.assertTrue((self.sorted_rows(ds) == self.ten).all())
+      self.assertEqual(ds.metrics()["rows"], 1000)
+
+  def test_read_row_set(self):
+    rs = row_set.from_rows_or_ranges(
+      row_range.right_open("row0105", "row0333"), "row0900")
+    ds = self.table.read_rows(torch.float32, ["fam1:col1", "fam2:col2"], rs,
+                              num_streams=4)
+    expected = torch.cat([self.ten[105:333], self.ten[900:901]])
+    self.assertTrue((self.sorted_rows(ds) == expected).all())
+
+  def test_ordered(self):
+    for num_streams in [1, 2, 7, 200]:
+      ds = self.table.read_rows(torch.float32, ["fam1:col1", "fam2:col2"],
+                                self.all_rows, num_streams=num_streams,
+                                ordered=True)
+      self.assertTrue((torch.stack(list(ds)) == self.ten).all())
+
+  def test_ordered_row_set(self):
+    rs = row_set.from_rows_or_ranges(
+      row_range.right_open("row0105", "row0333"), "row0900", "row0003")
+    ds = self.table.read_rows(torch.float32, ["fam1:col1", "fam2:col2"], rs,
+                              num_streams=3, ordered=True)
+    expected = torch.cat([self.ten[3:4], self.ten[105:333],
+                          self.ten[900:901]])
+    self.assertTrue((torch.stack(list(ds)) == expected).all())
+
+  def test_ordered_workers_reproducible(self):
+    ds = self.table.read_rows(torch.float32, ["fam1:col1", "fam2:col2"],
+                              self.all_rows, num_streams=3, ordered=True)
+    first = torch.stack(list(DataLoader(ds, num_workers=2, batch_size=None)))
+    second = torch.stack(list(DataLoader(ds, num_workers=2, batch_size=None)))
+    self.assertTrue((first == second).all())
+
+  def test_workers(self):
+    ds = self.table.read_rows(torch.float32, ["fam1:col1", "fam2:col2"],
+                              self.all_rows, num_streams=3)
+    loader = DataLoader(ds, num_workers=2, batch_size=None)
+    self.assertTrue((self.sorted_rows(loader) == self.ten).all())
+
+  def test_stop_early(self):
+    ds = self.table.read_rows(torch.float32, ["fam1:col1", "fam2:col2"],
+                              self.all_rows, num_streams=4)
+    it = iter(ds)
+    next(it)
+    # Destroying the iterator before the end stops and joins its threads.
+    del it
+
+  def test_invalid_num_streams(self):
+    with self.assertRaises(ValueError):
+      self.table.read_rows(torch.float32, ["fam1:col1", "fam2:col2"],
+                           self.all_rows, num_streams=0)
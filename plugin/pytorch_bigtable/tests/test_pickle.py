@@ -0,0 +1,84 @@
+# Copyright 2021 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# disable module docstring for tests
+# pylint: disable=C0114
+# disable class docstring for tests
+# pylint: disable=C0115
+# disable warning for access to protected members
+# pylint: disable=W0212
+import pickle
+import unittest
+import torch
+from pytorch_bigtable import (BigtableClient, InMemoryTable, pbt_C, row_range,
+                              row_set, version_filters)
+from torch.utils.data import DataLoader
+
+
+def _round_trip(obj):
+  return pickle.loads(pickle.dumps(obj))
+
+
+class PickleTest(unittest.TestCase):
+  def test_row_range(self):
+    for rr in [row_range.infinite(), row_range.empty(),
+               row_range.starting_at("row1"), row_range.ending_at("row1"),
+               row_range.left_open("row1", "row2"),
+               row_range.right_open("row1", "row2")]:
+      self.assertEqual(repr(rr), repr(_round_trip(rr)))
+
+  def test_row_set(self):
+    for rs in [row_set.empty(),
+               row_set.from_rows_or_ranges(row_range.empty()),
+               row_set.from_rows_or_ranges("row1", "row0",
+                                           row_range.prefix("abc")),
+               row_set.from_keys(["row" + str(i) for i in range(10000)])]:
+      self.assertEqual(repr(rs), repr(_round_trip(rs)))
+
+  def test_row_set_is_compact(self):
+    rs = row_set.from_keys(["row" + str(i).rjust(6, "0")
+                            for i in range(10000)])
+    # 9 bytes of every key and 2 bytes of protobuf framing.
+    self.assertLess(len(pickle.dumps(rs)), 10000 * 12)
+
+  def test_filter(self):
+    for f in [version_filters.latest(),
+              version_filters.timestamp_range(1000, 2000)]:
+      self.assertEqual(repr(f), repr(_round_trip(f)))
+
+  def test_key_list(self):
+    keys = _round_trip(pbt_C.KeyList(["row2", "row1", "row2"]))
+    self.assertEqual(len(keys), 2)
+
+  def test_table(self):
+    table = BigtableClient("fake_project", "fake_instance",
+                           endpoint="localhost:1").get_table("test-table")
+    table._lookup_session = object()
+    unpickled = _round_trip(table)
+    self.assertIsNone(unpickled._lookup_session)
+    self.assertEqual(unpickled._cache_key(), table._cache_key())
+
+  def test_spawn_workers(self):
+    table = InMemoryTable(rows_per_tablet=10)
+    ten = torch.Tensor(list(range(100))).reshape(50, 2)
+    table.write_tensor(ten, ["fam1:col1", "fam2:col2"],
+                       ["row" + str(i).rjust(3, "0") for i in range(50)])
+    ds = table.read_rows(torch.float32, ["fam1:col1", "fam2:col2"],
+                         row_set.from_rows_or_ranges(
+                           row_range.right_open("row010", "row040")))
+
+    loader = DataLoader(ds, num_workers=2, multiprocessing_context="spawn")
+    output = sorted(loader, key=lambda x: x[0, 0].item())
+
+    self.assertTrue((torch.cat(output) == ten[10:40]).all())
@@ -0,0 +1,77 @@
+# Copyright 2021 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# disable module docstring for tests
+# pylint: disable=C0114
+# disable class docstring for tests
+# pylint: disable=C0115
+import os
+import time
+import unittest
+import torch
+from .bigtable_emulator import BigtableEmulator
+from .helpers import row_keys
+from pytorch_bigtable import BigtableClient, row_set, row_range
+from torch.utils.data import DataLoader
+
+_COLUMNS = ["fam1:col1", "fam2:col2"]
+
+
+class RateLimitTest(unittest.TestCase):
+  def setUp(self):
+    self.emulator = BigtableEmulator()
+    os.environ["BIGTABLE_EMULATOR_HOST"] = self.emulator.get_addr()
+    self.emulator.create_table("fake_project", "fake_instance", "test-table",
+                               ["fam1", "fam2"])
+    self.ten = torch.Tensor(list(range(600))).reshape(300, 2)
+    self.all_rows = row_set.from_rows_or_ranges(row_range.infinite())
+
+  def tearDown(self):
+    self.emulator.stop()
+
+  def _client(self, **limits):
+    return BigtableClient("fake_project", "fake_instance",
+                          endpoint=self.emulator.get_addr(), **limits)
+
+  def test_invalid_limits(self):
+    with self.assertRaises(ValueError):
+      self._client(max_rows_per_second=0)
+    with self.assertRaises(ValueError):
+      self._client(max_bytes_per_second=-1.)
+
+  def test_write_rows_per_second(self):
+    table = self._client(max_rows_per_second=100).get_table("test-table")
+    start = time.monotonic()
+    table.write_tensor(self.ten, _COLUMNS, row_keys(300))
+    # One second worth of rows is allowed at once.
+    self.assertGreaterEqual(time.monotonic() - start, 1.9)
+
+  def test_read_rows_per_second(self):
+    self._client().get_table("test-table").write_tensor(self.ten, _COLUMNS,
+                                                        row_keys(300))
+    table = self._client(max_rows_per_second=100).get_table("test-table")
+    start = time.monotonic()
+    rows = list(table.read_rows(torch.float32, _COLUMNS, self.all_rows))
+    self.assertEqual(len(rows), 300)
+    self.assertGreaterEqual(time.monotonic() - start, 1.9)
+
+  def test_limit_divided_among_workers(self):
+    self._client().get_table("test-table").write_tensor(self.ten, _COLUMNS,
+                                                        row_keys(300))
+    table = self._client(max_rows_per_second=100).get_table("test-table")
+    ds = table.read_rows(torch.float32, _COLUMNS, self.all_rows)
+    start = time.monotonic()
+    rows = list(DataLoader(ds, batch_size=None, num_workers=3))
+    self.assertEqual(len(rows), 300)
+    self.assertGreaterEqual(time.monotonic() - start, 1.9)
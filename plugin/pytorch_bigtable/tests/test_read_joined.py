@@ -0,0 +1,93 @@
+# Copyright 2021 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# disable module docstring for tests
+# pylint: disable=C0114
+# disable class docstring for tests
+# pylint: disable=C0115
+import unittest
+import torch
+from .helpers import row_keys
+from pytorch_bigtable import InMemoryTable, read_joined, row_set, row_range
+from torch.utils.data import DataLoader
+
+
+class ReadJoinedTest(unittest.TestCase):
+  def setUp(self):
+    self.features = InMemoryTable(rows_per_tablet=100)
+    self.features.write_tensor(
+      torch.arange(2000, dtype=torch.float32).reshape(1000, 2),
+      ["f:a", "f:b"], row_keys(1000))
+    # Labels of every third row only.
+    self.labels = InMemoryTable(rows_per_tablet=30)
+    self.labels.write_tensor(
+      torch.arange(0, 1000, 3, dtype=torch.int64).reshape(-1, 1), ["l:y"],
+      row_keys(range(0, 1000, 3)))
+    self.all_rows = row_set.from_rows_or_ranges(row_range.infinite())
+
+  def _tables(self):
+    return [(self.features, ["f:a", "f:b"], torch.float32),
+            (self.labels, ["l:y"], torch.int64)]
+
+  def test_inner(self):
+    ds = read_joined(self._tables(), self.all_rows)
+    self.assertEqual(ds.columns, ["f:a", "f:b", "l:y"])
+    rows = list(ds)
+    self.assertEqual(len(rows), 334)
+    for i, row in zip(range(0, 1000, 3), rows):
+      self.assertEqual(row.dtype, torch.float32)
+      self.assertEqual(row.tolist(), [2 * i, 2 * i + 1, i])
+
+  def test_left(self):
+    ds = read_joined(self._tables(), self.all_rows, how="left", concat=False,
+                     default_value=-1)
+    rows = list(ds)
+    self.assertEqual(len(rows), 1000)
+    for i, (features, labels) in enumerate(rows):
+      self.assertEqual(features.tolist(), [2 * i, 2 * i + 1])
+      self.assertEqual(labels.dtype, torch.int64)
+      self.assertEqual(labels.tolist(), [i if i % 3 == 0 else -1])
+
+  def test_inner_with_missing_left_rows(self):
+    rs = row_set.from_rows_or_ranges(
+      row_range.right_open("row0100", "row0200"), "row0999", "row1500")
+    ds = read_joined(list(reversed(self._tables())), rs)
+    keys = [int(row[0]) for row in ds]
+    self.assertEqual(keys, list(range(102, 200, 3)) + [999])
+
+  def test_workers(self):
+    ds = read_joined(self._tables(), self.all_rows)
+    rows = list(DataLoader(ds, batch_size=None, num_workers=3))
+    self.assertEqual(sorted(int(row[2]) for row in rows),
+                     list(range(0, 1000, 3)))
+
+  def test_wildcards(self):
+    self.labels.write_tensor(torch.ones(1, 1, dtype=torch.int64), ["l:z"],
+                             ["row0999"])
+    tables = [(self.features, ["f:*"], torch.float32),
+              (self.labels, ["l:*"], torch.int64)]
+    self.assertEqual(read_joined(tables, self.all_rows).columns,
+                     ["f:a", "f:b", "l:y", "l:z"])
+    self.assertEqual(
+      read_joined(tables, self.all_rows, discovery_rows=10).columns,
+      ["f:a", "f:b", "l:y"])
+    self.assertEqual(
+      read_joined(tables, self.all_rows, schema_row_key="row0999").columns,
+      ["f:a", "f:b", "l:y", "l:z"])
+
+  def test_invalid_args(self):
+    with self.assertRaises(ValueError):
+      read_joined([], self.all_rows)
+    with self.assertRaises(ValueError):
+      read_joined(self._tables(), self.all_rows, how="outer")
@@ -0,0 +1,83 @@
+# Copyright 2021 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# disable module docstring for tests
+# pylint: disable=C0114
+# disable class docstring for tests
+# pylint: disable=C0115
+import unittest
+import torch
+import os
+from .bigtable_emulator import BigtableEmulator
+from pytorch_bigtable import BigtableClient, InMemoryTable, pbt_C
+from torch.utils.data import DataLoader
+
+
+def _row_key(i):
+  return "row" + str(i).rjust(3, "0")
+
+
+class BigtableReadKeysTest(unittest.TestCase):
+  def setUp(self):
+    self.emulator = BigtableEmulator()
+
+  def tearDown(self):
+    self.emulator.stop()
+
+  def _create_table(self):
+    os.environ["BIGTABLE_EMULATOR_HOST"] = self.emulator.get_addr()
+    self.emulator.create_table("fake_project", "fake_instance", "test-table",
+                               ["fam1", "fam2"])
+    client = BigtableClient("fake_project", "fake_instance",
+                            endpoint=self.emulator.get_addr())
+    table = client.get_table("test-table")
+    ten = torch.Tensor(list(range(200))).reshape(100, 2)
+    table.write_tensor(ten, ["fam1:col1", "fam2:col2"],
+                       [_row_key(i) for i in range(100)])
+    return table, ten
+
+  def test_read_keys(self):
+    table, ten = self._create_table()
+    rows = list(range(0, 100, 3))
+    keys = [_row_key(i) for i in reversed(rows)] + ["missing", _row_key(3)]
+
+    ds = table.read_keys(torch.float32, ["fam1:col1", "fam2:col2"], keys,
+                         keys_per_request=4, max_in_flight=3)
+    output = sorted(ds, key=lambda x: x[0].item())
+
+    self.assertTrue((torch.stack(output) == ten[rows]).all())
+    self.assertEqual(ds.metrics()["rows"], len(rows))
+
+  def test_read_keys_parallel(self):
+    table, ten = self._create_table()
+    keys = pbt_C.KeyList([_row_key(i) for i in range(100)])
+    self.assertEqual(len(keys), 100)
+
+    ds = table.read_keys(torch.float32, ["fam1:col1", "fam2:col2"], keys,
+                         keys_per_request=7, max_in_flight=2)
+    output = list(DataLoader(ds, num_workers=3))
+    output = sorted(output, key=lambda x: x[0, 0].item())
+
+    self.assertTrue((torch.cat(output) == ten).all())
+
+  def test_read_keys_in_memory(self):
+    table = InMemoryTable()
+    ten = torch.Tensor(list(range(200))).reshape(100, 2)
+    table.write_tensor(ten, ["fam1:col1", "fam2:col2"],
+                       [_row_key(i) for i in range(100)])
+
+    ds = table.read_keys(torch.float32, ["fam1:col1", "fam2:col2"],
+                         [_row_key(50), _row_key(10), "missing"])
+
+    self.assertTrue((torch.stack(list(ds)) == ten[[10, 50]]).all())
@@ -0,0 +1,98 @@
+# Copyright 2021 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# disable module docstring for tests
+# pylint: disable=C0114
+# disable class docstring for tests
+# pylint: disable=C0115
+import os
+import unittest
+import torch
+from .bigtable_emulator import BigtableEmulator
+from .helpers import row_keys
+from pytorch_bigtable import (BigtableClient, InMemoryTable, row_set,
+                              row_range)
+
+
+class InMemoryReadTensorTest(unittest.TestCase):
+  def setUp(self):
+    self.ten = torch.Tensor(list(range(2000))).reshape(1000, 2)
+    self.table = InMemoryTable(rows_per_tablet=30)
+    self.table.write_tensor(self.ten, ["fam1:col1", "fam2:col2"],
+                            row_keys(1000))
+    self.all_rows = row_set.from_rows_or_ranges(row_range.infinite())
+
+  def test_read(self):
+    for num_streams in [1, 3, 100]:
+      output = self.table.read_tensor(torch.float32,
+                                      ["fam1:col1", "fam2:col2"],
+                                      self.all_rows, num_streams=num_streams)
+      self.assertEqual(output.shape, (1000, 2))
+      self.assertTrue((output == self.ten).all())
+
+  def test_with_row_keys(self):
+    output, keys = self.table.read_tensor(
+      torch.float32, ["fam1:col1", "fam2:col2"], self.all_rows,
+      with_row_keys=True)
+    self.assertTrue((output == self.ten).all())
+    self.assertEqual(keys, row_keys(1000))
+
+  def test_row_set(self):
+    rs = row_set.from_rows_or_ranges(
+      row_range.right_open("row0105", "row0333"), "row0900", "row0003")
+    output, keys = self.table.read_tensor(torch.float32, ["fam2:col2"], rs,
+                                          with_row_keys=True)
+    expected = torch.cat([self.ten[3:4], self.ten[105:333],
+                          self.ten[900:901]])[:, 1:]
+    self.assertTrue((output == expected).all())
+    self.assertEqual(keys, ["row0003"] + row_keys(333)[105:] + ["row0900"])
+
+  def test_empty(self):
+    rs = row_set.from_rows_or_ranges(row_range.right_open("x", "y"))
+    output = self.table.read_tensor(torch.int64, ["fam1:col1", "fam2:col2"],
+                                    rs)
+    self.assertEqual(output.shape, (0, 2))
+    self.assertEqual(output.dtype, torch.int64)
+
+  def test_default_value(self):
+    output = self.table.read_tensor(torch.float32,
+                                    ["fam1:col1", "fam1:missing"],
+                                    self.all_rows, default_value=-1.)
+    self.assertTrue((output[:, 0] == self.ten[:, 0]).all())
+    self.assertTrue((output[:, 1] == -1).all())
+
+
+class ReadTensorTest(unittest.TestCase):
+  def setUp(self):
+    self.emulator = BigtableEmulator()
+
+  def tearDown(self):
+    self.emulator.stop()
+
+  def test_read(self):
+    os.environ["BIGTABLE_EMULATOR_HOST"] = self.emulator.get_addr()
+    self.emulator.create_table("fake_project", "fake_instance", "test-table",
+                               ["fam1", "fam2"], splits=["row0050", "row0120"])
+    ten = torch.Tensor(list(range(400))).reshape(200, 2)
+    client = BigtableClient("fake_project", "fake_instance",
+                            endpoint=self.emulator.get_addr())
+    table = client.get_table("test-table")
+    table.write_tensor(ten, ["fam1:col1", "fam2:col2"], row_keys(200))
+
+    output, keys = table.read_tensor(
+      torch.float32, ["fam1:col1", "fam2:col2"],
+      row_set.from_rows_or_ranges(row_range.infinite()), with_row_keys=True,
+      num_streams=3)
+    self.assertTrue((output == ten).all())
+    self.assertEqual(keys, row_keys(200))
@@ -0,0 +1,94 @@
+# Copyright 2021 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# disable module docstring for tests
+# pylint: disable=C0114
+# disable class docstring for tests
+# pylint: disable=C0115
+import unittest
+import torch
+from pytorch_bigtable import InMemoryTable, row_keys, row_set
+
+try:
+  import numpy as np
+except ImportError:
+  np = None
+
+
+class RowKeysTest(unittest.TestCase):
+  def setUp(self):
+    self.ten = torch.Tensor(list(range(20))).reshape(10, 2)
+
+  def test_template(self):
+    keys = row_keys.template("row{index:03}", start=5).generate(self.ten)
+    self.assertEqual(keys, ["row" + str(i).rjust(3, "0")
+                            for i in range(5, 15)])
+
+  def test_offset(self):
+    keys = row_keys.template("{index}").generate(self.ten, 7)
+    self.assertEqual(keys, [str(i) for i in range(7, 17)])
+
+  def test_braces(self):
+    keys = row_keys.template("{{{index}}}").generate(self.ten[:1])
+    self.assertEqual(keys, ["{0}"])
+
+  def test_salt(self):
+    keys = row_keys.template("{salt}#{index:04}",
+                             salt_buckets=16).generate(self.ten)
+    self.assertEqual([k[3:] for k in keys],
+                     [str(i).rjust(4, "0") for i in range(10)])
+    self.assertTrue(all(0 <= int(k[:2]) < 16 for k in keys))
+    self.assertGreater(len({k[:2] for k in keys}), 1)
+    # The salt only depends on the index.
+    self.assertEqual(keys, row_keys.template(
+      "{salt}#{index:04}", salt_buckets=16).generate(self.ten))
+
+  def test_from_column(self):
+    ten = torch.tensor([[3., 1.], [1., 2.], [2., 3.]])
+    keys = row_keys.from_column(0, "user{index}").generate(ten)
+    self.assertEqual(keys, ["user3", "user1", "user2"])
+
+  def test_invalid_template(self):
+    for fmt in ["{index", "{foo}", "{index:4}", "{index:0x}"]:
+      with self.assertRaises(ValueError):
+        row_keys.template(fmt)
+    with self.assertRaises(ValueError):
+      row_keys.template("{salt}")
+    with self.assertRaises(ValueError):
+      row_keys.template("{index}", salt_buckets=0)
+
+  def test_write_tensor(self):
+    table = InMemoryTable()
+    table.write_tensor(self.ten, ["fam1:col1", "fam2:col2"],
+                       row_keys.template("row{index:03}"))
+    table.write_tensor(self.ten, ["fam1:col1", "fam2:col2"],
+                       row_keys.template("row{index:03}", start=10))
+    ds = table.read_rows(torch.float32, ["fam1:col1", "fam2:col2"],
+                         row_set.from_keys(["row000", "row015"]))
+    output = torch.stack(list(ds))
+    self.assertTrue((output == self.ten[[0, 5]]).all())
+
+  @unittest.skipIf(np is None, "numpy is not installed")
+  def test_write_tensor_numpy_keys(self):
+    table = InMemoryTable()
+    keys = np.array([f"row{i:03}" for i in range(10)], dtype="S")
+    table.write_tensor(self.ten, ["fam1:col1", "fam2:col2"], keys)
+    ds = table.read_rows(torch.float32, ["fam1:col1", "fam2:col2"],
+                         row_set.from_keys(["row003"]))
+    self.assertTrue((torch.stack(list(ds)) == self.ten[3:4]).all())
+
+  def test_write_tensor_wrong_number_of_keys(self):
+    with self.assertRaises(ValueError):
+      InMemoryTable().write_tensor(self.ten, ["fam1:col1", "fam2:col2"],
+                                   ["a", "b"])
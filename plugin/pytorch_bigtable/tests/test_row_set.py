@@ -16,9 +16,16 @@
 # pylint: disable=C0114
 # disable class docstring for tests
 # pylint: disable=C0115
-from unittest import TestCase
+import os
+import tempfile
+from unittest import TestCase, skipIf
 from pytorch_bigtable import row_set, row_range
 
+try:
+  import numpy
+except ImportError:
+  numpy = None
+
 
 class RowRangeTest(TestCase):
   def test_infinite(self):
@@ -109,3 +116,77 @@ class TestRowSet(TestCase):
         'row_ranges {\n' + '  start_key_closed: "row3"\n' + '  end_key_open: '
                                                             '"row5"\n' + '}\n')
     self.assertEqual(expected, repr(r_set))
+
+
+class TestBulkRowSet(TestCase):
+  def test_from_keys_sorts_and_deduplicates(self):
+    expected = ('row_keys: "row1"\n'
+                'row_keys: "row2"\n'
+                'row_keys: "row3"\n')
+    self.assertEqual(expected,
+                     repr(row_set.from_keys(['row3', 'row1', b'row2',
+                                             'row1'])))
+
+  def test_from_keys_merges_ranges(self):
+    r_set = row_set.from_keys(['row0', 'row2', 'row5'],
+                              row_range.closed_range('row1', 'row3'),
+                              row_range.right_open('row3', 'row4'))
+    expected = ('row_keys: "row0"\n'
+                'row_keys: "row5"\n'
+                'row_ranges {\n'
+                '  start_key_closed: "row1"\n'
+                '  end_key_open: "row4"\n'
+                '}\n')
+    self.assertEqual(expected, repr(r_set))
+
+  def test_from_keys_infinite_range(self):
+    r_set = row_set.from_keys(['row0', 'row5'], row_range.starting_at('row1'),
+                              row_range.closed_range('row2', 'row3'))
+    expected = ('row_keys: "row0"\n'
+                'row_ranges {\n'
+                '  start_key_closed: "row1"\n'
+                '}\n')
+    self.assertEqual(expected, repr(r_set))
+
+  def test_from_keys_drops_empty_ranges(self):
+    r_set = row_set.from_keys(['row1'], row_range.empty())
+    self.assertEqual('row_keys: "row1"\n', repr(r_set))
+    self.assertTrue(row_set.from_keys([], row_range.empty()).is_empty())
+
+  def test_from_keys_wrong_type(self):
+    self.assertRaises(TypeError, row_set.from_keys, ['row1', 2])
+
+  @skipIf(numpy is None, 'numpy is not installed')
+  def test_from_numpy(self):
+    expected = ('row_keys: "a"\n'
+                'row_keys: "row1"\n'
+                'row_keys: "row22"\n')
+    keys = numpy.array(['row22', 'row1', 'a', 'row1'])
+    self.assertEqual(expected, repr(row_set.from_keys(keys)))
+    self.assertEqual(expected, repr(row_set.from_keys(keys.astype('S'))))
+    self.assertEqual(expected,
+                     repr(row_set.from_keys(keys.astype('S')[::-1])))
+
+  def test_from_key_file(self):
+    with tempfile.TemporaryDirectory() as directory:
+      path = os.path.join(directory, 'keys.txt')
+      with open(path, 'wb') as f:
+        f.write(b'row2\nrow1\r\n\nrow2\nrow3')
+      r_set = row_set.from_key_file(path, row_range.closed_range('row3',
+                                                                 'row4'))
+      empty_path = os.path.join(directory, 'empty.txt')
+      with open(empty_path, 'wb'):
+        pass
+      empty_set = row_set.from_key_file(empty_path)
+    expected = ('row_keys: "row1"\n'
+                'row_keys: "row2"\n'
+                'row_ranges {\n'
+                '  start_key_closed: "row3"\n'
+                '  end_key_open: "row4\\000"\n'
+                '}\n')
+    self.assertEqual(expected, repr(r_set))
+    self.assertTrue(empty_set.is_empty())
+
+  def test_from_key_file_missing(self):
+    self.assertRaises(RuntimeError, row_set.from_key_file,
+                      '/nonexistent/keys.txt')
@@ -0,0 +1,82 @@
+# Copyright 2021 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# disable module docstring for tests
+# pylint: disable=C0114
+# disable class docstring for tests
+# pylint: disable=C0115
+import unittest
+import os
+import pickle
+import tempfile
+import torch
+from .bigtable_emulator import BigtableEmulator
+from pytorch_bigtable import BigtableClient, row_set, row_range
+
+
+class BigtableSampleRowKeysTest(unittest.TestCase):
+  def setUp(self):
+    self.emulator = BigtableEmulator()
+    os.environ["BIGTABLE_EMULATOR_HOST"] = self.emulator.get_addr()
+    self.emulator.create_table("fake_project", "fake_instance", "test-table",
+                               ["fam1"], ["row100", "row200"])
+    self.client = BigtableClient("fake_project", "fake_instance",
+                                 endpoint=self.emulator.get_addr())
+
+  def tearDown(self):
+    self.emulator.stop()
+
+  def test_shared_cache(self):
+    samples = self.client.get_table("test-table").sample_row_keys()
+    self.assertGreater(len(samples), 0)
+    # Every caller gets its own copy of the cached samples.
+    samples.append(("zzz", 0))
+    other = self.client.get_table("test-table").sample_row_keys()
+    self.assertEqual(samples[:-1], other)
+
+  def test_ttl(self):
+    samples = self.client.get_table("test-table").sample_row_keys()
+    table = self.client.get_table("test-table", sample_row_keys_ttl=0)
+    refreshed = table.sample_row_keys()
+    self.assertIsNot(samples, refreshed)
+    self.assertEqual(samples, refreshed)
+
+  def test_set(self):
+    table = self.client.get_table("test-table", sample_row_keys_ttl=None)
+    table.set_sample_row_keys([("row050", 10), ("row150", 20)])
+    self.assertEqual(
+      self.client.get_table("test-table").sample_row_keys(),
+      [("row050", 10), ("row150", 20)])
+
+  def test_save_load(self):
+    table = self.client.get_table("test-table")
+    samples = table.sample_row_keys()
+    with tempfile.TemporaryDirectory() as tmp_dir:
+      path = os.path.join(tmp_dir, "samples.json")
+      table.save_sample_row_keys(path)
+      table.set_sample_row_keys([])
+      table.load_sample_row_keys(path)
+    self.assertEqual(table.sample_row_keys(), samples)
+
+  def test_dataset_samples_once(self):
+    table = self.client.get_table("test-table", sample_row_keys_ttl=None)
+    table.set_sample_row_keys([("row050", 10), ("", 30)])
+    ds = table.read_rows(torch.float32, ["fam1:col1"],
+                         row_set.from_rows_or_ranges(row_range.infinite()))
+    # Creating the dataset doesn't sample the table.
+    self.assertIsNone(ds._sample_row_keys)
+    self.assertEqual(ds.estimated_bytes, 30)
+    # The workers get the samples taken before they were started.
+    table.set_sample_row_keys([("", 1000)])
+    self.assertEqual(pickle.loads(pickle.dumps(ds)).estimated_bytes, 30)
@@ -0,0 +1,86 @@
+# Copyright 2021 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# disable module docstring for tests
+# pylint: disable=C0114
+# disable class docstring for tests
+# pylint: disable=C0115
+import unittest
+import torch
+from .helpers import row_keys
+from pytorch_bigtable import InMemoryTable, row_set, row_range
+from torch.utils.data import DataLoader
+
+try:
+  import numpy as np
+except ImportError:
+  np = None
+
+
+def _decode_offsets(chunk):
+  offsets, data = chunk
+  data = bytes(data.tolist())
+  return [data[offsets[i]:offsets[i + 1]].decode()
+          for i in range(len(offsets) - 1)]
+
+
+class ScanKeysTest(unittest.TestCase):
+  def setUp(self):
+    self.table = InMemoryTable(rows_per_tablet=100)
+    self.table.write_tensor(torch.ones(1000, 1), ["fam1:col1"],
+                            row_keys(1000))
+    # Rows are scanned regardless of their columns.
+    self.table.write_tensor(torch.ones(10, 1), ["fam2:col2"],
+                            ["other" + str(i) for i in range(10)])
+    self.all_rows = row_set.from_rows_or_ranges(row_range.infinite())
+    self.expected = sorted(row_keys(1000) +
+                           ["other" + str(i) for i in range(10)])
+
+  def test_offsets(self):
+    chunks = list(self.table.scan_keys(self.all_rows, chunk_size=300,
+                                       output="offsets"))
+    self.assertEqual([len(chunk[0]) - 1 for chunk in chunks],
+                     [300, 300, 300, 110])
+    self.assertEqual(chunks[0][0].dtype, torch.int64)
+    self.assertEqual(chunks[0][1].dtype, torch.uint8)
+    keys = [key for chunk in chunks for key in _decode_offsets(chunk)]
+    self.assertEqual(keys, self.expected)
+
+  @unittest.skipIf(np is None, "numpy is not installed")
+  def test_numpy(self):
+    rs = row_set.from_rows_or_ranges(
+      row_range.right_open("row0100", "row0250"), "row0900", "other1", "a")
+    chunks = list(self.table.scan_keys(rs, chunk_size=100))
+    self.assertTrue(all(chunk.dtype.kind == "S" for chunk in chunks))
+    keys = np.concatenate(chunks).tolist()
+    self.assertEqual(keys, [b"other1"] +
+                     [key.encode() for key in row_keys(250)[100:]] +
+                     [b"row0900"])
+
+  def test_empty(self):
+    rs = row_set.from_rows_or_ranges(row_range.right_open("x", "y"))
+    self.assertEqual(list(self.table.scan_keys(rs, output="offsets")), [])
+
+  def test_workers(self):
+    ds = self.table.scan_keys(self.all_rows, chunk_size=64, output="offsets")
+    loader = DataLoader(ds, batch_size=None, num_workers=3)
+    keys = [key for chunk in loader for key in _decode_offsets(chunk)]
+    self.assertEqual(sorted(keys), self.expected)
+
+  def test_invalid_args(self):
+    with self.assertRaises(ValueError):
+      self.table.scan_keys(self.all_rows, chunk_size=0)
+    with self.assertRaises(ValueError):
+      self.table.scan_keys(self.all_rows, output="list")
+
@@ -0,0 +1,128 @@
+# Copyright 2021 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# disable module docstring for tests
+# pylint: disable=C0114
+# disable class docstring for tests
+# pylint: disable=C0115
+import os
+import pickle
+import tempfile
+import unittest
+import torch
+from .bigtable_emulator import BigtableEmulator
+from .helpers import row_keys
+from pytorch_bigtable import (BigtableClient, InMemoryTable, row_set,
+                              row_range)
+
+_COLUMNS = ["fam1:col1", "fam2:col2"]
+
+
+class SnapshotTest(unittest.TestCase):
+  def setUp(self):
+    self.emulator = BigtableEmulator()
+    os.environ["BIGTABLE_EMULATOR_HOST"] = self.emulator.get_addr()
+    self.emulator.create_table("fake_project", "fake_instance", "test-table",
+                               ["fam1", "fam2"])
+    client = BigtableClient("fake_project", "fake_instance",
+                            endpoint=self.emulator.get_addr())
+    self.table = client.get_table("test-table")
+    self.all_rows = row_set.from_rows_or_ranges(row_range.infinite())
+
+  def tearDown(self):
+    self.emulator.stop()
+
+  def _read(self, snapshot):
+    return snapshot.read_tensor(torch.float32, _COLUMNS, self.all_rows,
+                                with_row_keys=True)
+
+  def test_first_sync(self):
+    ten = torch.arange(40, dtype=torch.float32).reshape(20, 2)
+    self.table.write_tensor(ten, _COLUMNS, row_keys(20))
+    snapshot, stats = self.table.sync_snapshot()
+    self.assertIsNotNone(snapshot.synced_micros)
+    self.assertEqual(stats["rows"], 20)
+    self.assertEqual(stats["cells"], 40)
+    self.assertGreater(stats["bytes"], 40 * 4)
+    data, keys = self._read(snapshot)
+    self.assertEqual(keys, row_keys(20))
+    self.assertTrue(torch.equal(data, ten))
+
+  def test_delta_merged(self):
+    ten = torch.arange(40, dtype=torch.float32).reshape(20, 2)
+    self.table.write_tensor(ten, _COLUMNS, row_keys(20))
+    snapshot, _ = self.table.sync_snapshot(overlap=0)
+    first_sync = snapshot.synced_micros
+
+    # Update some cells and add rows.
+    self.table.write_tensor(torch.full((2, 1), -1.), ["fam2:col2"],
+                            row_keys([3, 7]))
+    self.table.write_tensor(torch.full((2, 2), 100.), _COLUMNS,
+                            row_keys([20, 21]))
+    synced, stats = self.table.sync_snapshot(snapshot, overlap=0)
+    self.assertIs(synced, snapshot)
+    # Only the changed cells are read again.
+    self.assertEqual(stats["rows"], 4)
+    self.assertEqual(stats["cells"], 6)
+    self.assertGreater(snapshot.synced_micros, first_sync)
+
+    expected = torch.cat([ten, torch.full((2, 2), 100.)])
+    expected[3, 1] = -1.
+    expected[7, 1] = -1.
+    data, keys = self._read(snapshot)
+    self.assertEqual(keys, row_keys(22))
+    self.assertTrue(torch.equal(data, expected))
+
+  def test_columns(self):
+    ten = torch.arange(40, dtype=torch.float32).reshape(20, 2)
+    self.table.write_tensor(ten, _COLUMNS, row_keys(20))
+    snapshot, stats = self.table.sync_snapshot(columns=["fam1:*"])
+    self.assertEqual(stats["cells"], 20)
+    data = snapshot.read_tensor(torch.float32, _COLUMNS, self.all_rows,
+                                default_value=-1.)
+    self.assertTrue(torch.equal(data[:, 0], ten[:, 0]))
+    self.assertTrue((data[:, 1] == -1.).all().item())
+
+  def test_wildcard_matched_in_every_row(self):
+    self.table.write_tensor(torch.ones(1100, 1), ["fam1:col1"],
+                            row_keys(1100))
+    # A column which only appears far into the table.
+    self.table.write_tensor(torch.full((1, 1), 2.), ["fam1:late"],
+                            row_keys([1099]))
+    self.table.write_tensor(torch.ones(1, 1), ["fam2:col2"], row_keys(1))
+    snapshot, stats = self.table.sync_snapshot(
+      columns=["fam1:l*", "fam2:col2"])
+    self.assertEqual(stats["rows"], 2)
+    self.assertEqual(stats["cells"], 2)
+    data, keys = snapshot.read_tensor(torch.float32, ["fam1:late", "fam2:col2"],
+                                      self.all_rows, default_value=-1.,
+                                      with_row_keys=True)
+    self.assertEqual(keys, row_keys([0, 1099]))
+    self.assertEqual(data.tolist(), [[-1., 1.], [2., -1.]])
+
+  def test_saved_with_sync_time(self):
+    self.table.write_tensor(torch.ones(2, 2), _COLUMNS, row_keys(2))
+    snapshot, _ = self.table.sync_snapshot()
+    with tempfile.TemporaryDirectory() as directory:
+      path = os.path.join(directory, "snapshot")
+      snapshot.save(path)
+      loaded = InMemoryTable.load(path)
+    self.assertEqual(loaded.synced_micros, snapshot.synced_micros)
+    self.assertEqual(pickle.loads(pickle.dumps(snapshot)).synced_micros,
+                     snapshot.synced_micros)
+    self.assertEqual(len(loaded), 2)
+
+  def test_invalid_overlap(self):
+    with self.assertRaises(ValueError):
+      self.table.sync_snapshot(overlap=-1.)
@@ -0,0 +1,79 @@
+# Copyright 2021 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# disable module docstring for tests
+# pylint: disable=C0114
+# disable class docstring for tests
+# pylint: disable=C0115
+import json
+import unittest
+import tempfile
+import torch
+import os
+from .bigtable_emulator import BigtableEmulator
+from pytorch_bigtable import BigtableClient, row_set, row_range, tracing
+from torch.utils.data import DataLoader
+
+
+class BigtableTracingTest(unittest.TestCase):
+  def setUp(self):
+    self.emulator = BigtableEmulator()
+    self.trace_dir = tempfile.TemporaryDirectory()
+
+  def tearDown(self):
+    tracing.disable()
+    self.trace_dir.cleanup()
+    self.emulator.stop()
+
+  def test_trace(self):
+    os.environ["BIGTABLE_EMULATOR_HOST"] = self.emulator.get_addr()
+    self.emulator.create_table("fake_project", "fake_instance", "test-table",
+                               ["fam1", "fam2"], ["row050"])
+    client = BigtableClient("fake_project", "fake_instance",
+                            endpoint=self.emulator.get_addr())
+    table = client.get_table("test-table")
+
+    # A trace left by an earlier run, which must not be merged.
+    with open(os.path.join(self.trace_dir.name, "pytorch_bigtable-1.json"),
+              "w", encoding="UTF-8") as f:
+      json.dump({"traceEvents": [{"name": "stale", "ph": "X"}]}, f)
+
+    tracing.enable(self.trace_dir.name)
+    self.assertTrue(tracing.is_enabled())
+
+    ten = torch.Tensor(list(range(200))).reshape(100, 2)
+    table.write_tensor(ten, ["fam1:col1", "fam2:col2"],
+                       ["row" + str(i).rjust(3, "0") for i in range(100)])
+    ds = table.read_rows(torch.float32, ["fam1:col1", "fam2:col2"],
+                         row_set.from_rows_or_ranges(row_range.infinite()))
+    for _ in DataLoader(ds, num_workers=2):
+      pass
+
+    output_path = os.path.join(self.trace_dir.name, "merged.trace")
+    tracing.merge(output_path)
+    with open(output_path, "r", encoding="UTF-8") as f:
+      events = json.load(f)["traceEvents"]
+
+    spans = [event for event in events if event["ph"] == "X"]
+    names = {event["name"] for event in spans}
+    for name in ["write_tensor", "write_row", "stream_open", "first_row",
+                 "read_batch"]:
+      self.assertIn(name, names)
+    self.assertNotIn("stale", names)
+    self.assertEqual(
+      len([event for event in spans if event["name"] == "write_row"]), 100)
+    self.assertEqual({event["args"]["worker_id"] for event in spans},
+                     {-1, 0, 1})
+    self.assertEqual(sum(event["args"]["rows"] for event in spans if
+                         event["name"] == "read_batch"), 100)
@@ -0,0 +1,104 @@
+# Copyright 2021 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# disable module docstring for tests
+# pylint: disable=C0114
+# disable class docstring for tests
+# pylint: disable=C0115
+import unittest
+import torch
+import os
+from .bigtable_emulator import BigtableEmulator
+from pytorch_bigtable import (BigtableClient, InMemoryTable, row_set,
+                              row_range)
+from torch.utils.data import DataLoader
+
+COLUMNS = ["fam1:b", "fam1:a", "fam1:x_2", "fam1:x_1", "fam2:c"]
+
+
+def _all_rows():
+  return row_set.from_rows_or_ranges(row_range.infinite())
+
+
+def _fill(table):
+  ten = torch.Tensor(list(range(50))).reshape(10, 5)
+  table.write_tensor(ten, COLUMNS,
+                     ["row" + str(i).rjust(3, "0") for i in range(10)])
+  return ten
+
+
+class InMemoryWildcardColumnsTest(unittest.TestCase):
+  def setUp(self):
+    self.table = InMemoryTable(rows_per_tablet=3)
+    self.ten = _fill(self.table)
+
+  def test_family_wildcard(self):
+    ds = self.table.read_rows(torch.float32, ["fam2:c", "fam1:*"],
+                              _all_rows())
+    self.assertEqual(ds.columns,
+                     ["fam2:c", "fam1:a", "fam1:b", "fam1:x_1", "fam1:x_2"])
+    output = torch.stack(list(ds))
+    self.assertTrue((output == self.ten[:, [4, 1, 0, 3, 2]]).all())
+
+  def test_prefix_wildcard(self):
+    ds = self.table.read_rows(torch.float32, ["fam1:x_*", "fam1:x_1"],
+                              _all_rows())
+    self.assertEqual(ds.columns, ["fam1:x_1", "fam1:x_2"])
+
+  def test_parallel_read(self):
+    ds = self.table.read_rows(torch.float32, ["fam1:*"], _all_rows())
+    output = sorted(DataLoader(ds, num_workers=2),
+                    key=lambda x: x[0, 0].item())
+    self.assertTrue((torch.cat(output) == self.ten[:, [1, 0, 3, 2]]).all())
+
+  def test_schema_row(self):
+    self.table.write_tensor(torch.ones(1, 1), ["fam1:new"], ["row005"])
+    ds = self.table.read_rows(torch.float32, ["fam1:*"], _all_rows(),
+                              schema_row_key="row005")
+    self.assertEqual(ds.columns,
+                     ["fam1:a", "fam1:b", "fam1:new", "fam1:x_1", "fam1:x_2"])
+    ds = self.table.read_rows(torch.float32, ["fam1:*"], _all_rows(),
+                              discovery_rows=2)
+    self.assertEqual(ds.columns, ["fam1:a", "fam1:b", "fam1:x_1", "fam1:x_2"])
+
+  def test_no_match(self):
+    self.assertRaises(ValueError, self.table.read_rows, torch.float32,
+                      ["fam3:*"], _all_rows())
+
+
+class BigtableWildcardColumnsTest(unittest.TestCase):
+  def setUp(self):
+    self.emulator = BigtableEmulator()
+
+  def tearDown(self):
+    self.emulator.stop()
+
+  def test_read(self):
+    os.environ["BIGTABLE_EMULATOR_HOST"] = self.emulator.get_addr()
+    self.emulator.create_table("fake_project", "fake_instance", "test-table",
+                               ["fam1", "fam2"])
+    client = BigtableClient("fake_project", "fake_instance",
+                            endpoint=self.emulator.get_addr())
+    table = client.get_table("test-table")
+    ten = _fill(table)
+
+    ds = table.read_rows(torch.float32, ["fam1:x_*", "fam2:*"], _all_rows(),
+                         discovery_rows=1)
+    self.assertEqual(ds.columns, ["fam1:x_1", "fam1:x_2", "fam2:c"])
+    output = torch.stack(list(ds))
+    self.assertTrue((output == ten[:, [3, 2, 4]]).all())
+
+    ds = table.read_rows(torch.float32, ["fam1:*"], _all_rows(),
+                         schema_row_key="row003")
+    self.assertEqual(ds.columns, ["fam1:a", "fam1:b", "fam1:x_1", "fam1:x_2"])
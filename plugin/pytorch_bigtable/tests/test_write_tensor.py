@@ -136,3 +136,31 @@ class BigtableWriteTest(unittest.TestCase):
     results = sorted(results, key=lambda x: x[0, 0].item())
     result = torch.cat(results)
     self.assertTrue((result.nan_to_num(0) == ten.nan_to_num(0)).all().item())
+
+  def test_write_parallel(self):
+    os.environ["BIGTABLE_EMULATOR_HOST"] = self.emulator.get_addr()
+    self.emulator.create_table("fake_project", "fake_instance", "test-table",
+                               ["fam1", "fam2"], splits=["row050", "row120"])
+
+    ten = torch.Tensor(list(range(400))).reshape(200, 2)
+
+    client = BigtableClient("fake_project", "fake_instance",
+                            endpoint=self.emulator.get_addr())
+    table = client.get_table("test-table")
+
+    # Rows in reverse key order, so that they have to be sorted.
+    row_keys_list = ["row" + str(199 - i).rjust(3, "0") for i in range(200)]
+    table.write_tensor(ten, ["fam1:col1", "fam2:col2"], row_keys_list,
+                       parallel=True, concurrency=3, rows_per_request=7)
+
+    result = torch.stack(list(
+      table.read_rows(torch.float32, ["fam1:col1", "fam2:col2"],
+                      row_set.from_rows_or_ranges(row_range.infinite()))))
+    self.assertTrue((result == ten.flip(0)).all().item())
+
+    self.assertRaises(ValueError, table.write_tensor, ten,
+                      ["fam1:col1", "fam2:col2"], row_keys_list,
+                      parallel=True, concurrency=0)
+    self.assertRaises(RuntimeError, table.write_tensor, ten,
+                      ["fam3:col1", "fam3:col2"], row_keys_list,
+                      parallel=True)
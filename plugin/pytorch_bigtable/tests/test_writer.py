@@ -0,0 +1,104 @@
+# Copyright 2021 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# disable module docstring for tests
+# pylint: disable=C0114
+# disable class docstring for tests
+# pylint: disable=C0115
+import time
+import unittest
+import torch
+import os
+from .bigtable_emulator import BigtableEmulator
+from .helpers import row_keys
+from pytorch_bigtable import BigtableClient, row_set, row_range
+
+
+class BigtableWriterTest(unittest.TestCase):
+  def setUp(self):
+    self.emulator = BigtableEmulator()
+    os.environ["BIGTABLE_EMULATOR_HOST"] = self.emulator.get_addr()
+    self.emulator.create_table("fake_project", "fake_instance", "test-table",
+                               ["fam1", "fam2"])
+    client = BigtableClient("fake_project", "fake_instance",
+                            endpoint=self.emulator.get_addr())
+    self.table = client.get_table("test-table")
+
+  def tearDown(self):
+    self.emulator.stop()
+
+  def read_all(self):
+    ds = self.table.read_rows(torch.float32, ["fam1:col1", "fam2:col2"],
+                              row_set.from_rows_or_ranges(row_range.infinite()))
+    rows = list(ds)
+    return torch.stack(rows) if rows else torch.zeros(0, 2)
+
+  def test_write(self):
+    ten = torch.Tensor(list(range(500))).reshape(250, 2)
+    with self.table.writer(["fam1:col1", "fam2:col2"], max_rows=16,
+                           max_bytes=1000, concurrency=2) as writer:
+      writer.append(ten[:100], row_keys(100))
+      writer.append(ten[100:200].t().contiguous().t(),
+                    row_keys(range(100, 200)))
+      writer.append(ten[200:],
+                    lambda tensor, i: "row" + str(200 + i).rjust(4, "0"))
+      writer.flush()
+      self.assertEqual(writer.rows_written, 250)
+
+    self.assertTrue((self.read_all() == ten).all())
+
+  def test_flush_interval(self):
+    ten = torch.Tensor([[1, 2], [3, 4]])
+    with self.table.writer(["fam1:col1", "fam2:col2"],
+                           flush_interval=0.01) as writer:
+      writer.append(ten, row_keys(2))
+      deadline = time.monotonic() + 10
+      while writer.rows_written < 2 and time.monotonic() < deadline:
+        time.sleep(0.01)
+      self.assertEqual(writer.rows_written, 2)
+      self.assertTrue((self.read_all() == ten).all())
+
+  def test_errors(self):
+    writer = self.table.writer(["fam3:col1"], flush_interval=None)
+    writer.append(torch.ones(3, 1), row_keys(3))
+    self.assertRaises(RuntimeError, writer.flush)
+    # The error is only raised once.
+    writer.close()
+    self.assertEqual(writer.rows_written, 0)
+    self.assertRaises(RuntimeError, writer.append, torch.ones(1, 1),
+                      ["row0000"])
+
+  def test_exit_with_exception(self):
+    with self.assertRaises(KeyError):
+      with self.table.writer(["fam3:col1"], flush_interval=None) as writer:
+        writer.append(torch.ones(3, 1), row_keys(3))
+        raise KeyError("row0000")
+    self.assertRaises(RuntimeError, writer.append, torch.ones(1, 1),
+                      ["row0000"])
+
+    with self.assertRaises(RuntimeError):
+      with self.table.writer(["fam3:col1"], flush_interval=None) as writer:
+        writer.append(torch.ones(3, 1), row_keys(3))
+
+  def test_arguments(self):
+    self.assertRaises(ValueError, self.table.writer, ["col1"])
+    self.assertRaises(ValueError, self.table.writer, ["fam1:col1"],
+                      max_rows=0)
+    self.assertRaises(ValueError, self.table.writer, ["fam1:col1"],
+                      flush_interval=0)
+    with self.table.writer(["fam1:col1", "fam2:col2"]) as writer:
+      self.assertRaises(ValueError, writer.append, torch.ones(2, 3),
+                        row_keys(2))
+      self.assertRaises(ValueError, writer.append, torch.ones(2, 2),
+                        row_keys(1))
@@ -0,0 +1,108 @@
+# Copyright 2021 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Module implementing an opt-in tracer of reads and writes.
+
+The spans are exported in the Chrome trace event format, so they can be
+viewed in chrome://tracing or Perfetto next to a PyTorch profiler trace.
+"""
+import glob
+import json
+import os
+import uuid
+from . import pbt_C
+
+# Workers started with the spawn method inherit the environment, but not the
+# state of the tracer, so it's stored in environment variables.
+TRACE_DIR_ENV_VAR = "PYTORCH_BIGTABLE_TRACE_DIR"
+TRACE_RUN_ENV_VAR = "PYTORCH_BIGTABLE_TRACE_RUN"
+
+# Identifies the trace files written since the last `enable`, so that
+# `merge` skips the ones left in the directory by earlier runs.
+_run_id = None
+
+
+def enable(trace_dir: str) -> None:
+  """Starts recording spans in this process and in DataLoader workers
+  started afterwards.
+
+  Each worker writes its spans to a file in `trace_dir` when it finishes
+  reading its share of rows. The names of the files start with an id of
+  this call, so `merge` only picks up the files of this run.
+
+  Args:
+    trace_dir (str): directory where the workers store their traces.
+  """
+  global _run_id
+  _run_id = uuid.uuid4().hex[:12]
+  os.makedirs(trace_dir, exist_ok=True)
+  os.environ[TRACE_DIR_ENV_VAR] = trace_dir
+  os.environ[TRACE_RUN_ENV_VAR] = _run_id
+  pbt_C._tracer_enable(trace_dir, run_id=_run_id)
+
+
+def disable() -> None:
+  """Stops recording spans."""
+  os.environ.pop(TRACE_DIR_ENV_VAR, None)
+  os.environ.pop(TRACE_RUN_ENV_VAR, None)
+  pbt_C._tracer_disable()
+
+
+def is_enabled() -> bool:
+  """Returns whether spans are being recorded in this process."""
+  return pbt_C._tracer_enabled()
+
+
+def export(path: str) -> None:
+  """Writes the spans recorded so far in this process to a file.
+
+  Args:
+    path (str): the file to write in Chrome trace format.
+  """
+  pbt_C._tracer_export(path)
+
+
+def merge(output_path: str, trace_dir: str = None) -> None:
+  """Merges the traces of this process and of all the workers since the
+  last `enable` into a single file.
+
+  Args:
+    output_path (str): the file to write in Chrome trace format.
+    trace_dir (str): directory with the workers' traces. Defaults to the one
+      passed to `enable`.
+  """
+  trace_dir = trace_dir or os.environ.get(TRACE_DIR_ENV_VAR)
+  if trace_dir is None:
+    raise ValueError("`trace_dir` must be provided if tracing is not enabled")
+  if _run_id is None:
+    raise ValueError("Tracing was never enabled in this process")
+  prefix = f"pytorch_bigtable-{_run_id}-"
+  if is_enabled():
+    export(os.path.join(trace_dir, f"{prefix}{os.getpid()}.json"))
+
+  events = []
+  for path in sorted(glob.glob(os.path.join(trace_dir, f"{prefix}*.json"))):
+    if os.path.abspath(path) == os.path.abspath(output_path):
+      continue
+    with open(path, "r", encoding="UTF-8") as f:
+      events.extend(json.load(f)["traceEvents"])
+  with open(output_path, "w", encoding="UTF-8") as f:
+    json.dump({"traceEvents": events}, f)
+
+
+def _setup_worker(worker_id: int) -> None:
+  trace_dir = os.environ.get(TRACE_DIR_ENV_VAR)
+  if trace_dir is not None:
+    pbt_C._tracer_enable(trace_dir, worker_id,
+                         os.environ.get(TRACE_RUN_ENV_VAR, ""))